@@ -1,17 +1,108 @@
 import os
+import threading
+from importlib import import_module
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_wtf import CSRFProtect
 from flask_mail import Mail
 from dotenv import load_dotenv
+from app.limits import AdmissionControl
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-migrate = Migrate()
+migrate = None  # Created in create_app, see _init_migrate
 csrf = CSRFProtect()
 mail = Mail()
+admission = AdmissionControl()
+
+def _init_migrate(app):
+    """Set up Flask-Migrate, which pulls in Alembic.
+
+    With LAZY_IMPORTS on, this only happens for the ``flask`` CLI (``flask db
+    ...``); web workers never need Alembic.
+    """
+    global migrate
+    if app.config.get('LAZY_IMPORTS') and not os.environ.get('FLASK_RUN_FROM_CLI'):
+        return
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
+
+# (module, blueprint) for every route module. Importing them also registers
+# the ORM listeners of the modules they use (app.sync, app.wishlist, ...)
+BLUEPRINTS = (
+    ('app.routes.auth', 'auth_bp'),
+    ('app.routes.books', 'books_bp'),
+    ('app.routes.exchanges', 'exchanges_bp'),
+    ('app.routes.transactions', 'transactions_bp'),
+    ('app.routes.messages', 'messages_bp'),
+    ('app.routes.profile', 'profile_bp'),
+    ('app.routes.api', 'api_bp'),
+    ('app.routes.uploads', 'uploads_bp'),
+    ('app.routes.analytics', 'analytics_bp'),
+)
+
+# (module, command) for every CLI command group
+CLI_COMMANDS = (
+    ('app.archive', 'archive_cli'),
+    ('app.ledger', 'ledger_cli'),
+    ('app.rollups', 'rollups_cli'),
+    ('app.provisioning', 'users_cli'),
+    ('app.dbcopy', 'dbcopy_cli'),
+    ('app.benchmarks', 'bench_cli'),
+    ('app.wishlist', 'wishlist_cli'),
+    ('app.sweeper', 'uploads_cli'),
+    ('app.sync', 'sync_cli'),
+    ('app.idempotency', 'idempotency_cli'),
+    ('app.assets', 'assets_cli'),
+    ('app.templating', 'templates_cli'),
+    ('app.startup', 'startup_profile_command'),
+)
+
+_routes_lock = threading.Lock()
+
+def load_routes(app):
+    """Import the route modules and register their blueprints, once."""
+    with _routes_lock:
+        if app.extensions.get('routes_loaded'):
+            return
+        for module, name in BLUEPRINTS:
+            app.register_blueprint(getattr(import_module(module), name))
+        # The user loader lives with the models
+        import_module('app.models')
+        app.extensions['routes_loaded'] = True
+
+class _LoadRoutes:
+    """WSGI wrapper that loads the routes just before the first request reaches Flask."""
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not self.app.extensions.get('routes_loaded'):
+            load_routes(self.app)
+        return self.wsgi_app(environ, start_response)
+
+def _init_routes(app):
+    """Register the blueprints, or defer them to the first request.
+
+    With LAZY_IMPORTS on, a server boot skips the route modules (forms,
+    models, ledger, ...) until a request needs them; ``prepare_for_fork``
+    loads them in the master instead. The ``flask`` CLI always loads them
+    so ``url_for`` and ``flask routes`` work.
+    """
+    if app.config.get('LAZY_IMPORTS') and not os.environ.get('FLASK_RUN_FROM_CLI'):
+        app.wsgi_app = _LoadRoutes(app, app.wsgi_app)
+        return
+    load_routes(app)
+
+def _init_cli(app):
+    """Add the CLI commands; a server boot never imports their modules."""
+    if app.config.get('LAZY_IMPORTS') and not os.environ.get('FLASK_RUN_FROM_CLI'):
+        return
+    for module, name in CLI_COMMANDS:
+        app.cli.add_command(getattr(import_module(module), name))
 
 def create_app():
     # Load environment variables
@@ -23,33 +114,52 @@ def create_app():
     app.config.from_object('config.Config')
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
 
+    # Jinja bytecode cache (must be set before anything touches app.jinja_env)
+    from app.templating import init_template_cache, log_warmup
+    init_template_cache(app)
+
     # Initialize Extensions
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    _init_migrate(app)
     csrf.init_app(app)
     mail.init_app(app)
+    admission.init_app(app)
 
     # Set the login view for @login_required
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
 
-    # Import and Register Blueprints
-    from app.routes.auth import auth_bp
-    from app.routes.books import books_bp
-    from app.routes.exchanges import exchanges_bp
-    from app.routes.transactions import transactions_bp
-    from app.routes.messages import messages_bp
-    from app.routes.profile import profile_bp
-
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(books_bp)
-    app.register_blueprint(exchanges_bp)
-    app.register_blueprint(transactions_bp)
-    app.register_blueprint(messages_bp)
-    app.register_blueprint(profile_bp)
+    # Register Blueprints
+    _init_routes(app)
+
+    # Take the client address from the trusted reverse proxies (rate limits key on it)
+    if app.config.get('TRUSTED_PROXIES'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+    # Compress responses as they stream out
+    if app.config.get('COMPRESS_RESPONSES'):
+        from app.streaming import CompressionMiddleware
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+    # Upload storage backend
+    from app.storage import init_storage
+    init_storage(app)
+
+    # Fingerprinted static assets
+    from app.assets import init_assets
+    init_assets(app)
+
+    # CLI Commands
+    _init_cli(app)
 
     # Error Handlers
+    @app.errorhandler(403)
+    def forbidden_error(error):
+        return render_template('errors/403.html'), 403
+
     @app.errorhandler(404)
     def not_found_error(error):
         return render_template('errors/404.html'), 404
@@ -59,4 +169,16 @@ def create_app():
         db.session.rollback()
         return render_template('errors/500.html'), 500
 
+    # Build the in-memory search indexes so the first lookup doesn't pay for it
+    if app.config.get('AUTOCOMPLETE_PRELOAD'):
+        from app.autocomplete import preload
+        preload(app)
+    if app.config.get('FACETS_PRELOAD'):
+        from app.facets import preload as preload_facets
+        preload_facets(app)
+
+    # Compile every template now instead of on each worker's first requests
+    if app.config.get('TEMPLATE_WARMUP'):
+        log_warmup(app)
+
     return app
@@ -0,0 +1,144 @@
+# app/archive.py
+"""Hot/cold tiering for the ``message`` and ``exchange_request`` tables.
+
+Old messages and finished exchange requests are moved into their archive
+tables in small batches. Each batch is copied and deleted inside one
+transaction, so an interrupted run simply picks up where it stopped the next
+time ``flask archive run`` is invoked (e.g. from cron).
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import literal, select
+
+from app import db
+from app.models import (
+    ExchangeRequest,
+    ExchangeRequestArchive,
+    Message,
+    MessageArchive,
+)
+
+archive_cli = AppGroup('archive', help='Move cold rows into the archive tables.')
+
+
+def _move_batch(model, archive_model, criteria, batch_size):
+    """Move one batch of rows matching ``criteria`` into ``archive_model``."""
+    ids = [row.id for row in db.session.query(model.id)
+           .filter(*criteria)
+           .order_by(model.id)
+           .limit(batch_size)]
+    if not ids:
+        return 0
+
+    table = model.__table__
+    archive_table = archive_model.__table__
+    columns = [column.name for column in table.columns]
+    rows = select(*[table.c[name] for name in columns], literal(datetime.utcnow()))
+    db.session.execute(
+        archive_table.insert().from_select(columns + ['archived_at'], rows.where(table.c.id.in_(ids)))
+    )
+    db.session.execute(table.delete().where(table.c.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def _move_all(model, archive_model, criteria, batch_size, max_batches=None):
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = _move_batch(model, archive_model, criteria, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+    return moved
+
+
+def archive_messages(older_than, batch_size=None, max_batches=None):
+    """Archive messages sent before ``older_than``. Returns the number moved."""
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    criteria = [Message.timestamp < older_than]
+    return _move_all(Message, MessageArchive, criteria, batch_size, max_batches)
+
+
+def archive_exchange_requests(older_than, batch_size=None, max_batches=None):
+    """Archive terminal exchange requests created before ``older_than``.
+
+    The exchange event log (app.ledger) keeps their history, so archiving
+    doesn't lose any transaction records.
+    """
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    criteria = [
+        ExchangeRequest.status.in_(current_app.config['ARCHIVE_EXCHANGE_STATUSES']),
+        ExchangeRequest.timestamp < older_than,
+    ]
+    return _move_all(ExchangeRequest, ExchangeRequestArchive, criteria, batch_size, max_batches)
+
+
+def run_archival(now=None, batch_size=None, max_batches=None):
+    """Archive everything past the configured thresholds."""
+    now = now or datetime.utcnow()
+    config = current_app.config
+    return {
+        'messages': archive_messages(
+            now - timedelta(days=config['ARCHIVE_MESSAGES_AFTER_DAYS']), batch_size, max_batches),
+        'exchange_requests': archive_exchange_requests(
+            now - timedelta(days=config['ARCHIVE_EXCHANGES_AFTER_DAYS']), batch_size, max_batches),
+    }
+
+
+class ArchivePagination:
+    """Minimal pagination object for a hot query followed by its archive."""
+
+    def __init__(self, page, items, has_next):
+        self.page = page
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = page > 1
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if has_next else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def paginate_with_archive(hot_query, archive_query, page, per_page):
+    """Paginate ``hot_query``, continuing into ``archive_query`` past its end.
+
+    The archive is only queried once the requested page runs past the rows
+    still in the hot table.
+
+    The combined list is only in strict timestamp order when every archived
+    row is older than every hot one. That holds for messages, which are
+    archived purely by age. Exchange requests are archived only once
+    finished, so an old pending or accepted request stays hot and is listed
+    ahead of newer archived ones. The exchange lists accept this: the open
+    requests a user can still act on come first, then the finished history.
+    """
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+    items = hot_query.offset(offset).limit(per_page + 1).all()
+    if len(items) > per_page:
+        return ArchivePagination(page, items[:per_page], True)
+
+    archive_offset = 0 if items else offset - hot_query.order_by(None).count()
+    remaining = per_page - len(items)
+    older = archive_query.offset(archive_offset).limit(remaining + 1).all()
+    return ArchivePagination(page, items + older[:remaining], len(older) > remaining)
+
+
+@archive_cli.command('run')
+@click.option('--batch-size', type=int, default=None, help='Rows moved per transaction.')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches per table.')
+def run_command(batch_size, max_batches):
+    """Archive old messages and finished exchange requests."""
+    moved = run_archival(batch_size=batch_size, max_batches=max_batches)
+    click.echo(f"Archived {moved['messages']} messages and "
+               f"{moved['exchange_requests']} exchange requests.")
@@ -0,0 +1,181 @@
+# app/assets.py
+"""Static asset pipeline.
+
+``flask assets build`` copies the CSS, JS and image files under
+``app/static`` into ``app/static/dist`` with a content hash in their names,
+minifies CSS/JS, writes gzip (and, when the ``brotli`` package is installed,
+brotli) variants next to them and records everything in ``manifest.json``.
+
+At runtime ``url_for('static', filename='css/styles.css')`` is rewritten to
+the fingerprinted file from the manifest, and ``/static/dist/...`` is served
+with the best precompressed variant the client accepts plus
+``Cache-Control: immutable``.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory, abort
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional
+    brotli = None
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_DIRS = ('css', 'js', 'images')
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def _strip_comments(source, line_comments):
+    """Remove /* */ (and optionally leading //) comments, leaving strings intact."""
+    out = []
+    i = 0
+    length = len(source)
+    quote = None
+    while i < length:
+        char = source[i]
+        if quote:
+            out.append(char)
+            if char == '\\' and i + 1 < length:
+                out.append(source[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'`':
+            quote = char
+            out.append(char)
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        elif line_comments and source.startswith('//', i) and \
+                source[source.rfind('\n', 0, i) + 1:i].strip() == '':
+            end = source.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def minify_css(source):
+    source = _strip_comments(source, line_comments=False)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    # A space before ':' is a descendant combinator in selectors ("div :first-child"),
+    # so it is only dropped after a property name, i.e. when a ';' or '}' follows first
+    source = re.sub(r':\s+', ':', source)
+    source = re.sub(r'([{;][-\w]+) :(?=[^{}]*[;}])', r'\1:', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """Conservative JS minifier: drops comments, indentation and blank lines."""
+    source = _strip_comments(source, line_comments=True)
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _write_variants(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    if path.endswith(COMPRESSIBLE):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_folder):
+    """Build ``static/dist`` and its manifest. Returns the manifest dict."""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for asset_dir in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, asset_dir)):
+            for name in sorted(files):
+                source_path = os.path.join(root, name)
+                logical = os.path.relpath(source_path, static_folder).replace(os.sep, '/')
+                with open(source_path, 'rb') as f:
+                    data = f.read()
+                if name.endswith('.css'):
+                    data = minify_css(data.decode('utf-8')).encode('utf-8')
+                elif name.endswith('.js'):
+                    data = minify_js(data.decode('utf-8')).encode('utf-8')
+
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                stem, ext = os.path.splitext(logical)
+                hashed = f"{DIST_DIR}/{stem}.{digest}{ext}"
+                target = os.path.join(static_folder, *hashed.split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _write_variants(target, data)
+                manifest[logical] = hashed
+
+    os.makedirs(dist_folder, exist_ok=True)
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted asset, preferring a precompressed variant."""
+    dist_folder = os.path.join(current_app.static_folder, DIST_DIR)
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(dist_folder, filename + suffix)):
+            response = send_from_directory(dist_folder, filename + suffix, max_age=ONE_YEAR)
+            response.headers['Content-Encoding'] = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            break
+    else:
+        if not os.path.isfile(os.path.join(dist_folder, filename)):
+            abort(404)
+        response = send_from_directory(dist_folder, filename, max_age=ONE_YEAR)
+    response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    """Rewrite static URLs through the manifest and serve ``/static/dist``."""
+    manifest = load_manifest(app.static_folder) if app.config.get('ASSETS_USE_MANIFEST') else {}
+    app.extensions['assets_manifest'] = manifest
+
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'assets', serve_asset)
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            hashed = app.extensions['assets_manifest'].get(values['filename'])
+            if hashed:
+                values['filename'] = hashed
+
+
+@assets_cli.command('build')
+def build_command():
+    """Fingerprint, minify and precompress static assets."""
+    manifest = build_assets(current_app.static_folder)
+    current_app.extensions['assets_manifest'] = manifest
+    if brotli is None:
+        click.echo('brotli is not installed; only gzip variants were written.')
+    click.echo(f"Built {len(manifest)} assets into {os.path.join(current_app.static_folder, DIST_DIR)}.")
@@ -0,0 +1,148 @@
+# app/autocomplete.py
+"""In-memory prefix index behind the book search typeahead.
+
+For each searchable ``Book`` column the index keeps a sorted array of
+lower-cased keys. Every word of a value starts a key ("the hobbit" is found
+by "the" and by "hob"), so a lookup is two bisects plus a top-k pick by
+popularity, the number of books carrying that value. The database is never
+touched on a lookup.
+
+The index is built from the ``book`` table on first use, kept current from
+SQLAlchemy events for writes made by this process, and rebuilt every
+``AUTOCOMPLETE_REFRESH_SECONDS`` so it also picks up other workers' writes.
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.events import on_commit
+from app.lookups import LOOKUP_FIELDS, resolve, tracked_columns
+from app.models import Book
+
+FIELDS = ('title', 'author', 'genre', 'location')
+TRACKED_COLUMNS = tracked_columns(FIELDS)
+
+
+def normalize(value):
+    return ' '.join(value.lower().split())
+
+
+def _word_suffixes(norm):
+    words = norm.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Sorted ``(key, value)`` array with per-value display text and weight."""
+
+    def __init__(self):
+        self._keys = []
+        self._values = {}  # normalized value -> [display, weight]
+
+    def add(self, value, weight=1):
+        norm = normalize(value)
+        if not norm:
+            return
+        entry = self._values.get(norm)
+        if entry is None:
+            self._values[norm] = [value.strip(), weight]
+            for key in _word_suffixes(norm):
+                insort(self._keys, (key, norm))
+        else:
+            entry[1] += weight
+
+    def remove(self, value):
+        norm = normalize(value)
+        entry = self._values.get(norm)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._values[norm]
+            for key in _word_suffixes(norm):
+                position = bisect_left(self._keys, (key, norm))
+                if position < len(self._keys) and self._keys[position] == (key, norm):
+                    del self._keys[position]
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_right(self._keys, (prefix + '\uffff',))
+        matches = {norm for _, norm in self._keys[start:end]}
+        top = heapq.nsmallest(limit, matches, key=lambda norm: (-self._values[norm][1], norm))
+        return [{'value': self._values[norm][0], 'count': self._values[norm][1]} for norm in top]
+
+
+class Autocomplete:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = None
+        self._built_at = 0.0
+
+    def build(self):
+        """(Re)build every field index from the ``book`` table."""
+        indexes = {field: PrefixIndex() for field in FIELDS}
+        for field, column_name in zip(FIELDS, TRACKED_COLUMNS):
+            column = getattr(Book, column_name)
+            for value, count in db.session.query(column, func.count()).group_by(column):
+                if field in LOOKUP_FIELDS:
+                    value = LOOKUP_FIELDS[field][1].name(value)
+                if value:
+                    indexes[field].add(value, count)
+        with self._lock:
+            self._indexes = indexes
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        refresh = current_app.config.get('AUTOCOMPLETE_REFRESH_SECONDS')
+        stale = refresh and time.monotonic() - self._built_at > refresh
+        if self._indexes is None or stale:
+            self.build()
+
+    def suggest(self, field, prefix, limit=10):
+        self._ensure_fresh()
+        with self._lock:
+            return self._indexes[field].search(prefix, limit)
+
+    def apply(self, changes):
+        """Apply committed Book changes (see app.events)."""
+        with self._lock:
+            if self._indexes is None:
+                return
+            for change in changes:
+                old_values = resolve(FIELDS, change.old, cached=True) if change.old else {}
+                new_values = resolve(FIELDS, change.new, cached=True) if change.new else {}
+                for field in FIELDS:
+                    old = old_values.get(field)
+                    new = new_values.get(field)
+                    if old == new:
+                        continue
+                    if old:
+                        self._indexes[field].remove(old)
+                    if new:
+                        self._indexes[field].add(new)
+
+
+autocomplete = Autocomplete()
+
+
+on_commit(Book, TRACKED_COLUMNS, autocomplete.apply)
+
+
+def preload(app):
+    """Build the index at startup; a missing table just defers it to first use."""
+    with app.app_context():
+        try:
+            autocomplete.build()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.warning('Autocomplete index not built at startup; will build on first use.')
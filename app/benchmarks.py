@@ -0,0 +1,198 @@
+# app/benchmarks.py
+"""Memory and CPU benchmarks for the per-user list pages.
+
+``flask bench collections`` compares what a request for a heavy user used to
+load against what it loads now:
+
+* **before**: every collection read in full, as the old ``lazy=True`` list
+  relationships did the first time a template or view touched them;
+* **after**: the first page of each collection plus a ``COUNT(*)`` per
+  collection, as ``User.page()`` and ``User.count()`` do.
+
+For each user it reports the ORM objects left in the session's identity map
+and the peak memory allocated (``tracemalloc``). ``--seed`` adds synthetic
+rows for the user first, inside a transaction that is rolled back at the end.
+
+``flask bench projections`` loads the rows behind My Books, the inbox, sent
+messages and the exchange request lists twice: once as ORM instances, as
+those views used to, and once through the column projections of
+app.projections. It reports CPU time, peak memory and the number of
+allocated blocks still alive at the peak.
+"""
+
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from app import db, projections
+from app.models import Book, ExchangeRequest, Message, User
+
+bench_cli = AppGroup('bench', help='Run memory and performance benchmarks.')
+
+
+def _heaviest_users(limit):
+    """Ids of the users owning the most books, messages and requests."""
+    activity = {}
+    for column in (Book.user_id, Message.sender_id, Message.receiver_id,
+                   ExchangeRequest.sender_id, ExchangeRequest.receiver_id):
+        for user_id, total in db.session.query(column, func.count()).group_by(column):
+            activity[user_id] = activity.get(user_id, 0) + total
+    return sorted(activity, key=activity.get, reverse=True)[:limit]
+
+
+def _seed(user, rows):
+    """Give ``user`` ``rows`` books, messages and requests each, against another user."""
+    other = User.query.filter(User.id != user.id).first()
+    if other is None:
+        other = User(username='bench-peer', email='bench-peer@example.invalid', password_hash='!')
+        db.session.add(other)
+        db.session.flush()
+    start = datetime.utcnow() - timedelta(minutes=rows)
+    books = [Book(title=f'Benchmark {n}', author='Benchmark', genre='Benchmark', condition='Good',
+                  availability_status='available', location='Nowhere', user_id=user.id,
+                  date_posted=start + timedelta(minutes=n)) for n in range(rows)]
+    db.session.add_all(books)
+    db.session.flush()
+    for n, book in enumerate(books):
+        moment = start + timedelta(minutes=n)
+        db.session.add(Message(sender_id=user.id, receiver_id=other.id, content='benchmark', timestamp=moment))
+        db.session.add(Message(sender_id=other.id, receiver_id=user.id, content='benchmark', timestamp=moment))
+        db.session.add(ExchangeRequest(sender_id=other.id, receiver_id=user.id, book_id=book.id,
+                                       delivery_method='Pickup', exchange_duration='1 week',
+                                       timestamp=moment))
+    db.session.flush()
+
+
+def _load_all(user):
+    return [db.session.scalars(user.collection_query(name)).all() for name in User.COLLECTION_ORDER]
+
+
+def _load_page(user, per_page):
+    pages = [user.page(name, per_page=per_page).items for name in User.COLLECTION_ORDER]
+    return pages, user.counts()
+
+
+def _measure(user_id, load, *args):
+    """``(objects in the identity map, peak KiB, milliseconds)`` for one simulated request."""
+    db.session.expunge_all()
+    tracemalloc.start()
+    started = time.perf_counter()
+    user = db.session.get(User, user_id)
+    loaded = load(user, *args)  # Held, as a view holds them until the response is rendered
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len(db.session.identity_map)
+    del loaded
+    db.session.expunge_all()
+    return objects, peak / 1024, elapsed
+
+
+@bench_cli.command('collections')
+@click.option('--user', 'usernames', multiple=True, help='Benchmark this user (repeatable).')
+@click.option('--top', type=int, default=3, help='Otherwise, benchmark the N most active users.')
+@click.option('--seed', type=int, default=0, help='First add N synthetic rows per collection (rolled back).')
+@click.option('--per-page', type=int, default=20, help='Page size for the paginated reads.')
+def collections_command(usernames, top, seed, per_page):
+    """Objects and memory per request: full collections vs. a page plus counts."""
+    if usernames:
+        user_ids = [user.id for user in User.query.filter(User.username.in_(usernames))]
+    else:
+        user_ids = _heaviest_users(top) or [user.id for user in User.query.limit(top)]
+    if not user_ids:
+        raise click.ClickException('No users to benchmark.')
+    try:
+        if seed:
+            for user_id in user_ids:
+                _seed(db.session.get(User, user_id), seed)
+        click.echo(f"{'user':<20} {'rows':>8} {'before obj':>11} {'KiB':>9} {'ms':>8} "
+                   f"{'after obj':>10} {'KiB':>9} {'ms':>8}")
+        for user_id in user_ids:
+            user = db.session.get(User, user_id)
+            username, rows = user.username, sum(user.counts().values())
+            before = _measure(user_id, _load_all)
+            after = _measure(user_id, _load_page, per_page)
+            click.echo(f"{username:<20} {rows:>8} {before[0]:>11} {before[1]:>9.0f} {before[2]:>8.1f} "
+                       f"{after[0]:>10} {after[1]:>9.0f} {after[2]:>8.1f}")
+    finally:
+        db.session.rollback()
+
+
+def _orm_lists(user_id, limit):
+    """What the list views loaded before projections, touching what the templates read."""
+    books = Book.query.filter_by(user_id=user_id).order_by(Book.date_posted.desc()).limit(limit).all()
+    for book in books:
+        book.author, book.genre
+    inbox = Message.query.filter_by(receiver_id=user_id).options(joinedload(Message.sender)) \
+        .order_by(Message.timestamp.desc()).limit(limit).all()
+    sent = Message.query.filter_by(sender_id=user_id).options(joinedload(Message.receiver)) \
+        .order_by(Message.timestamp.desc()).limit(limit).all()
+    for message in inbox:
+        message.sender.username
+    for message in sent:
+        message.receiver.username
+    requests = ExchangeRequest.query.filter_by(receiver_id=user_id) \
+        .options(joinedload(ExchangeRequest.book), joinedload(ExchangeRequest.sender)) \
+        .order_by(ExchangeRequest.timestamp.desc()).limit(limit).all()
+    for exchange_request in requests:
+        exchange_request.book.title, exchange_request.sender.username
+    return books, inbox, sent, requests
+
+
+def _projected_lists(user_id, limit):
+    return (projections.books_owned_by(user_id).limit(limit).all(),
+            projections.messages_received(user_id).limit(limit).all(),
+            projections.messages_sent(user_id).limit(limit).all(),
+            projections.exchange_requests(receiver_id=user_id).limit(limit).all())
+
+
+def _profile(load, user_id, limit, repeat):
+    """Best of ``repeat`` runs: ``(CPU ms, peak KiB, live blocks at peak, rows)``."""
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        gc.collect()
+        tracemalloc.start()
+        started = time.process_time()
+        lists = load(user_id, limit)
+        cpu = (time.process_time() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.stop()
+        result = (cpu, peak / 1024, blocks, sum(len(rows) for rows in lists))
+        del lists
+        best = result if best is None or result[0] < best[0] else best
+    db.session.expunge_all()
+    return best
+
+
+@bench_cli.command('projections')
+@click.option('--user', 'username', default=None, help='Benchmark this user (default: the most active).')
+@click.option('--seed', type=int, default=0, help='First add N synthetic rows per list (rolled back).')
+@click.option('--rows', type=int, default=1000, help='Rows loaded per list.')
+@click.option('--repeat', type=int, default=3, help='Runs per variant; the fastest is reported.')
+def projections_command(username, seed, rows, repeat):
+    """CPU and allocations per request: ORM instances vs. row projections."""
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        heaviest = _heaviest_users(1)
+        user = db.session.get(User, heaviest[0]) if heaviest else User.query.first()
+    if user is None:
+        raise click.ClickException('No user to benchmark.')
+    user_id = user.id
+    try:
+        if seed:
+            _seed(user, seed)
+        click.echo(f"{'variant':<12} {'rows':>7} {'CPU ms':>9} {'peak KiB':>10} {'blocks':>9}")
+        for name, load in (('orm', _orm_lists), ('projection', _projected_lists)):
+            cpu, peak, blocks, loaded = _profile(load, user_id, rows, repeat)
+            click.echo(f"{name:<12} {loaded:>7} {cpu:>9.1f} {peak:>10.0f} {blocks:>9}")
+    finally:
+        db.session.rollback()
@@ -0,0 +1,313 @@
+# app/dbcopy.py
+"""Copy the live database to PostgreSQL with only a short cutover.
+
+Run it while the site stays up::
+
+    DATABASE_URL=postgresql://... flask db upgrade      # create the schema
+    flask dbcopy copy postgresql://...                   # bulk copy
+    flask dbcopy catchup postgresql://...                # repeat while it finds changes
+    # stop the app (or make it read-only), then
+    flask dbcopy catchup postgresql://...                # final pass, usually seconds
+    flask dbcopy verify postgresql://...                 # counts and checksums
+    # point DATABASE_URL at PostgreSQL and start the app
+
+Every table (``user``, ``profile``, ``book``, ``exchange_request``,
+``message``, ``transaction`` and the tables added since) is streamed in
+primary-key order, ``DBCOPY_BATCH_SIZE`` rows at a time. Composite keys
+(``wish_term``) are ranged, upserted and deleted on the whole key tuple. Each batch's
+checksum is compared with the same key range on the target, where text
+keys are compared with ``COLLATE "C"`` so they sort as SQLite sorts them:
+
+* ranges missing from the target are loaded with ``COPY FROM STDIN``;
+* ranges that differ are copied into a staging table and upserted;
+* target rows that no longer exist in the source are deleted at the end.
+
+The first pass therefore copies everything. Later passes only move what was
+written or deleted since. Each batch commits on its own, so an interrupted
+pass can just be rerun. Sequences are then moved past the copied ids.
+"""
+
+import hashlib
+import io
+import json
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, func, inspect, select, text, tuple_
+
+from app import db
+
+dbcopy_cli = AppGroup('dbcopy', help='Copy this database to PostgreSQL.')
+
+
+def _normalize(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _digest(rows):
+    checksum = hashlib.sha1()
+    for row in rows:
+        checksum.update('\x1f'.join(_normalize(value) for value in row).encode())
+        checksum.update(b'\x1e')
+    return checksum.hexdigest()
+
+
+def _copy_value(value, is_json=False):
+    """Encode a value for COPY's text format."""
+    if value is None:
+        return '\\N'
+    if is_json:
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _range(key, low, high):
+    """``low < key <= high``; either bound may be None for open."""
+    criteria = []
+    if low is not None:
+        criteria.append(key > low)
+    if high is not None:
+        criteria.append(key <= high)
+    return criteria
+
+
+class TableCopier:
+    """Copies one table from the app's database to ``target`` (an Engine)."""
+
+    def __init__(self, table, target, batch_size):
+        self.table = table
+        self.target = target
+        self.batch_size = batch_size
+        self.pk_columns = list(table.primary_key.columns)
+        # The key compared, ranged and deleted on: the column, or a row value for composite keys
+        self.pk = self._key(self.pk_columns)
+        # The same on the target, with text keys in SQLite's (binary) order, not the database collation
+        self.target_pk_columns = [column.collate('C') if isinstance(column.type, db.String) else column
+                                  for column in self.pk_columns]
+        self.target_pk = self._key(self.target_pk_columns)
+        self._pk_positions = [list(table.columns).index(column) for column in self.pk_columns]
+        self._json = [isinstance(column.type, db.JSON) for column in table.columns]
+        preparer = target.dialect.identifier_preparer
+        self.quoted_table = preparer.format_table(table)
+        self.quoted_columns = ', '.join(preparer.quote(column.name) for column in table.columns)
+        self.quoted_pk = ', '.join(preparer.quote(column.name) for column in self.pk_columns)
+        self.stale_ids = []  # Target keys gone from the source, deleted after all tables are synced
+        self.copied = 0
+        self.upserted = 0
+        self.deleted = 0
+
+    @staticmethod
+    def _key(columns):
+        return tuple_(*columns) if len(columns) > 1 else columns[0]
+
+    def key_of(self, row):
+        """The primary key of a full ``row``: a value, or a tuple for composite keys."""
+        if len(self._pk_positions) == 1:
+            return row[self._pk_positions[0]]
+        return tuple(row[position] for position in self._pk_positions)
+
+    def max_key(self, connection):
+        """The largest key in the table reached through ``connection``, or None if it's empty."""
+        query = select(*self.pk_columns).order_by(*[column.desc() for column in self.pk_columns]).limit(1)
+        row = connection.execute(query).first()
+        if row is None:
+            return None
+        return row[0] if len(row) == 1 else tuple(row)
+
+    def _source_batches(self, bound):
+        """Yield ``(low, high, rows)`` over the source in key order, up to ``bound``."""
+        low = None
+        while True:
+            query = select(self.table).where(*_range(self.pk, low, bound)) \
+                .order_by(*self.pk_columns).limit(self.batch_size)
+            with db.engine.connect() as source:
+                rows = [tuple(row) for row in source.execute(query)]
+            if not rows:
+                return
+            high = self.key_of(rows[-1]) if len(rows) == self.batch_size else bound
+            yield low, high, rows
+            if high is None or high == bound:
+                return
+            low = high
+
+    def _target_rows(self, connection, low, high):
+        query = select(self.table).where(*_range(self.target_pk, low, high)).order_by(*self.target_pk_columns)
+        return [tuple(row) for row in connection.execute(query)]
+
+    def _copy_rows(self, connection, rows, table_name):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value, is_json) for value, is_json in zip(row, self._json)))
+            buffer.write('\n')
+        buffer.seek(0)
+        sql = f"COPY {table_name} ({self.quoted_columns}) FROM STDIN"
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            if hasattr(cursor, 'copy_expert'):  # psycopg2
+                cursor.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+
+    def _upsert(self, connection, rows):
+        connection.execute(text(
+            f"CREATE TEMP TABLE dbcopy_stage (LIKE {self.quoted_table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+        self._copy_rows(connection, rows, 'dbcopy_stage')
+        key_names = self.quoted_pk.split(', ')
+        updates = ', '.join(f"{name} = EXCLUDED.{name}" for name in self.quoted_columns.split(', ')
+                            if name not in key_names)
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        connection.execute(text(
+            f"INSERT INTO {self.quoted_table} ({self.quoted_columns}) "
+            f"SELECT {self.quoted_columns} FROM dbcopy_stage ON CONFLICT ({self.quoted_pk}) {conflict}"))
+
+    def sync(self, bound):
+        """Bring the target's copy of rows with key <= ``bound`` in line with the source."""
+        last_high = None
+        for low, high, rows in self._source_batches(bound):
+            last_high = high
+            with self.target.begin() as connection:
+                existing = self._target_rows(connection, low, high)
+                if _digest(existing) == _digest(rows):
+                    continue
+                if not existing:
+                    self._copy_rows(connection, rows, self.quoted_table)
+                    self.copied += len(rows)
+                    continue
+                source_keys = {self.key_of(row) for row in rows}
+                self.stale_ids.extend(key for key in map(self.key_of, existing) if key not in source_keys)
+                # Compared by digest: rows holding JSON lists or dicts aren't hashable
+                unchanged = {_digest([row]) for row in existing}
+                changed = [row for row in rows if _digest([row]) not in unchanged]
+                if changed:
+                    self._upsert(connection, changed)
+                    self.upserted += len(changed)
+        # Target rows past the last source row have since been deleted at the source
+        with self.target.connect() as connection:
+            tail = select(*self.pk_columns).where(*_range(self.target_pk, last_high, None))
+            self.stale_ids.extend(row[0] if len(row) == 1 else tuple(row) for row in connection.execute(tail))
+
+    def delete_stale(self):
+        with self.target.begin() as connection:
+            for start in range(0, len(self.stale_ids), self.batch_size):
+                ids = self.stale_ids[start:start + self.batch_size]
+                connection.execute(self.table.delete().where(self.pk.in_(ids)))
+        deleted = len(self.stale_ids)
+        self.stale_ids = []
+        return deleted
+
+    def reset_sequence(self):
+        if len(self.pk_columns) > 1 or not isinstance(self.pk.type, db.Integer):
+            return
+        with self.target.begin() as connection:
+            sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                          {'table': self.quoted_table, 'column': self.pk.name}).scalar()
+            if sequence:
+                connection.execute(text(
+                    f"SELECT setval(:sequence, COALESCE(MAX({self.quoted_pk}), 1), MAX({self.quoted_pk}) IS NOT NULL) "
+                    f"FROM {self.quoted_table}"), {'sequence': sequence})
+
+    def verify(self):
+        """``(source count, target count, checksums match)``."""
+        counts = []
+        digests = []
+        for engine, order in ((db.engine, self.pk_columns), (self.target, self.target_pk_columns)):
+            with engine.connect() as connection:
+                counts.append(connection.execute(select(func.count()).select_from(self.table)).scalar())
+                rows = connection.execution_options(yield_per=self.batch_size) \
+                    .execute(select(self.table).order_by(*order))
+                digests.append(_digest(tuple(row) for row in rows))
+        return counts[0], counts[1], digests[0] == digests[1]
+
+
+def _target_engine(url):
+    target = create_engine(url)
+    if target.dialect.name != 'postgresql':
+        raise click.ClickException('The target must be a PostgreSQL URL.')
+    missing = [table.name for table in db.metadata.sorted_tables
+               if not inspect(target).has_table(table.name)]
+    if missing:
+        raise click.ClickException(
+            f"Target is missing tables {', '.join(missing)}; run `flask db upgrade` against it first.")
+    return target
+
+
+def sync_database(target, batch_size=None):
+    """One copy/catch-up pass over every table. Returns the per-table copiers."""
+    batch_size = batch_size or current_app.config['DBCOPY_BATCH_SIZE']
+    tables = db.metadata.sorted_tables
+    copiers = [TableCopier(table, target, batch_size) for table in tables]
+    # Bounds are read children first: a child row under its bound was written
+    # before its parent's bound was read, so the parent is copied too
+    bounds = {}
+    with db.engine.connect() as source:
+        for copier in reversed(copiers):
+            bounds[copier.table.name] = copier.max_key(source)
+    for copier in copiers:
+        copier.sync(bounds[copier.table.name])
+    for copier in reversed(copiers):
+        copier.deleted += copier.delete_stale()
+    for copier in copiers:
+        copier.reset_sequence()
+    return copiers
+
+
+def _report(copiers):
+    for copier in copiers:
+        click.echo(f"{copier.table.name}: {copier.copied} copied, {copier.upserted} updated, "
+                   f"{copier.deleted} deleted")
+    changed = sum(copier.copied + copier.upserted + copier.deleted for copier in copiers)
+    click.echo(f"{changed} rows changed on the target.")
+
+
+@dbcopy_cli.command('copy')
+@click.argument('target_url')
+@click.option('--batch-size', type=int, default=None, help='Rows per COPY batch.')
+def copy_command(target_url, batch_size):
+    """Initial bulk copy into an empty PostgreSQL database."""
+    target = _target_engine(target_url)
+    with target.connect() as connection:
+        populated = [table.name for table in db.metadata.sorted_tables
+                     if connection.execute(select(table).limit(1)).first() is not None]
+    if populated:
+        raise click.ClickException(
+            f"Target already has rows in {', '.join(populated)}; use `flask dbcopy catchup`.")
+    _report(sync_database(target, batch_size))
+
+
+@dbcopy_cli.command('catchup')
+@click.argument('target_url')
+@click.option('--batch-size', type=int, default=None, help='Rows per checksum/COPY batch.')
+def catchup_command(target_url, batch_size):
+    """Copy rows written, changed or deleted since the last pass."""
+    _report(sync_database(_target_engine(target_url), batch_size))
+
+
+@dbcopy_cli.command('verify')
+@click.argument('target_url')
+def verify_command(target_url):
+    """Compare row counts and checksums of every table."""
+    target = _target_engine(target_url)
+    batch_size = current_app.config['DBCOPY_BATCH_SIZE']
+    ok = True
+    for table in db.metadata.sorted_tables:
+        source_count, target_count, same = TableCopier(table, target, batch_size).verify()
+        status = 'ok' if same and source_count == target_count else 'MISMATCH'
+        ok = ok and status == 'ok'
+        click.echo(f"{table.name}: {source_count} source / {target_count} target rows, {status}")
+    if not ok:
+        raise click.ClickException('Target differs from the source; run `flask dbcopy catchup`.')
@@ -0,0 +1,78 @@
+# app/events.py
+"""Post-commit change notifications for in-memory indexes.
+
+``on_commit(Model, fields, callback)`` calls ``callback(changes)`` after a
+session commits, where ``changes`` is a list of :class:`Change` for the rows
+of ``Model`` inserted, updated or deleted in that transaction. Rolled back
+work is dropped, so listeners never see changes that didn't persist.
+Setting a ``deleted_at`` tombstone counts as a delete.
+"""
+
+from collections import namedtuple, defaultdict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# op is 'insert', 'update' or 'delete'; old/new map each tracked field to its
+# value before/after the change (None for a missing side)
+Change = namedtuple('Change', 'op id old new')
+
+_listeners = defaultdict(list)  # model -> [(fields, callback)]
+_PENDING_KEY = 'committed_changes'
+
+
+def tombstoned(state):
+    """Whether this flush sets the row's ``deleted_at`` tombstone."""
+    if 'deleted_at' not in state.attrs:
+        return False
+    added = state.attrs.deleted_at.history.added
+    return bool(added) and added[0] is not None
+
+
+def _record(target, op):
+    state = inspect(target)
+    model = type(target)
+    if op == 'update' and tombstoned(state):
+        op = 'delete'
+    for fields, callback in _listeners[model]:
+        if op == 'insert':
+            old, new = None, {field: getattr(target, field) for field in fields}
+        elif op == 'delete':
+            old, new = {field: getattr(target, field) for field in fields}, None
+        else:
+            old, new = {}, {}
+            for field in fields:
+                history = state.attrs[field].history
+                current = getattr(target, field)
+                new[field] = current
+                old[field] = history.deleted[0] if history.deleted else current
+            if old == new:
+                continue
+        pending = state.session.info.setdefault(_PENDING_KEY, [])
+        pending.append((callback, Change(op, target.id, old, new)))
+
+
+def on_commit(model, fields, callback):
+    """Call ``callback(changes)`` after each commit touching ``model`` rows."""
+    if model not in _listeners:
+        event.listen(model, 'after_insert', lambda m, c, target: _record(target, 'insert'))
+        event.listen(model, 'after_update', lambda m, c, target: _record(target, 'update'))
+        event.listen(model, 'after_delete', lambda m, c, target: _record(target, 'delete'))
+    _listeners[model].append((tuple(fields), callback))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    batches = defaultdict(list)
+    for callback, change in pending:
+        batches[callback].append(change)
+    for callback, changes in batches.items():
+        callback(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,241 @@
+# app/facets.py
+"""Facet counts for book search from in-memory bitmaps.
+
+For every facet (genre, condition, availability, location) and every
+case-folded value, the index keeps a bitmap of book ids, stored as a Python
+int with bit ``id`` set. A search's candidate ids become one more bitmap,
+and drill-down filters and facet counts are then just ``&`` and
+``int.bit_count()``, so indexed facets need no per-search GROUP BY scan.
+
+Every value costs one AND per search, as long as the highest book id. A
+facet with more than ``FACETS_MAX_VALUES`` distinct values (usually
+``location``) is therefore not held in memory. Its drill-down is a SQL
+predicate (:func:`selection_criteria`), and its counts come from one
+``GROUP BY`` over the search's query (:func:`sql_counts`).
+
+The bitmaps are built from the ``book`` table on first use, maintained from
+committed Book writes (app.events), and rebuilt every
+``FACETS_REFRESH_SECONDS`` to pick up other workers' writes.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.events import on_commit
+from app.lookups import LOOKUP_FIELDS, resolve, tracked_columns
+from app.models import Book
+
+FACETS = ('genre', 'condition', 'availability_status', 'location')
+TRACKED_COLUMNS = tracked_columns(FACETS)
+FACET_LABELS = {
+    'genre': 'Genre',
+    'condition': 'Condition',
+    'availability_status': 'Availability',
+    'location': 'Location',
+}
+
+
+def fold(value):
+    return ' '.join(value.lower().split()) if value else ''
+
+
+def bitmap_from_ids(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for book_id in ids:
+        buffer[book_id >> 3] |= 1 << (book_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def ids_from_bitmap(bitmap):
+    """Set bit positions of ``bitmap``, highest (newest id) first."""
+    bits = bin(bitmap)[2:] if bitmap else ''
+    top = len(bits) - 1
+    return [top - i for i, bit in enumerate(bits) if bit == '1']
+
+
+def _ranked(counts, labels, limit):
+    ranked = sorted(((labels[key], count) for key, count in counts.items() if count),
+                    key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None  # indexed facet -> folded value -> bitmap
+        self._labels = {}  # (facet, folded value) -> display value
+        self._sql_facets = frozenset()  # Facets with too many values to index
+        self._built_at = 0.0
+
+    def build(self):
+        max_values = current_app.config['FACETS_MAX_VALUES']
+        ids = {facet: {} for facet in FACETS}
+        labels = {}
+        columns = [Book.id] + [getattr(Book, column) for column in TRACKED_COLUMNS]
+        for row in db.session.query(*columns).yield_per(1000):
+            book_id = row[0]
+            values = resolve(FACETS, dict(zip(TRACKED_COLUMNS, row[1:])))
+            for facet, value in values.items():
+                key = fold(value)
+                if key:
+                    ids[facet].setdefault(key, []).append(book_id)
+                    labels.setdefault((facet, key), value.strip())
+        sql_facets = frozenset(facet for facet, values in ids.items() if len(values) > max_values)
+        postings = {facet: {key: bitmap_from_ids(book_ids) for key, book_ids in values.items()}
+                    for facet, values in ids.items() if facet not in sql_facets}
+        labels = {key: label for key, label in labels.items() if key[0] not in sql_facets}
+        with self._lock:
+            self._postings = postings
+            self._labels = labels
+            self._sql_facets = sql_facets
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        refresh = current_app.config.get('FACETS_REFRESH_SECONDS')
+        stale = refresh and time.monotonic() - self._built_at > refresh
+        if self._postings is None or stale:
+            self.build()
+
+    def apply(self, changes):
+        """Apply committed Book changes (see app.events)."""
+        max_values = current_app.config['FACETS_MAX_VALUES']
+        with self._lock:
+            if self._postings is None:
+                return
+            for change in changes:
+                bit = 1 << change.id
+                old_values = resolve(FACETS, change.old, cached=True) if change.old else {}
+                new_values = resolve(FACETS, change.new, cached=True) if change.new else {}
+                for facet in list(self._postings):
+                    old = fold(old_values.get(facet))
+                    new = fold(new_values.get(facet))
+                    if old == new:
+                        continue
+                    values = self._postings[facet]
+                    if old in values:
+                        values[old] &= ~bit
+                        if not values[old]:
+                            del values[old]
+                    if new:
+                        values[new] = values.get(new, 0) | bit
+                        self._labels.setdefault((facet, new), new_values[facet].strip())
+                    if len(values) > max_values:
+                        # Outgrew the index; counted in SQL from now on
+                        del self._postings[facet]
+                        self._labels = {key: label for key, label in self._labels.items() if key[0] != facet}
+                        self._sql_facets |= {facet}
+
+    def sql_facets(self):
+        """Facets too varied to index; search filters and counts them in SQL."""
+        self._ensure_fresh()
+        return self._sql_facets
+
+    def filter(self, candidates, selected):
+        """Narrow the ``candidates`` bitmap to the ``{facet: value}`` selections of indexed facets."""
+        self._ensure_fresh()
+        with self._lock:
+            for facet, value in selected.items():
+                if facet in self._postings:
+                    candidates &= self._postings[facet].get(fold(value), 0)
+        return candidates
+
+    def counts(self, candidates, limit=10):
+        """``{facet: [(label, count)]}`` of the indexed facets over the ``candidates`` bitmap, biggest first."""
+        self._ensure_fresh()
+        result = {}
+        with self._lock:
+            for facet, values in self._postings.items():
+                counts = {key: (bitmap & candidates).bit_count() for key, bitmap in values.items()}
+                labels = {key: self._labels[(facet, key)] for key in values}
+                result[facet] = _ranked(counts, labels, limit)
+        return result
+
+
+def selection_criteria(selected):
+    """SQL criteria for the ``{facet: value}`` selections, compared case-insensitively as the index does."""
+    criteria = []
+    for facet, value in selected.items():
+        if facet in LOOKUP_FIELDS:
+            column, cache = LOOKUP_FIELDS[facet]
+            criteria.append(getattr(Book, column) == cache.id_for(value))
+        else:
+            criteria.append(func.lower(func.trim(getattr(Book, facet))) == fold(value))
+    return criteria
+
+
+def sql_counts(query, facets, limit=10):
+    """``{facet: [(label, count)]}`` for the books of ``query`` (a query of ``Book.id``), by GROUP BY."""
+    result = {}
+    for facet in facets:
+        (column_name,) = tracked_columns([facet])
+        column = getattr(Book, column_name)
+        counts = Counter()
+        labels = {}
+        for value, count in query.with_entities(column, func.count()).group_by(column):
+            name = resolve([facet], {column_name: value})[facet]
+            key = fold(name)
+            if key:
+                counts[key] += count
+                labels.setdefault(key, name.strip())
+        result[facet] = _ranked(counts, labels, limit)
+    return result
+
+
+class IdPagination:
+    """Pagination over a list of ids, compatible with the search template.
+
+    The page's books come with their owners loaded: a streamed page renders
+    after the request's session is gone, so the template must not lazy load.
+    """
+
+    def __init__(self, ids, page, per_page):
+        self.total = len(ids)
+        self.per_page = per_page
+        self.pages = max(1, -(-self.total // per_page))
+        self.page = min(max(page, 1), self.pages)
+        page_ids = ids[(self.page - 1) * per_page:self.page * per_page]
+        books = ({book.id: book for book in Book.query.options(joinedload(Book.owner)).filter(Book.id.in_(page_ids))}
+                 if page_ids else {})
+        self.items = [books[book_id] for book_id in page_ids if book_id in books]
+        self.has_prev = self.page > 1
+        self.has_next = self.page < self.pages
+        self.prev_num = self.page - 1 if self.has_prev else None
+        self.next_num = self.page + 1 if self.has_next else None
+
+    def __bool__(self):
+        return self.total > 0
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (num <= left_edge or
+                    self.page - left_current - 1 < num < self.page + right_current or
+                    num > self.pages - right_edge):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+facet_index = FacetIndex()
+on_commit(Book, TRACKED_COLUMNS, facet_index.apply)
+
+
+def preload(app):
+    """Build the bitmaps at startup; a missing table just defers it to first use."""
+    with app.app_context():
+        try:
+            facet_index.build()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.warning('Facet index not built at startup; will build on first use.')
@@ -1,11 +1,15 @@
 # app/forms.py
 
+import secrets
+
 from flask_wtf import FlaskForm
 from wtforms import (
+    HiddenField,
     StringField,
     PasswordField,
     SubmitField,
     SelectField,
+    SelectMultipleField,
     TextAreaField,
     FileField
 )
@@ -16,11 +20,15 @@ from wtforms.validators import (
     ValidationError,
     Length
 )
-from flask_wtf.file import FileAllowed
+from flask_wtf.file import FileAllowed, FileRequired
 from app.models import User
 from flask_login import current_user
 
-class RegistrationForm(FlaskForm):
+class IdempotentForm(FlaskForm):
+    # A new key per rendered form; resubmitting it replays the first response (app.idempotency)
+    idempotency_key = HiddenField(default=lambda: secrets.token_urlsafe(16))
+
+class RegistrationForm(IdempotentForm):
     username = StringField('Username', validators=[
         DataRequired(),
         Length(min=2, max=20)
@@ -48,6 +56,13 @@ class RegistrationForm(FlaskForm):
         if user:
             raise ValidationError('Email already registered.')
 
+class UserImportForm(FlaskForm):
+    csv_file = FileField('Members CSV', validators=[
+        FileRequired(),
+        FileAllowed(['csv'], 'CSV files only!')
+    ])
+    submit = SubmitField('Import Users')
+
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[
         DataRequired(),
@@ -74,7 +89,7 @@ class ResetPasswordForm(FlaskForm):
     ])
     submit = SubmitField('Reset Password')
 
-class BookForm(FlaskForm):
+class BookForm(IdempotentForm):
     title = StringField('Title', validators=[DataRequired(), Length(max=100)])
     author = StringField('Author', validators=[DataRequired(), Length(max=100)])
     genre = StringField('Genre', validators=[DataRequired(), Length(max=50)])
@@ -116,7 +131,7 @@ class ExchangeRequestFormv(FlaskForm):
     ])
     submit = SubmitField('Request Exchange')
 
-class ExchangeRequestForm(FlaskForm):
+class ExchangeRequestForm(IdempotentForm):
     delivery_method = StringField('Delivery Method', validators=[DataRequired(), Length(max=50)])
     exchange_duration = StringField('Exchange Duration', validators=[DataRequired(), Length(max=50)])
     submit = SubmitField('Send Request')
@@ -125,6 +140,12 @@ class RespondExchangeForm(FlaskForm):
     submit_accept = SubmitField('Accept')
     submit_reject = SubmitField('Reject')
 
+class BatchRespondExchangeForm(FlaskForm):
+    # Checked ids; ownership and status are checked by the view, not as choices
+    request_ids = SelectMultipleField('Requests', coerce=int, validate_choice=False)
+    submit_accept = SubmitField('Accept selected')
+    submit_reject = SubmitField('Reject selected')
+
 class ProfileForm(FlaskForm):
     username = StringField('Username', validators=[
         DataRequired(),
@@ -158,7 +179,7 @@ class ChangePasswordForm(FlaskForm):
     ])
     submit_password = SubmitField('Change Password')
 
-class MessageForm(FlaskForm):
+class MessageForm(IdempotentForm):
     content = TextAreaField('Message', validators=[
         DataRequired(),
         Length(min=1, max=1000, message="Message must be between 1 and 1000 characters.")
@@ -177,4 +198,4 @@ class ChangePasswordForm(FlaskForm):
         DataRequired(message="Please confirm your new password."),
         EqualTo('new_password', message="Passwords must match.")
     ])
-    submit_password = SubmitField('Update Password')
\ No newline at end of file
+    submit_password = SubmitField('Update Password')
\ No newline at end of file
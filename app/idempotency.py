@@ -0,0 +1,167 @@
+# app/idempotency.py
+"""Idempotency keys for the form POSTs that create rows.
+
+A retried or double-submitted POST should not insert a second book,
+message, exchange request or account. Views decorated with
+:func:`idempotent` look for a key in the ``Idempotency-Key`` header or the
+``idempotency_key`` form field. Forms derived from
+:class:`app.forms.IdempotentForm` embed a fresh key each time they are
+rendered.
+
+The first request with a key adds an ``idempotency_key`` row to the
+session, so it commits in the view's own transaction, together with the
+rows it creates. The response is stored afterwards: the status, the
+redirect target and any flashed messages. A later request with the same
+key gets that response back without running the view. That costs one
+indexed lookup instead of a write. If two requests race, the unique
+``(scope, key)`` constraint rejects the second insert. The second request
+then waits up to ``IDEMPOTENCY_WAIT_SECONDS`` for the first response and
+replays it.
+
+A key row without a response can only be seen once the view's change has
+committed. If the response is still missing after the wait, the worker died
+between the two commits: the repeat is told the submission went through and
+redirected back to the page it was posted to, and that response is stored for later
+repeats.
+
+Keys expire after ``IDEMPOTENCY_TTL_SECONDS``. ``flask idempotency purge``
+deletes expired keys.
+"""
+
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import current_app, flash, make_response, redirect, request, session
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import delete, event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import IdempotencyKey
+
+idempotency_cli = AppGroup('idempotency', help='Maintain stored idempotency keys.')
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 100
+_COMMITTED_KEY = 'idempotency_committed'
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_committed(session):
+    session.info[_COMMITTED_KEY] = True
+
+
+def _submitted_key():
+    key = (request.headers.get(HEADER) or request.form.get(FORM_FIELD) or '').strip()
+    return key if 0 < len(key) <= MAX_KEY_LENGTH else None
+
+
+def _find(scope, key):
+    """The live record for ``key``; an expired one is deleted so the key can be reused."""
+    record = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+    if record is not None and record.expires_at <= datetime.utcnow():
+        db.session.delete(record)
+        db.session.commit()
+        return None
+    return record
+
+
+def _wait_for_response(scope, key):
+    """The record once its first request has stored a response, or as it stands at the deadline."""
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+    while True:
+        record = _find(scope, key)
+        if record is None or record.status_code is not None or time.monotonic() >= deadline:
+            return record
+        db.session.rollback()  # Read the record afresh next time
+        time.sleep(0.1)
+
+
+def _complete(record):
+    """Store a response for a key whose change committed but whose response never did."""
+    record.status_code = 303
+    record.location = request.path
+    record.flashes = [['info', 'Your earlier submission was already received.']]
+    db.session.commit()
+
+
+def _replay(record):
+    if record.status_code is None:
+        _complete(record)
+    for category, message in record.flashes or []:
+        flash(message, category)
+    if record.location:
+        return redirect(record.location, code=record.status_code)
+    return make_response('', record.status_code)
+
+
+def idempotent(view):
+    """Run ``view`` at most once per idempotency key, replaying its response for repeats."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = _submitted_key() if request.method == 'POST' else None
+        if key is None:
+            return view(*args, **kwargs)
+        scope = request.endpoint
+        user_id = current_user.id if current_user.is_authenticated else None
+        record = _wait_for_response(scope, key)
+        if record is not None:
+            if record.user_id != user_id:
+                return make_response('This idempotency key was already used by someone else.', 422)
+            return _replay(record)
+
+        record = IdempotencyKey(scope=scope, key=key, user_id=user_id, expires_at=datetime.utcnow()
+                                + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL_SECONDS']))
+        db.session.add(record)
+        db.session.info.pop(_COMMITTED_KEY, None)
+        flashed = len(session.get('_flashes', []))
+        try:
+            response = view(*args, **kwargs)
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            db.session.rollback()
+            winner = _wait_for_response(scope, key)
+            if winner is None or winner.user_id != user_id:
+                raise
+            return _replay(winner)
+        if not (db.session.info.pop(_COMMITTED_KEY, False) and inspect(record).persistent):
+            # Nothing was written (e.g. the form didn't validate), so there is nothing to replay
+            db.session.rollback()
+            return response
+        response = make_response(response)
+        record.status_code = response.status_code
+        record.location = response.headers.get('Location')
+        record.flashes = [list(entry) for entry in session.get('_flashes', [])[flashed:]]
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def purge():
+    """Delete expired keys. Returns the count."""
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    return result.rowcount
+
+
+@idempotency_cli.command('purge')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, purging every INTERVAL seconds.')
+def purge_command(interval):
+    """Delete expired idempotency keys."""
+    while True:
+        try:
+            click.echo(f"Purged {purge()} expired idempotency keys.")
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Idempotency key purge failed; retrying next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
@@ -0,0 +1,270 @@
+# app/ledger.py
+"""Event-sourced exchange ledger.
+
+Every change to an exchange request is appended to ``transaction`` as an
+event. The routes never update or delete events. In the same database
+transaction, the per-user ``ExchangeSummary`` projection of both parties is
+updated, so history and stats pages read precomputed rows instead of
+rescanning ``exchange_request``. The counters are incremented in SQL
+(``INSERT ... ON CONFLICT DO UPDATE SET x = x + delta``), so concurrent
+events for the same user neither lose an update nor race to create the row.
+
+``flask ledger snapshot`` stores all summaries as of the latest event.
+``flask ledger rebuild`` rebuilds the projection from the newest snapshot
+plus the events after it. The migration that created the ledger logged
+the exchange requests made before it; ``flask ledger backfill`` repeats
+that for any request still without events.
+"""
+
+import json
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func, or_, select, text, update
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import ExchangeRequest, ExchangeSummary, LedgerSnapshot, Transaction
+
+ledger_cli = AppGroup('ledger', help='Maintain the exchange event log and its projections.')
+
+INITIATED = 'initiated'
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+CANCELLED = 'cancelled'
+COMPLETED = 'completed'
+
+# Counter changes an event causes on both parties' summaries
+EVENT_EFFECTS = {
+    INITIATED: {'active_count': 1},
+    ACCEPTED: {},
+    REJECTED: {'active_count': -1, 'rejected_count': 1},
+    CANCELLED: {'active_count': -1, 'cancelled_count': 1},
+    COMPLETED: {'active_count': -1, 'completed_count': 1},
+}
+COUNTERS = ('active_count', 'completed_count', 'cancelled_count', 'rejected_count')
+SUMMARY_FIELDS = COUNTERS + ('last_event_id', 'last_activity')
+
+
+def _summary_for(user_id, cache=None):
+    if cache is not None and user_id in cache:
+        return cache[user_id]
+    summary = db.session.get(ExchangeSummary, user_id)
+    if summary is None:
+        summary = ExchangeSummary(user_id=user_id, active_count=0, completed_count=0,
+                                  cancelled_count=0, rejected_count=0, last_event_id=0)
+        db.session.add(summary)
+    if cache is not None:
+        cache[user_id] = summary
+    return summary
+
+
+def _apply(event, cache=None):
+    # In Python, for rebuild_projections only: live events go through _add_to_summaries
+    for user_id in (event.user_id, event.counterparty_id):
+        if user_id is None:
+            continue
+        summary = _summary_for(user_id, cache)
+        for field, delta in EVENT_EFFECTS[event.status].items():
+            setattr(summary, field, getattr(summary, field) + delta)
+        summary.last_event_id = max(summary.last_event_id, event.id)
+        summary.last_activity = event.timestamp
+
+
+def _summary_changes(entries):
+    """One row per party: the counter deltas of ``entries`` and the newest event."""
+    changes = {}
+    for entry in entries:
+        for user_id in (entry.user_id, entry.counterparty_id):
+            if user_id is None:
+                continue
+            values = changes.setdefault(user_id, dict(dict.fromkeys(COUNTERS, 0), user_id=user_id,
+                                                      last_event_id=0, last_activity=None))
+            for field, delta in EVENT_EFFECTS[entry.status].items():
+                values[field] += delta
+            if entry.id > values['last_event_id']:
+                values['last_event_id'] = entry.id
+                values['last_activity'] = entry.timestamp
+    return list(changes.values())
+
+
+def _add_to_summaries(entries):
+    """Add the effects of ``entries`` to both parties' summaries with atomic SQL increments."""
+    rows = _summary_changes(entries)
+    if not rows:
+        return
+    table = ExchangeSummary.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        for row in rows:
+            newer = table.c.last_event_id < row['last_event_id']
+            updated = db.session.execute(
+                update(table).where(table.c.user_id == row['user_id'])
+                .values({field: table.c[field] + row[field] for field in COUNTERS},
+                        last_event_id=case((newer, row['last_event_id']), else_=table.c.last_event_id),
+                        last_activity=case((newer, row['last_activity']), else_=table.c.last_activity)))
+            if not updated.rowcount:
+                db.session.execute(table.insert().values(row))
+        return
+    statement = dialect_insert(table)
+    excluded = statement.excluded
+    newer = excluded.last_event_id > table.c.last_event_id
+    statement = statement.on_conflict_do_update(index_elements=['user_id'], set_=dict(
+        {field: table.c[field] + excluded[field] for field in COUNTERS},
+        last_event_id=case((newer, excluded.last_event_id), else_=table.c.last_event_id),
+        last_activity=case((newer, excluded.last_activity), else_=table.c.last_activity)))
+    db.session.execute(statement, rows)
+
+
+def _entry(exchange_request, event, actor_id, timestamp):
+    if event not in EVENT_EFFECTS:
+        raise ValueError(f"Unknown exchange event: {event}")
+    counterparty_id = (exchange_request.receiver_id if actor_id == exchange_request.sender_id
+                       else exchange_request.sender_id)
+    return Transaction(
+        user_id=actor_id,
+        counterparty_id=counterparty_id,
+        exchange_request_id=exchange_request.id,
+        book_id=exchange_request.book_id,
+        status=event,
+        timestamp=timestamp or datetime.utcnow(),
+    )
+
+
+def record_event(exchange_request, event, actor_id, timestamp=None):
+    """Append ``event`` for ``exchange_request`` and update both parties' summaries.
+
+    The caller commits, so the event, the projection and the request's own
+    status change land in one transaction.
+    """
+    entry = _entry(exchange_request, event, actor_id, timestamp)
+    db.session.add(entry)
+    db.session.flush()  # Assigns entry.id for last_event_id
+    _add_to_summaries([entry])
+    return entry
+
+
+def record_events(exchange_requests, event, actor_id, timestamp=None):
+    """:func:`record_event` for many requests: one flush and one summary upsert.
+
+    ``exchange_requests`` may be rows with ``id``, ``sender_id``,
+    ``receiver_id`` and ``book_id`` rather than ORM objects.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    entries = [_entry(exchange_request, event, actor_id, timestamp) for exchange_request in exchange_requests]
+    db.session.add_all(entries)
+    db.session.flush()
+    _add_to_summaries(entries)
+    return entries
+
+
+def recent_activity(user_id, limit=20):
+    """Latest events where ``user_id`` was either party."""
+    return Transaction.query.filter(
+        or_(Transaction.user_id == user_id, Transaction.counterparty_id == user_id)
+    ).options(joinedload(Transaction.user), joinedload(Transaction.counterparty),
+              joinedload(Transaction.book)).order_by(Transaction.id.desc()).limit(limit).all()
+
+
+def summary_for(user_id):
+    """The user's summary, or an unsaved all-zero one if they have no events yet."""
+    return db.session.get(ExchangeSummary, user_id) or ExchangeSummary(
+        user_id=user_id, active_count=0, completed_count=0, cancelled_count=0,
+        rejected_count=0, last_event_id=0)
+
+
+def take_snapshot():
+    """Store every summary together with the id of the last event they include."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Waits for event transactions in flight and holds off new ones until the
+        # snapshot commits, so no event below the recorded id can commit later
+        db.session.execute(text('LOCK TABLE "transaction", exchange_summary IN SHARE MODE'))
+    # One statement, so the summaries and the high-water mark come from the same snapshot
+    high_water = select(func.max(Transaction.id)).scalar_subquery()
+    rows = db.session.execute(
+        select(*[getattr(ExchangeSummary, field) for field in ('user_id',) + SUMMARY_FIELDS], high_water)).all()
+    last_event_id = rows[0][-1] if rows else db.session.query(func.max(Transaction.id)).scalar()
+    summaries = {
+        str(row.user_id): {
+            field: (value.isoformat() if isinstance(value, datetime) else value)
+            for field in SUMMARY_FIELDS
+            for value in [getattr(row, field)]
+        }
+        for row in rows
+    }
+    snapshot = LedgerSnapshot(last_event_id=last_event_id or 0, summaries=json.dumps(summaries))
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+
+def rebuild_projections(batch_size=1000):
+    """Recreate ExchangeSummary from the newest snapshot plus later events."""
+    snapshot = LedgerSnapshot.query.order_by(LedgerSnapshot.id.desc()).first()
+    ExchangeSummary.query.delete()
+    cache = {}
+    last_event_id = 0
+    if snapshot is not None:
+        last_event_id = snapshot.last_event_id
+        for user_id, data in json.loads(snapshot.summaries).items():
+            summary = _summary_for(int(user_id), cache)
+            for field in SUMMARY_FIELDS:
+                value = data[field]
+                if field == 'last_activity' and value:
+                    value = datetime.fromisoformat(value)
+                setattr(summary, field, value)
+
+    replayed = 0
+    while True:
+        events = Transaction.query.filter(Transaction.id > last_event_id) \
+            .order_by(Transaction.id).limit(batch_size).all()
+        if not events:
+            break
+        for event in events:
+            _apply(event, cache)
+        last_event_id = events[-1].id
+        replayed += len(events)
+    db.session.commit()
+    return replayed
+
+
+def backfill():
+    """Write events for exchange requests that have none yet."""
+    logged = db.session.query(Transaction.exchange_request_id)
+    written = 0
+    for exchange_request in ExchangeRequest.query.filter(~ExchangeRequest.id.in_(logged)) \
+            .order_by(ExchangeRequest.id):
+        record_event(exchange_request, INITIATED, exchange_request.sender_id,
+                     timestamp=exchange_request.timestamp)
+        terminal = {'accepted': ACCEPTED, 'rejected': REJECTED,
+                    'canceled': CANCELLED, 'completed': COMPLETED}.get(exchange_request.status)
+        if terminal:
+            actor = exchange_request.receiver_id if terminal in (ACCEPTED, REJECTED) else exchange_request.sender_id
+            record_event(exchange_request, terminal, actor, timestamp=exchange_request.timestamp)
+        written += 1
+    db.session.commit()
+    return written
+
+
+@ledger_cli.command('snapshot')
+def snapshot_command():
+    """Snapshot every user's exchange summary."""
+    snapshot = take_snapshot()
+    click.echo(f"Snapshot {snapshot.id} taken at event {snapshot.last_event_id}.")
+
+
+@ledger_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild summaries from the latest snapshot and the events after it."""
+    click.echo(f"Replayed {rebuild_projections()} events.")
+
+
+@ledger_cli.command('backfill')
+def backfill_command():
+    """Create events for exchange requests made before the ledger existed."""
+    click.echo(f"Backfilled {backfill()} exchange requests.")
@@ -0,0 +1,226 @@
+# app/limits.py
+"""Admission control and rate limiting for expensive routes.
+
+Routes listed in ``ROUTE_LIMITS`` get two guards:
+
+* a token bucket per user and per client IP (``rate`` tokens per second,
+  ``burst`` capacity), answering 429 with ``Retry-After`` when empty;
+* an adaptive concurrency limit. Up to ``queue`` requests wait at most
+  ``queue_timeout`` seconds for a free slot; anything beyond that is
+  rejected straight away with 503 and ``Retry-After``. When
+  ``target_ms`` is set the limit shrinks while the route is slower than the
+  target and grows back one slot at a time once it recovers (AIMD).
+
+Buckets live in-process by default. Set ``RATE_LIMIT_STORAGE_URL`` to a
+``redis://`` URL to share them between workers and hosts. Behind a reverse
+proxy, set ``TRUSTED_PROXIES`` so IP buckets see the client's address
+rather than the proxy's.
+
+Concurrency limits are per process. They only take effect under threaded
+workers (gunicorn.conf.py runs ``gthread``): a sync worker serves one
+request at a time, so no route ever has a second request in flight.
+"""
+
+import math
+import threading
+import time
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+
+class MemoryBackend:
+    """In-process token buckets.
+
+    A bucket that has refilled is the same as a missing one, so buckets are
+    dropped once full. At most every ``prune_interval`` seconds, a sweep
+    removes them, which keeps memory bounded by the recently active clients.
+    """
+
+    def __init__(self, prune_interval=60):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._prune_interval = prune_interval
+        self._pruned_at = time.monotonic()
+
+    def _prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._pruned_at = now
+
+    def take_tokens(self, keys, rate, burst):
+        """Take one token from every bucket in ``keys``, or from none of them.
+
+        Returns ``(allowed, retry_after_seconds)``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned_at >= self._prune_interval:
+                self._prune(now)
+            levels = {}
+            for key in keys:
+                tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+                levels[key] = min(burst, tokens + (now - updated) * rate)
+            allowed = all(tokens >= 1 for tokens in levels.values())
+            for key, tokens in levels.items():
+                if allowed:
+                    tokens -= 1
+                self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if allowed:
+                return True, 0
+            return False, max((1 - tokens) / rate for tokens in levels.values() if tokens < 1)
+
+
+class RedisBackend:
+    """Token buckets shared through Redis (requires the ``redis`` package)."""
+
+    # Refills every bucket in KEYS, then takes a token from all of them or none
+    SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local levels = {}
+    local allowed = 1
+    local lowest = burst
+    for i, key in ipairs(KEYS) do
+        local tokens = tonumber(redis.call('HGET', key, 't') or burst)
+        local updated = tonumber(redis.call('HGET', key, 'u') or now)
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        if tokens < 1 then allowed = 0 end
+        lowest = math.min(lowest, tokens)
+        levels[i] = tokens
+    end
+    for i, key in ipairs(KEYS) do
+        local tokens = levels[i] - allowed
+        redis.call('HSET', key, 't', tokens, 'u', now)
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return {allowed, tostring(lowest)}
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE_URL needs the redis package (pip install redis).') from None
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take_tokens(self, keys, rate, burst):
+        allowed, tokens = self._take(keys=[f'ratelimit:{key}' for key in keys], args=[rate, burst, time.time()])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+class ConcurrencyLimiter:
+    """Per-route in-flight limit with a bounded wait queue and AIMD tuning."""
+
+    def __init__(self, limit, queue=0, queue_timeout=0.0, target_ms=None, min_limit=1):
+        self.max_limit = limit
+        self.limit = limit
+        self.min_limit = min_limit
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.target_ms = target_ms
+        self.active = 0
+        self.waiting = 0
+        self._latency_ms = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot. Returns False if the request should be shed."""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if self.active >= self.limit:
+                            return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed_ms):
+        with self._cond:
+            self.active -= 1
+            if self.target_ms:
+                self._adapt(elapsed_ms)
+            self._cond.notify()
+
+    def _adapt(self, elapsed_ms):
+        if self._latency_ms is None:
+            self._latency_ms = elapsed_ms
+        else:
+            self._latency_ms = 0.8 * self._latency_ms + 0.2 * elapsed_ms
+        if self._latency_ms > self.target_ms:
+            self.limit = max(self.min_limit, int(self.limit * 0.75))
+        elif self.limit < self.max_limit:
+            self.limit += 1
+
+    def retry_after(self):
+        """Rough seconds until a slot frees up, for the Retry-After header."""
+        if self._latency_ms is None:
+            return 1
+        backlog = (self.waiting + 1) / max(self.limit, 1)
+        return max(1, math.ceil(backlog * self._latency_ms / 1000))
+
+
+class AdmissionControl:
+    def __init__(self, app=None):
+        self.limiters = {}
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('RATE_LIMIT_STORAGE_URL')
+        self.backend = RedisBackend(url) if url else MemoryBackend()
+        for endpoint, settings in app.config.get('ROUTE_LIMITS', {}).items():
+            if settings.get('concurrency'):
+                self.limiters[endpoint] = ConcurrencyLimiter(
+                    settings['concurrency'],
+                    queue=settings.get('queue', 0),
+                    queue_timeout=settings.get('queue_timeout', 0.0),
+                    target_ms=settings.get('target_ms'),
+                )
+        app.extensions['admission_control'] = self
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _reject(self, status, retry_after, message):
+        response = current_app.response_class(message, status=status, mimetype='text/plain')
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _before_request(self):
+        settings = current_app.config.get('ROUTE_LIMITS', {}).get(request.endpoint)
+        if not settings or request.method not in settings.get('methods', ('GET', 'POST')):
+            return None
+
+        if settings.get('rate'):
+            keys = [f'{request.endpoint}:ip:{request.remote_addr}']
+            if current_user.is_authenticated:
+                keys.append(f'{request.endpoint}:user:{current_user.id}')
+            # All or nothing, so a request the user bucket rejects doesn't drain the IP bucket
+            allowed, retry_after = self.backend.take_tokens(keys, settings['rate'], settings.get('burst', 1))
+            if not allowed:
+                return self._reject(429, retry_after, 'Too many requests, please slow down.')
+
+        limiter = self.limiters.get(request.endpoint)
+        if limiter is not None:
+            if not limiter.acquire():
+                return self._reject(503, limiter.retry_after(), 'Server busy, please retry shortly.')
+            g.admission_slot = (limiter, time.perf_counter())
+        return None
+
+    def _teardown_request(self, exc=None):
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            limiter, started = slot
+            limiter.release((time.perf_counter() - started) * 1000)
@@ -0,0 +1,181 @@
+# app/lookups.py
+"""In-process cache of the ``genre`` and ``author`` lookup tables.
+
+Books store integer ``genre_id``/``author_id`` foreign keys. Names are
+matched on their case-folded, whitespace-collapsed key, so "Sci-Fi",
+"sci-fi " and "SCI-FI" are one genre. The tables are small, so each worker
+keeps them in memory, and forms, filters and templates turn names into ids
+and back without a query.
+
+The cache is reloaded every ``LOOKUP_REFRESH_SECONDS``, or sooner when an
+id is missing. A name seen for the first time is inserted by
+:meth:`LookupCache.get_or_create`, and a concurrent insert of the same name
+is tolerated. The new entry stays private to its session and is only
+published to the cache once that transaction commits, so other threads
+never see an id that may still roll back.
+
+:func:`resolve` with ``cached=True`` never queries. The in-memory indexes
+use it from their ``after_commit`` hooks, where the session can't run
+queries. A miss there marks the cache stale for the next request.
+"""
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Author, Genre
+
+
+_CREATED_KEY = 'created_lookups'
+
+
+def canonical(name):
+    return ' '.join((name or '').split()).casefold()
+
+
+def _insert_ignoring_duplicates(model, values):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.session.execute(insert(model).values(**values))
+        return
+    db.session.execute(dialect_insert(model).values(**values).on_conflict_do_nothing(index_elements=['key']))
+
+
+class LookupCache:
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._ids = None  # key -> id
+        self._names = {}  # id -> display name
+        self._loaded_at = 0.0
+        self._stale = False
+
+    def _uncommitted(self):
+        """``(id, key, name)`` of the entries this session created and hasn't committed."""
+        return [(row_id, key, name) for cache, row_id, key, name in db.session.info.get(_CREATED_KEY, ())
+                if cache is self]
+
+    def load(self):
+        rows = db.session.execute(select(self.model.id, self.model.key, self.model.name)).all()
+        # Entries this transaction created stay private until it commits
+        uncommitted = {row_id for row_id, _, _ in self._uncommitted()}
+        with self._lock:
+            self._ids = {key: row_id for row_id, key, _ in rows if row_id not in uncommitted}
+            self._names = {row_id: name for row_id, _, name in rows if row_id not in uncommitted}
+            self._loaded_at = time.monotonic()
+            self._stale = False
+
+    def _ensure_fresh(self):
+        refresh = current_app.config.get('LOOKUP_REFRESH_SECONDS')
+        stale = self._stale or (refresh and time.monotonic() - self._loaded_at > refresh)
+        if self._ids is None or stale:
+            self.load()
+
+    def remember(self, row_id, key, name):
+        with self._lock:
+            if self._ids is not None:
+                self._ids[key] = row_id
+                self._names[row_id] = name
+
+    def id_for(self, name):
+        """Id of ``name``, or None if no such entry exists (yet). Never queries when warm."""
+        self._ensure_fresh()
+        return self._ids.get(canonical(name))
+
+    def name(self, row_id):
+        if row_id is None:
+            return None
+        self._ensure_fresh()
+        name = self._names.get(row_id)
+        if name is None:
+            name = next((name for pending_id, _, name in self._uncommitted() if pending_id == row_id), None)
+        if name is None:
+            self.load()  # Added by another worker since the last load
+            name = self._names.get(row_id)
+        return name
+
+    def cached_name(self, row_id):
+        """Name of ``row_id`` from memory only; a miss marks the cache stale for the next request."""
+        if row_id is None:
+            return None
+        name = self._names.get(row_id)
+        if name is None:
+            self._stale = True
+        return name
+
+    def names(self):
+        """All display names, alphabetically (for datalists)."""
+        self._ensure_fresh()
+        return sorted(self._names.values(), key=str.casefold)
+
+    def matching(self, text):
+        """Ids whose name contains ``text`` (case-insensitive), from memory."""
+        self._ensure_fresh()
+        needle = canonical(text)
+        return [row_id for key, row_id in self._ids.items() if needle in key]
+
+    def get_or_create(self, name):
+        """Id for ``name``, inserting it in the current transaction if it is new."""
+        row_id = self.id_for(name)
+        if row_id is not None:
+            return row_id
+        key = canonical(name)
+        for pending_id, pending_key, _ in self._uncommitted():
+            if pending_key == key:
+                return pending_id
+        column = self.model.key
+        row = db.session.execute(select(self.model.id, self.model.name).where(column == key)).first()
+        if row is not None:
+            self.remember(row.id, key, row.name)  # Committed by another worker since the last load
+            return row.id
+        _insert_ignoring_duplicates(self.model, {'key': key, 'name': ' '.join(name.split())})
+        row = db.session.execute(select(self.model.id, self.model.name).where(column == key)).one()
+        db.session.info.setdefault(_CREATED_KEY, []).append((self, row.id, key, row.name))
+        return row.id
+
+
+# Inserted first, so the in-memory indexes' after_commit hooks (app.events) see the new names
+@event.listens_for(Session, 'after_commit', insert=True)
+def _publish_created(session):
+    for cache, row_id, key, name in session.info.pop(_CREATED_KEY, []):
+        cache.remember(row_id, key, name)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_created(session, previous_transaction):
+    session.info.pop(_CREATED_KEY, None)
+
+
+genres = LookupCache(Genre)
+authors = LookupCache(Author)
+
+# Book fields stored as lookup ids: field -> (id column, cache)
+LOOKUP_FIELDS = {'genre': ('genre_id', genres), 'author': ('author_id', authors)}
+
+
+def tracked_columns(fields):
+    """Book column names to watch for ``fields`` (lookup fields map to their id column)."""
+    return tuple(LOOKUP_FIELDS[field][0] if field in LOOKUP_FIELDS else field for field in fields)
+
+
+def resolve(fields, values, cached=False):
+    """``{field: value}`` from ``values`` keyed by :func:`tracked_columns`, ids turned back into names.
+
+    With ``cached``, names come from memory only (see :meth:`LookupCache.cached_name`).
+    """
+    resolved = {}
+    for field in fields:
+        if field in LOOKUP_FIELDS:
+            column, cache = LOOKUP_FIELDS[field]
+            resolved[field] = cache.cached_name(values[column]) if cached else cache.name(values[column])
+        else:
+            resolved[field] = values[field]
+    return resolved
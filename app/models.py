@@ -2,6 +2,9 @@
 
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, with_loader_criteria
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 
@@ -18,25 +21,57 @@ class User(db.Model, UserMixin):
     # Additional fields can be added here (e.g., profile picture, bio)
 
     # Relationships
-    books = db.relationship('Book', backref='owner', lazy=True)
+    # The collections are write-only: touching one never loads every row, which
+    # for an active user can be thousands of objects per request. Read them with
+    # page() and count(); add to them with ``user.books.add(book)``.
+    books = db.relationship('Book', backref='owner', lazy='write_only')
     sent_exchange_requests = db.relationship('ExchangeRequest', 
                                              foreign_keys='ExchangeRequest.sender_id', 
                                              back_populates='sender', 
-                                             lazy=True)
+                                             lazy='write_only')
     received_exchange_requests = db.relationship('ExchangeRequest', 
                                                  foreign_keys='ExchangeRequest.receiver_id', 
                                                  back_populates='receiver', 
-                                                 lazy=True)
-    messages_sent = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', lazy=True)
-    messages_received = db.relationship('Message', foreign_keys='Message.receiver_id', backref='receiver', lazy=True)
-    transactions = db.relationship('Transaction', backref='user', lazy=True)
+                                                 lazy='write_only')
+    messages_sent = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', lazy='write_only')
+    messages_received = db.relationship('Message', foreign_keys='Message.receiver_id', backref='receiver', lazy='write_only')
+    transactions = db.relationship('Transaction', foreign_keys='Transaction.user_id', backref='user', lazy='write_only')
     profile = db.relationship('Profile', uselist=False, backref='user')  # One-to-one relationship with Profile
 
+    # Newest-first ordering for each collection
+    COLLECTION_ORDER = {
+        'books': 'date_posted',
+        'sent_exchange_requests': 'timestamp',
+        'received_exchange_requests': 'timestamp',
+        'messages_sent': 'timestamp',
+        'messages_received': 'timestamp',
+        'transactions': 'id',
+    }
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+    def collection_query(self, name):
+        """SELECT for the collection ``name``, newest first."""
+        model = getattr(User, name).property.mapper.class_
+        column = getattr(model, self.COLLECTION_ORDER[name])
+        return getattr(self, name).select().order_by(column.desc(), model.id.desc())
+
+    def page(self, name, page=1, per_page=20):
+        """One page of the collection ``name`` (a Flask-SQLAlchemy Pagination)."""
+        return db.paginate(self.collection_query(name), page=page, per_page=per_page, error_out=False)
+
+    def count(self, name):
+        """Size of the collection ``name``, counted by the database."""
+        query = getattr(self, name).select().with_only_columns(func.count(), maintain_column_froms=True)
+        return db.session.scalar(query)
+
+    def counts(self):
+        """Sizes of every collection, for profile pages."""
+        return {name: self.count(name) for name in self.COLLECTION_ORDER}
     
     def __repr__(self):
         return f"User('{self.username}', '{self.email}')"
@@ -47,32 +82,98 @@ class Profile(db.Model):
     reading_preferences = db.Column(db.Text, nullable=True)
     favorite_genres = db.Column(db.Text, nullable=True)
     books_wanted = db.Column(db.Text, nullable=True)
+    avatar = db.Column(db.String(100), nullable=True)  # Storage key, see app/storage.py
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)  # One-to-one relationship
 
     def __repr__(self):
         return f"Profile(User ID: {self.user_id})"
 
+class Genre(db.Model):
+    """Lookup table for book genres, cached in-process by app.lookups."""
+    __tablename__ = 'genre'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(50), unique=True, nullable=False)  # Case-folded canonical name
+    name = db.Column(db.String(50), nullable=False)  # Display spelling, as first entered
+
+    def __repr__(self):
+        return f"Genre('{self.name}')"
+
+class Author(db.Model):
+    """Lookup table for book authors, cached in-process by app.lookups."""
+    __tablename__ = 'author'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False)  # Case-folded canonical name
+    name = db.Column(db.String(100), nullable=False)  # Display spelling, as first entered
+
+    def __repr__(self):
+        return f"Author('{self.name}')"
+
 class Book(db.Model):
     __tablename__ = 'book'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
-    author = db.Column(db.String(100), nullable=False)
-    genre = db.Column(db.String(50), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('author.id'), nullable=False, index=True)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genre.id'), nullable=False, index=True)
     condition = db.Column(db.String(20), nullable=False)
     availability_status = db.Column(db.String(20), nullable=False)
     location = db.Column(db.String(100), nullable=False)
     cover_image = db.Column(db.String(100), nullable=True)
-    date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # Tombstone; see _hide_deleted_books
     # Additional fields can be added here (e.g., description)
 
     # Relationships
     exchange_requests = db.relationship('ExchangeRequest', back_populates='book', lazy=True)
-    
+
+    # ``author`` and ``genre`` read and write names; the ids resolve through
+    # the lookup cache, so neither needs a join or a query
+    @hybrid_property
+    def author(self):
+        from app.lookups import authors
+        return authors.name(self.author_id)
+
+    @author.inplace.setter
+    def _author_setter(self, value):
+        from app.lookups import authors
+        self.author_id = authors.get_or_create(value)
+
+    @author.inplace.expression
+    @classmethod
+    def _author_expression(cls):
+        return select(Author.name).where(Author.id == cls.author_id).scalar_subquery()
+
+    @hybrid_property
+    def genre(self):
+        from app.lookups import genres
+        return genres.name(self.genre_id)
+
+    @genre.inplace.setter
+    def _genre_setter(self, value):
+        from app.lookups import genres
+        self.genre_id = genres.get_or_create(value)
+
+    @genre.inplace.expression
+    @classmethod
+    def _genre_expression(cls):
+        return select(Genre.name).where(Genre.id == cls.genre_id).scalar_subquery()
+
+    def soft_delete(self):
+        self.deleted_at = datetime.utcnow()
 
     def __repr__(self):
         return f"Book('{self.title}', Owner ID: {self.user_id})"
 
+# Deleted books are tombstoned, not removed, and every ORM query (including
+# joins, relationship loads and Book.query.get) skips them. Pass
+# execution_options(include_deleted=True) to see them.
+@event.listens_for(Session, 'do_orm_execute')
+def _hide_deleted_books(execute_state):
+    if (execute_state.is_select and not execute_state.is_column_load
+            and not execute_state.execution_options.get('include_deleted', False)):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(Book, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
+
 class ExchangeRequest(db.Model):
     __tablename__ = 'exchange_request'
     id = db.Column(db.Integer, primary_key=True)
@@ -82,13 +183,19 @@ class ExchangeRequest(db.Model):
     delivery_method = db.Column(db.String(50), nullable=False)
     exchange_duration = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')  # e.g., pending, accepted, rejected
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], back_populates='sent_exchange_requests')
     receiver = db.relationship('User', foreign_keys=[receiver_id], back_populates='received_exchange_requests')
     book = db.relationship('Book', back_populates='exchange_requests')
     
+    __table_args__ = (
+        # At most one pending request per sender and book
+        db.Index('uq_exchange_request_pending', 'sender_id', 'book_id', unique=True,
+                 postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+    )
+
 
     def __repr__(self):
         return f"ExchangeRequest(Sender ID: {self.sender_id}, Receiver ID: {self.receiver_id}, Book ID: {self.book_id}, Status: {self.status})"
@@ -99,22 +206,225 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     read = db.Column(db.Boolean, default=False, nullable=False)
 
     def __repr__(self):
         return f"Message(From: {self.sender_id}, To: {self.receiver_id}, Read: {self.read})"
 
 class Transaction(db.Model):
+    """Append-only exchange event log (see app/ledger.py). Rows are never updated."""
     __tablename__ = 'transaction'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    exchange_request_id = db.Column(db.Integer, db.ForeignKey('exchange_request.id'), nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='initiated')  # Possible values: 'initiated', 'completed', 'cancelled'
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Who caused the event
+    counterparty_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)  # The other party
+    # No foreign key: the log outlives exchange requests moved to the archive
+    exchange_request_id = db.Column(db.Integer, nullable=False, index=True)
+    book_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='initiated')  # Event: 'initiated', 'accepted', 'rejected', 'cancelled', 'completed'
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     # Relationships
-    exchange_request = db.relationship('ExchangeRequest', backref='transaction', lazy=True)
+    exchange_request = db.relationship('ExchangeRequest',
+                                       primaryjoin='foreign(Transaction.exchange_request_id) == ExchangeRequest.id',
+                                       backref=db.backref('transaction', viewonly=True),
+                                       viewonly=True, lazy=True)
+    counterparty = db.relationship('User', foreign_keys=[counterparty_id], viewonly=True)
+    book = db.relationship('Book', primaryjoin='foreign(Transaction.book_id) == Book.id', viewonly=True)
 
     def __repr__(self):
         return f"Transaction(User ID: {self.user_id}, Exchange Request ID: {self.exchange_request_id}, Status: {self.status})"
+
+class ExchangeSummary(db.Model):
+    """Per-user projection of the exchange event log."""
+    __tablename__ = 'exchange_summary'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    active_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    rejected_count = db.Column(db.Integer, nullable=False, default=0)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    last_activity = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"ExchangeSummary(User ID: {self.user_id}, Active: {self.active_count})"
+
+class LedgerSnapshot(db.Model):
+    """All ExchangeSummary rows as of ``last_event_id``, as JSON."""
+    __tablename__ = 'ledger_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False)
+    summaries = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"LedgerSnapshot(Last Event ID: {self.last_event_id})"
+
+class ActivityRollup(db.Model):
+    """One metric's total for an hour or day bucket, maintained by app.rollups."""
+    __tablename__ = 'activity_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    metric = db.Column(db.String(40), nullable=False)  # e.g. 'books_listed', 'messages_sent'
+    dimension = db.Column(db.String(100), nullable=False, default='')  # e.g. the genre; '' for none
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket_start', 'metric', 'dimension', name='uq_activity_rollup_bucket'),
+    )
+
+    def __repr__(self):
+        return f"ActivityRollup({self.period} {self.bucket_start}: {self.metric}[{self.dimension}] = {self.value})"
+
+class RollupWatermark(db.Model):
+    """High-water mark per rollup source: every row older than ``high_water`` is counted."""
+    __tablename__ = 'rollup_watermark'
+    source = db.Column(db.String(40), primary_key=True)
+    high_water = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"RollupWatermark({self.source}: {self.high_water})"
+
+class ChangeLog(db.Model):
+    """One insert, update or delete of a synced row (app.sync); ``id`` is the sync version."""
+    __tablename__ = 'change_log'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # 'book', 'exchange_request', 'message', 'profile'
+    entity_id = db.Column(db.Integer, nullable=False)  # Profiles are keyed by user_id, as in the API
+    op = db.Column(db.String(10), nullable=False)  # 'insert', 'update' or 'delete'
+    # Users who may see a private row (sender and receiver); NULL for public rows
+    party_id = db.Column(db.Integer, nullable=True)
+    counterparty_id = db.Column(db.Integer, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_entity', 'entity', 'entity_id'),
+    )
+
+    def __repr__(self):
+        return f"ChangeLog({self.id}: {self.op} {self.entity} {self.entity_id})"
+
+class IdempotencyKey(db.Model):
+    """A submitted idempotency key and the response to replay for it (app.idempotency)."""
+    __tablename__ = 'idempotency_key'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(50), nullable=False)  # The endpoint the key was used on
+    key = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)  # NULL for anonymous requests (registration)
+    # The response given; NULL between the view's commit and storing its response
+    status_code = db.Column(db.Integer, nullable=True)
+    location = db.Column(db.String(500), nullable=True)
+    flashes = db.Column(db.JSON, nullable=True)  # [[category, message], ...] flashed by the response
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_key_scope_key'),
+    )
+
+    def __repr__(self):
+        return f"IdempotencyKey({self.scope}: {self.key} -> {self.status_code})"
+
+class UserImport(db.Model):
+    """A CSV uploaded on the import page, run by ``flask users run-imports`` (app.provisioning)."""
+    __tablename__ = 'user_import'
+    id = db.Column(db.Integer, primary_key=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    csv = db.Column(db.Text, nullable=True)  # The uploaded file, cleared once it has run
+    report = db.Column(db.JSON, nullable=True)  # ImportReport.as_dict() of a finished import
+    error = db.Column(db.String(500), nullable=True)  # Why a failed import stopped
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"UserImport({self.id}: {self.status})"
+
+class UploadDeletion(db.Model):
+    """An upload queued for deletion; app.sweeper removes the file once nothing uses it."""
+    __tablename__ = 'upload_deletion'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'books' or 'profile'
+    key = db.Column(db.String(100), nullable=False)
+    requested_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"UploadDeletion({self.kind}/{self.key})"
+
+class Wish(db.Model):
+    """One entry of a profile's ``books_wanted``, indexed by app.wishlist."""
+    __tablename__ = 'wish'
+    id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    text = db.Column(db.String(200), nullable=False)  # The entry as the user wrote it
+    term_count = db.Column(db.Integer, nullable=False)  # Distinct terms; a book must contain all of them
+
+    def __repr__(self):
+        return f"Wish(User ID: {self.user_id}, '{self.text}')"
+
+class WishTerm(db.Model):
+    """Inverted index from a term to the wishes containing it."""
+    __tablename__ = 'wish_term'
+    term = db.Column(db.String(50), primary_key=True)
+    wish_id = db.Column(db.Integer, db.ForeignKey('wish.id', ondelete='CASCADE'), primary_key=True)
+
+    def __repr__(self):
+        return f"WishTerm('{self.term}', Wish ID: {self.wish_id})"
+
+class WishlistAlert(db.Model):
+    """A newly listed book matching someone's wish; queued until emailed."""
+    __tablename__ = 'wishlist_alert'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
+    wish = db.Column(db.String(200), nullable=False)  # Copy of the matching entry
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    notified_at = db.Column(db.DateTime, nullable=True, index=True)  # NULL while queued
+
+    # Relationships
+    book = db.relationship('Book', viewonly=True)
+
+    def __repr__(self):
+        return f"WishlistAlert(User ID: {self.user_id}, Book ID: {self.book_id})"
+
+
+class MessageArchive(db.Model):
+    """Cold storage for messages moved out of ``message`` by app.archive."""
+    __tablename__ = 'message_archive'
+    id = db.Column(db.Integer, primary_key=True)  # Keeps the original message id
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    read = db.Column(db.Boolean, default=False, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Relationships (read-only, templates render archived rows like live ones)
+    sender = db.relationship('User', foreign_keys=[sender_id], viewonly=True)
+    receiver = db.relationship('User', foreign_keys=[receiver_id], viewonly=True)
+
+    def __repr__(self):
+        return f"MessageArchive(From: {self.sender_id}, To: {self.receiver_id}, Read: {self.read})"
+
+class ExchangeRequestArchive(db.Model):
+    """Cold storage for exchange requests in a terminal state."""
+    __tablename__ = 'exchange_request_archive'
+    id = db.Column(db.Integer, primary_key=True)  # Keeps the original exchange request id
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    delivery_method = db.Column(db.String(50), nullable=False)
+    exchange_duration = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Relationships
+    sender = db.relationship('User', foreign_keys=[sender_id], viewonly=True)
+    receiver = db.relationship('User', foreign_keys=[receiver_id], viewonly=True)
+    book = db.relationship('Book', viewonly=True)
+
+    def __repr__(self):
+        return f"ExchangeRequestArchive(Sender ID: {self.sender_id}, Receiver ID: {self.receiver_id}, Book ID: {self.book_id}, Status: {self.status})"
@@ -0,0 +1,137 @@
+# app/projections.py
+"""Read-only row projections for list pages.
+
+List views only show a few columns, yet loading ORM objects builds full
+instances with attribute instrumentation and registers every one in the
+session's identity map. The functions here select just the columns a page
+renders, joined with the usernames it shows, and turn each row into a plain
+named tuple. Nothing is tracked by the session, and there is nothing to
+lazy-load by accident.
+
+Each function returns a :class:`RowQuery`. It supports the small part of the
+``Query`` API that the views and ``paginate_with_archive`` use (``offset``,
+``limit``, ``order_by``, ``count``, ``all``, ``yield_per``, ``paginate``),
+so it can stand in for the ORM queries it replaces. Use the ORM for
+anything that writes.
+
+``flask bench projections`` measures the difference.
+"""
+
+from collections import namedtuple
+
+from flask_sqlalchemy.pagination import QueryPagination
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.lookups import authors, genres
+from app.models import Book, ExchangeRequest, ExchangeRequestArchive, Message, MessageArchive, User
+
+BookRow = namedtuple('BookRow', 'id title author genre condition availability_status location '
+                                'cover_image date_posted user_id')
+MessageRow = namedtuple('MessageRow', 'id sender_id sender_name receiver_id receiver_name content timestamp read')
+ExchangeRow = namedtuple('ExchangeRow', 'id book_id book_title sender_id sender_name receiver_id receiver_name '
+                                        'delivery_method exchange_duration status timestamp')
+
+
+class RowQuery:
+    """An immutable Core ``select`` plus the function that turns its rows into tuples."""
+
+    __slots__ = ('statement', 'make')
+
+    def __init__(self, statement, make):
+        self.statement = statement
+        self.make = make
+
+    def _derive(self, statement):
+        return RowQuery(statement, self.make)
+
+    def offset(self, offset):
+        return self._derive(self.statement.offset(offset))
+
+    def limit(self, limit):
+        return self._derive(self.statement.limit(limit))
+
+    def order_by(self, *clauses):
+        return self._derive(self.statement.order_by(*clauses))
+
+    def yield_per(self, count):
+        """Fetch rows in chunks of ``count`` while iterating, for streamed pages."""
+        return self._derive(self.statement.execution_options(yield_per=count))
+
+    def count(self):
+        subquery = self.statement.order_by(None).subquery()
+        return db.session.execute(select(func.count()).select_from(subquery)).scalar()
+
+    def all(self):
+        return list(self)
+
+    def __iter__(self):
+        make = self.make
+        for row in db.session.execute(self.statement):
+            yield make(row)
+
+    def paginate(self, page=1, per_page=20, error_out=False):
+        """A Flask-SQLAlchemy Pagination (with ``iter_pages``) of these rows."""
+        return QueryPagination(query=self, page=page, per_page=per_page, error_out=error_out)
+
+
+def _book_row(row):
+    # author/genre ids resolve through the in-memory lookup cache, not a join
+    return BookRow(row.id, row.title, authors.name(row.author_id), genres.name(row.genre_id), row.condition,
+                   row.availability_status, row.location, row.cover_image, row.date_posted, row.user_id)
+
+
+def books_owned_by(user_id):
+    """The user's books, newest first."""
+    statement = select(Book.id, Book.title, Book.author_id, Book.genre_id, Book.condition,
+                       Book.availability_status, Book.location, Book.cover_image, Book.date_posted,
+                       Book.user_id) \
+        .where(Book.user_id == user_id) \
+        .order_by(Book.date_posted.desc(), Book.id.desc())
+    return RowQuery(statement, _book_row)
+
+
+def _messages(model, *criteria):
+    sender, receiver = aliased(User), aliased(User)
+    statement = select(model.id, model.sender_id, sender.username, model.receiver_id, receiver.username,
+                       model.content, model.timestamp, model.read) \
+        .join(sender, sender.id == model.sender_id) \
+        .join(receiver, receiver.id == model.receiver_id) \
+        .where(*criteria) \
+        .order_by(model.timestamp.desc(), model.id.desc())
+    return RowQuery(statement, MessageRow._make)
+
+
+def messages_received(user_id, archived=False):
+    """Messages to the user, newest first; ``archived`` reads the archive table instead."""
+    model = MessageArchive if archived else Message
+    return _messages(model, model.receiver_id == user_id)
+
+
+def messages_sent(user_id, archived=False):
+    """Messages from the user, newest first; ``archived`` reads the archive table instead."""
+    model = MessageArchive if archived else Message
+    return _messages(model, model.sender_id == user_id)
+
+
+def exchange_requests(sender_id=None, receiver_id=None, statuses=None, archived=False):
+    """Exchange requests sent and/or received by a user, newest first."""
+    model = ExchangeRequestArchive if archived else ExchangeRequest
+    sender, receiver = aliased(User), aliased(User)
+    criteria = []
+    if sender_id is not None:
+        criteria.append(model.sender_id == sender_id)
+    if receiver_id is not None:
+        criteria.append(model.receiver_id == receiver_id)
+    if statuses is not None:
+        criteria.append(model.status.in_(statuses))
+    statement = select(model.id, model.book_id, Book.title, model.sender_id, sender.username,
+                       model.receiver_id, receiver.username, model.delivery_method,
+                       model.exchange_duration, model.status, model.timestamp) \
+        .outerjoin(Book, Book.id == model.book_id) \
+        .join(sender, sender.id == model.sender_id) \
+        .join(receiver, receiver.id == model.receiver_id) \
+        .where(*criteria) \
+        .order_by(model.timestamp.desc(), model.id.desc())
+    return RowQuery(statement, ExchangeRow._make)
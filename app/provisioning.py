@@ -0,0 +1,281 @@
+# app/provisioning.py
+"""Bulk user provisioning from CSV.
+
+``flask users import members.csv`` creates many accounts at once. The
+``auth.import_users`` page only queues an uploaded file (a ``user_import``
+row) and answers 202; ``flask users run-imports`` runs queued files, so a
+web worker never hashes thousands of passwords or forks a process pool.
+The CSV needs a ``username`` and ``email`` column. It may also have ``password``, ``reading_preferences``,
+``favorite_genres`` and ``books_wanted`` columns. Rows without a password
+get a random one, and those users set their own through the password reset
+flow.
+
+The input is read as a stream, ``IMPORT_BATCH_SIZE`` rows at a time. For
+each batch:
+
+* existing usernames and emails are found with one ``IN`` query each, not
+  one query per row;
+* passwords are hashed across a process pool, since hashing dominates the
+  cost;
+* ``User`` and ``Profile`` rows are inserted with two multi-row statements
+  in a single transaction.
+"""
+
+import csv
+import io
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Profile, User, UserImport
+from app.sync import log_changes
+from app.wishlist import index_profile
+
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+PROFILE_FIELDS = ('reading_preferences', 'favorite_genres', 'books_wanted')
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.existing = 0  # Username or email already registered
+        self.duplicates = 0  # Repeated earlier in the same file
+        self.invalid = 0
+        self.generated_passwords = 0
+        self.errors = []  # (line number, message), capped at MAX_REPORTED_ERRORS
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rate(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"Created {self.created} users in {self.elapsed:.1f}s ({self.rate:.0f}/s); "
+                f"skipped {self.existing} existing, {self.duplicates} duplicate and "
+                f"{self.invalid} invalid rows; {self.generated_passwords} need a password reset.")
+
+    def as_dict(self):
+        """The counts and errors, as stored on a finished :class:`UserImport`."""
+        return {'created': self.created, 'existing': self.existing, 'duplicates': self.duplicates,
+                'invalid': self.invalid, 'generated_passwords': self.generated_passwords,
+                'errors': self.errors, 'elapsed': self.elapsed, 'rate': self.rate,
+                'summary': self.summary()}
+
+
+def _clean(line, row, report):
+    username = (row.get('username') or '').strip()
+    email = (row.get('email') or '').strip()
+    if not 2 <= len(username) <= 20:
+        report.error(line, 'username must be 2 to 20 characters')
+        return None
+    if len(email) > 120 or not EMAIL_RE.match(email):
+        report.error(line, 'invalid email address')
+        return None
+    password = row.get('password') or ''
+    if not password:
+        password = secrets.token_urlsafe(24)
+        report.generated_passwords += 1
+    profile = {field: (row.get(field) or '').strip() for field in PROFILE_FIELDS}
+    return {'username': username, 'email': email, 'password': password, 'profile': profile}
+
+
+def _existing(column, values):
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
+
+
+def _insert(batch, hashes):
+    """Insert one batch of users and their profiles in a single transaction."""
+    users = db.session.execute(
+        insert(User).returning(User.id, User.username),
+        [{'username': row['username'], 'email': row['email'], 'password_hash': password_hash}
+         for row, password_hash in zip(batch, hashes)],
+    )
+    ids = {username: user_id for user_id, username in users}
+    profiles = db.session.execute(
+        insert(Profile).returning(Profile.id, Profile.user_id, Profile.books_wanted),
+        [dict(row['profile'], user_id=ids[row['username']]) for row in batch],
+    )
+    # Bulk inserts skip the ORM events that index wishlists and feed the sync log
+    connection = db.session.connection()
+    profiles = profiles.all()
+    for profile_id, user_id, books_wanted in profiles:
+        if books_wanted:
+            index_profile(connection, profile_id, user_id, books_wanted)
+    log_changes(Profile, 'insert', profiles)
+    db.session.commit()
+
+
+def _check_header(fieldnames):
+    if not fieldnames or not {'username', 'email'} <= set(fieldnames):
+        raise ValueError('CSV needs a header row with username and email columns.')
+
+
+def import_users(lines, batch_size=None, workers=None):
+    """Create users from the CSV text stream ``lines``. Returns an :class:`ImportReport`."""
+    config = current_app.config
+    batch_size = batch_size or config['IMPORT_BATCH_SIZE']
+    workers = workers or config.get('IMPORT_HASH_WORKERS') or os.cpu_count() or 1
+    report = ImportReport()
+    reader = csv.DictReader(lines)
+    _check_header(reader.fieldnames)
+    numbered = ((reader.line_num, row) for row in reader)
+    seen_usernames, seen_emails = set(), set()
+
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while True:
+            chunk = list(islice(numbered, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for line, row in chunk:
+                cleaned = _clean(line, row, report)
+                if cleaned is None:
+                    continue
+                if cleaned['username'] in seen_usernames or cleaned['email'] in seen_emails:
+                    report.duplicates += 1
+                    continue
+                seen_usernames.add(cleaned['username'])
+                seen_emails.add(cleaned['email'])
+                batch.append(cleaned)
+
+            taken_usernames = _existing(User.username, [row['username'] for row in batch])
+            taken_emails = _existing(User.email, [row['email'] for row in batch])
+            fresh = [row for row in batch
+                     if row['username'] not in taken_usernames and row['email'] not in taken_emails]
+            report.existing += len(batch) - len(fresh)
+            if not fresh:
+                continue
+
+            passwords = [row['password'] for row in fresh]
+            if pool:
+                hashes = list(pool.map(generate_password_hash, passwords,
+                                       chunksize=max(1, len(passwords) // (workers * 4))))
+            else:
+                hashes = [generate_password_hash(password) for password in passwords]
+            try:
+                _insert(fresh, hashes)
+            except IntegrityError:
+                # Someone registered one of these names since the check; redo the batch without them
+                db.session.rollback()
+                taken_usernames = _existing(User.username, [row['username'] for row in fresh])
+                taken_emails = _existing(User.email, [row['email'] for row in fresh])
+                keep = [i for i, row in enumerate(fresh)
+                        if row['username'] not in taken_usernames and row['email'] not in taken_emails]
+                report.existing += len(fresh) - len(keep)
+                fresh, hashes = [fresh[i] for i in keep], [hashes[i] for i in keep]
+                if fresh:
+                    _insert(fresh, hashes)
+            report.created += len(fresh)
+    finally:
+        if pool:
+            pool.shutdown()
+        report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def queue_import(text, requested_by):
+    """Queue the CSV ``text`` for ``flask users run-imports``. Returns the :class:`UserImport`.
+
+    Only the header is checked here; rows are validated when the import runs.
+    """
+    _check_header(next(csv.reader(io.StringIO(text)), None))
+    queued = UserImport.query.filter_by(requested_by=requested_by, status='queued').count()
+    if queued >= current_app.config['IMPORT_MAX_QUEUED']:
+        raise ValueError(f'You already have {queued} imports waiting to run.')
+    job = UserImport(requested_by=requested_by, csv=text)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _claim_next():
+    """Mark the oldest queued import as running and return it, or None if there is none."""
+    while True:
+        job = UserImport.query.filter_by(status='queued').order_by(UserImport.id).first()
+        if job is None:
+            return None
+        # Conditional, so two runners never take the same import
+        claimed = db.session.execute(update(UserImport).where(UserImport.id == job.id, UserImport.status == 'queued')
+                                     .values(status='running')).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(UserImport, job.id)
+
+
+def run_queued_imports(batch_size=None, workers=None):
+    """Run every queued import, oldest first. Returns the finished :class:`UserImport` rows."""
+    finished = []
+    while (job := _claim_next()) is not None:
+        try:
+            job.report = import_users(io.StringIO(job.csv), batch_size=batch_size, workers=workers).as_dict()
+            job.status = 'done'
+        except ValueError as error:
+            db.session.rollback()
+            job.status, job.error = 'failed', str(error)[:500]
+        except Exception:
+            db.session.rollback()
+            job.status, job.error = 'failed', 'The import stopped unexpectedly; earlier batches were created.'
+            raise
+        finally:
+            job.csv, job.finished_at = None, datetime.utcnow()
+            db.session.commit()
+        finished.append(job)
+    return finished
+
+
+@users_cli.command('import')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', type=int, default=None, help='Users inserted per transaction.')
+@click.option('--workers', type=int, default=None, help='Password hashing processes.')
+def import_command(csv_file, batch_size, workers):
+    """Create users (and empty profiles) from a CSV file."""
+    try:
+        report = import_users(csv_file, batch_size=batch_size, workers=workers)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    for line, message in report.errors:
+        click.echo(f"line {line}: {message}", err=True)
+    click.echo(report.summary())
+
+
+@users_cli.command('run-imports')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, checking for queued imports every INTERVAL seconds.')
+def run_imports_command(interval):
+    """Run the imports queued from the import page."""
+    while True:
+        try:
+            for job in run_queued_imports():
+                click.echo(f"Import {job.id}: {job.report['summary'] if job.report else job.error}")
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Queued user import failed; continuing next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
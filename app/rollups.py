@@ -0,0 +1,230 @@
+# app/rollups.py
+"""Incremental hourly and daily activity rollups.
+
+Reporting never scans ``book``, ``exchange_request`` or ``message``. A
+background job (``flask rollups run``, from cron or with ``--loop``) counts
+only the rows that arrived since the last run, adds them to
+``activity_rollup``, and advances that source's high-water mark in
+``rollup_watermark`` in the same transaction. A crashed run therefore just
+repeats its window. Each window is counted while the source's watermark
+row is locked, and counts are added with ``INSERT ... ON CONFLICT DO
+UPDATE SET value = value + excluded.value``, so overlapping runs take turns
+instead of counting a window twice or losing increments.
+
+Rows are counted once they are ``ROLLUP_SETTLE_SECONDS`` old. That margin
+covers transactions which commit after rows with later timestamps were
+already counted. Messages and exchange requests moved to the archive
+tables are counted too, and so are tombstoned books, so ``flask rollups
+backfill`` rebuilds the same totals the incremental runs produced.
+"""
+
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+
+from app import db
+from app.lookups import genres
+from app.models import (
+    ActivityRollup,
+    Book,
+    ExchangeRequest,
+    ExchangeRequestArchive,
+    Message,
+    MessageArchive,
+    RollupWatermark,
+    Transaction,
+)
+
+rollups_cli = AppGroup('rollups', help='Maintain the activity rollup tables.')
+
+PERIODS = ('hour', 'day')
+PERIOD_LENGTHS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# ``metrics`` maps a row's ``fields`` to the (metric, dimension) pairs it counts towards
+Source = namedtuple('Source', 'name models time_field fields metrics')
+SOURCES = (
+    Source('book', (Book,), 'date_posted', ('genre_id',),
+           lambda genre_id: [('books_listed', genres.name(genre_id) or '')]),
+    Source('exchange_request', (ExchangeRequest, ExchangeRequestArchive), 'timestamp', (),
+           lambda: [('exchanges_requested', '')]),
+    # Outcomes come from the exchange ledger, since a request's status changes
+    # long after its own timestamp
+    Source('exchange_event', (Transaction,), 'timestamp', ('status',),
+           lambda status: [] if status == 'initiated' else [(f'exchanges_{status}', '')]),
+    Source('message', (Message, MessageArchive), 'timestamp', (),
+           lambda: [('messages_sent', '')]),
+)
+METRICS = ('books_listed', 'exchanges_requested', 'exchanges_accepted', 'exchanges_rejected',
+           'exchanges_cancelled', 'exchanges_completed', 'messages_sent')
+
+
+def bucket_start(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _earliest(source):
+    values = [db.session.query(func.min(getattr(model, source.time_field)))
+              .execution_options(include_deleted=True).scalar()
+              for model in source.models]
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def _count_window(source, lower, upper):
+    """Count ``source`` rows with ``lower <= time < upper`` into rollup keys."""
+    counts = Counter()
+    rows = 0
+    for model in source.models:
+        moment = getattr(model, source.time_field)
+        # Books deleted since they were listed still count, as they did when the window first ran
+        query = db.session.query(moment, *[getattr(model, field) for field in source.fields]) \
+            .filter(moment >= lower, moment < upper).execution_options(include_deleted=True)
+        for row in query.yield_per(1000):
+            rows += 1
+            for metric, dimension in source.metrics(*row[1:]):
+                for period in PERIODS:
+                    counts[(period, bucket_start(row[0], period), metric, dimension)] += 1
+    return counts, rows
+
+
+def _merge(counts):
+    """Add ``counts`` onto the stored rollups with atomic SQL increments."""
+    if not counts:
+        return
+    rows = [{'period': period, 'bucket_start': start, 'metric': metric, 'dimension': dimension, 'value': value}
+            for (period, start, metric, dimension), value in counts.items()]
+    table = ActivityRollup.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                update(table).where(table.c.period == row['period'], table.c.bucket_start == row['bucket_start'],
+                                    table.c.metric == row['metric'], table.c.dimension == row['dimension'])
+                .values(value=table.c.value + row['value']))
+            if not updated.rowcount:
+                db.session.execute(table.insert().values(row))
+        return
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['period', 'bucket_start', 'metric', 'dimension'],
+        set_={'value': table.c.value + statement.excluded.value})
+    db.session.execute(statement, rows)
+
+
+def _locked_watermark(source):
+    """``source``'s watermark, read afresh and locked until the next commit."""
+    return db.session.get(RollupWatermark, source.name, with_for_update=True, populate_existing=True)
+
+
+def update_source(source, now=None):
+    """Roll up ``source`` rows past its high-water mark. Returns the rows counted."""
+    config = current_app.config
+    upper = (now or datetime.utcnow()) - timedelta(seconds=config['ROLLUP_SETTLE_SECONDS'])
+    step = timedelta(hours=config['ROLLUP_WINDOW_HOURS'])
+    mark = _locked_watermark(source)
+    if mark is None:
+        earliest = _earliest(source)
+        if earliest is None:
+            db.session.rollback()
+            return 0
+        mark = RollupWatermark(source=source.name, high_water=bucket_start(earliest, 'hour'))
+        db.session.add(mark)
+
+    counted = 0
+    while mark.high_water < upper:
+        end = min(mark.high_water + step, upper)
+        counts, rows = _count_window(source, mark.high_water, end)
+        _merge(counts)
+        mark.high_water = end
+        db.session.commit()
+        counted += rows
+        mark = _locked_watermark(source)
+    db.session.rollback()  # Release the lock
+    return counted
+
+
+def run_rollups(now=None):
+    return {source.name: update_source(source, now) for source in SOURCES}
+
+
+def backfill(since=None, now=None):
+    """Recount everything from the day of ``since`` (default: all history)."""
+    query = ActivityRollup.query
+    if since is not None:
+        since = bucket_start(since, 'day')
+        query = query.filter(ActivityRollup.bucket_start >= since)
+    query.delete()
+    for mark in RollupWatermark.query:
+        if since is None:
+            db.session.delete(mark)
+        elif mark.high_water > since:
+            mark.high_water = since
+    db.session.commit()
+    return run_rollups(now)
+
+
+def summarize(period, start, end):
+    """Read the rollups between ``start`` and ``end`` for the dashboard.
+
+    Returns ``(buckets, totals, genres)``: one ``{'start', metric: value}``
+    dict per bucket, oldest first, the totals per metric, and
+    ``[(genre, books listed)]`` biggest first.
+    """
+    buckets = {}
+    totals = dict.fromkeys(METRICS, 0)
+    genres = Counter()
+    rows = ActivityRollup.query.filter(
+        ActivityRollup.period == period,
+        ActivityRollup.bucket_start >= start,
+        ActivityRollup.bucket_start < end,
+    )
+    for row in rows:
+        bucket = buckets.setdefault(row.bucket_start, dict.fromkeys(METRICS, 0))
+        bucket[row.metric] += row.value
+        totals[row.metric] += row.value
+        if row.metric == 'books_listed':
+            genres[row.dimension] += row.value
+    series = [dict(values, start=moment) for moment, values in sorted(buckets.items())]
+    for values in series + [totals]:
+        decided = values['exchanges_accepted'] + values['exchanges_rejected']
+        values['acceptance_rate'] = values['exchanges_accepted'] / decided if decided else None
+    return series, totals, genres.most_common()
+
+
+@rollups_cli.command('run')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, updating every INTERVAL seconds.')
+def run_command(interval):
+    """Count activity since the last run into the rollup tables."""
+    while True:
+        try:
+            counted = run_rollups()
+            click.echo(', '.join(f"{name}: {rows}" for name, rows in counted.items()))
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Rollup run failed; retrying next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
+
+
+@rollups_cli.command('backfill')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only recount from this day (default: all history).')
+def backfill_command(since):
+    """Rebuild the rollups from the source tables."""
+    counted = backfill(since)
+    click.echo(', '.join(f"{name}: {rows}" for name, rows in counted.items()))
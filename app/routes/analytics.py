@@ -0,0 +1,66 @@
+# app/routes/analytics.py
+import csv
+import io
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from flask_login import login_required, current_user
+
+from app.models import ActivityRollup
+from app.rollups import PERIODS, PERIOD_LENGTHS, bucket_start, summarize
+from app.streaming import render_page
+
+analytics_bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+
+@analytics_bp.before_request
+@login_required
+def require_analyst():
+    # Site-wide figures: only the listed users, and nobody while the list is empty
+    if current_user.username not in current_app.config.get('ANALYTICS_USERS', []):
+        abort(403)
+
+
+def _report_range():
+    """Period and ``[start, end)`` window from the query string; everything reads rollups only."""
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        period = 'day'
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    end = bucket_start(datetime.utcnow(), period) + PERIOD_LENGTHS[period]
+    start = bucket_start(end - timedelta(days=days), 'day')
+    return period, days, start, end
+
+
+@analytics_bp.route('/')
+def dashboard():
+    period, days, start, end = _report_range()
+    series, totals, genres = summarize(period, start, end)
+    return render_page('analytics/dashboard.html', period=period, days=days,
+                       series=series, totals=totals, genres=genres)
+
+
+@analytics_bp.route('/export.csv')
+def export_csv():
+    period, days, start, end = _report_range()
+    rows = ActivityRollup.query.filter(
+        ActivityRollup.period == period,
+        ActivityRollup.bucket_start >= start,
+        ActivityRollup.bucket_start < end,
+    ).order_by(ActivityRollup.bucket_start, ActivityRollup.metric, ActivityRollup.dimension)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['bucket_start', 'period', 'metric', 'dimension', 'value'])
+        for row in rows.yield_per(1000):
+            writer.writerow([row.bucket_start.isoformat(), row.period, row.metric, row.dimension, row.value])
+            if buffer.tell() > 8192:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    filename = f"activity_{period}_{start:%Y%m%d}_{end:%Y%m%d}.csv"
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
@@ -0,0 +1,266 @@
+# app/routes/api.py
+"""Versioned read-only JSON API.
+
+Every list endpoint accepts ``fields=`` (a comma separated sparse fieldset that
+becomes a column-limited SELECT), ``limit=`` and ``cursor=`` (keyset pagination
+on ``id``, newest first). Responses carry a strong ETag and answer
+``If-None-Match`` with 304.
+
+``/sync?since=<version>`` returns only the rows changed since an earlier
+response, from the change log kept by app.sync.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import current_user
+from sqlalchemy import select, or_
+
+from app import db
+from app.sync import changes_since
+from app.lookups import genres
+from app.models import Book, ExchangeRequest, Message, Profile
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_BATCH_IDS = 100
+
+# Columns each resource exposes; ``fields=`` may only pick from these.
+BOOK_FIELDS = ('id', 'title', 'author', 'genre', 'condition', 'availability_status',
+               'location', 'cover_image', 'date_posted', 'user_id')
+EXCHANGE_FIELDS = ('id', 'sender_id', 'receiver_id', 'book_id', 'delivery_method',
+                   'exchange_duration', 'status', 'timestamp')
+MESSAGE_FIELDS = ('id', 'sender_id', 'receiver_id', 'content', 'timestamp', 'read')
+PROFILE_FIELDS = ('user_id', 'reading_preferences', 'favorite_genres', 'books_wanted')
+
+# Synced entity -> (model, fields, key); the key comes first in ``fields``
+SYNC_RESOURCES = {
+    'book': (Book, BOOK_FIELDS, 'id'),
+    'exchange_request': (ExchangeRequest, EXCHANGE_FIELDS, 'id'),
+    'message': (Message, MESSAGE_FIELDS, 'id'),
+    'profile': (Profile, PROFILE_FIELDS, 'user_id'),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({'error': error.message}), error.status
+
+
+@api_bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Authentication required.'}), 401
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _columns(model, allowed, key='id'):
+    """Resolve ``fields=`` to model columns, always including the key column."""
+    requested = request.args.get('fields')
+    if not requested:
+        names = list(allowed)
+    else:
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+        if key not in names:
+            names.insert(0, key)
+    return [getattr(model, name) for name in names]
+
+
+def _rows(statement):
+    return [{name: _serialize(value) for name, value in row._mapping.items()}
+            for row in db.session.execute(statement)]
+
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f"'{name}' must be an integer.")
+
+
+def _json_response(payload):
+    """JSON response with an ETag over the body, honouring If-None-Match.
+
+    The ETag is strong; CompressionMiddleware weakens it when it compresses the body.
+    """
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(hashlib.sha1(body.encode('utf-8')).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def _page(model, allowed, *criteria):
+    """Keyset-paginated, column-limited listing of ``model`` ordered by id desc."""
+    limit = min(max(_int_arg('limit', DEFAULT_LIMIT), 1), MAX_LIMIT)
+    cursor = _int_arg('cursor')
+    statement = select(*_columns(model, allowed)).where(*criteria)
+    if cursor is not None:
+        statement = statement.where(model.id < cursor)
+    rows = _rows(statement.order_by(model.id.desc()).limit(limit + 1))
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return _json_response({'data': rows[:limit], 'next_cursor': next_cursor})
+
+
+def _batch_ids():
+    raw = request.args.get('ids', '')
+    try:
+        ids = sorted({int(value) for value in raw.split(',') if value.strip()})
+    except ValueError:
+        raise ApiError("'ids' must be a comma separated list of integers.")
+    if not ids:
+        raise ApiError("'ids' is required.")
+    if len(ids) > MAX_BATCH_IDS:
+        raise ApiError(f"At most {MAX_BATCH_IDS} ids per batch.")
+    return ids
+
+
+def _one(statement):
+    rows = _rows(statement)
+    if not rows:
+        raise ApiError('Not found.', 404)
+    return _json_response({'data': rows[0]})
+
+
+@api_bp.route('/books', methods=['GET'])
+def list_books():
+    """All books, optionally filtered by owner, genre or availability."""
+    criteria = []
+    user_id = _int_arg('user_id')
+    if user_id is not None:
+        criteria.append(Book.user_id == user_id)
+    if request.args.get('genre'):
+        criteria.append(Book.genre_id == genres.id_for(request.args['genre']))
+    if request.args.get('availability_status'):
+        criteria.append(Book.availability_status == request.args['availability_status'])
+    return _page(Book, BOOK_FIELDS, *criteria)
+
+
+@api_bp.route('/books/<int:book_id>', methods=['GET'])
+def get_book(book_id):
+    return _one(select(*_columns(Book, BOOK_FIELDS)).where(Book.id == book_id))
+
+
+@api_bp.route('/books/batch', methods=['GET'])
+def batch_books():
+    """Fetch many books by id in one call: ``/books/batch?ids=1,2,3``."""
+    ids = _batch_ids()
+    rows = _rows(select(*_columns(Book, BOOK_FIELDS)).where(Book.id.in_(ids)).order_by(Book.id))
+    found = {row['id'] for row in rows}
+    return _json_response({'data': rows, 'missing': [i for i in ids if i not in found]})
+
+
+@api_bp.route('/exchange-requests', methods=['GET'])
+def list_exchange_requests():
+    """The current user's exchange requests; ``box`` is ``received``, ``sent`` or ``all``."""
+    box = request.args.get('box', 'all')
+    if box == 'received':
+        criteria = [ExchangeRequest.receiver_id == current_user.id]
+    elif box == 'sent':
+        criteria = [ExchangeRequest.sender_id == current_user.id]
+    elif box == 'all':
+        criteria = [or_(ExchangeRequest.sender_id == current_user.id,
+                        ExchangeRequest.receiver_id == current_user.id)]
+    else:
+        raise ApiError("'box' must be one of received, sent, all.")
+    if request.args.get('status'):
+        criteria.append(ExchangeRequest.status == request.args['status'])
+    return _page(ExchangeRequest, EXCHANGE_FIELDS, *criteria)
+
+
+@api_bp.route('/exchange-requests/<int:request_id>', methods=['GET'])
+def get_exchange_request(request_id):
+    return _one(select(*_columns(ExchangeRequest, EXCHANGE_FIELDS)).where(
+        ExchangeRequest.id == request_id,
+        or_(ExchangeRequest.sender_id == current_user.id,
+            ExchangeRequest.receiver_id == current_user.id)))
+
+
+@api_bp.route('/messages', methods=['GET'])
+def list_messages():
+    """The current user's messages; ``box`` is ``inbox`` or ``sent``."""
+    box = request.args.get('box', 'inbox')
+    if box == 'inbox':
+        criteria = [Message.receiver_id == current_user.id]
+    elif box == 'sent':
+        criteria = [Message.sender_id == current_user.id]
+    else:
+        raise ApiError("'box' must be one of inbox, sent.")
+    other_user_id = _int_arg('with')
+    if other_user_id is not None:
+        criteria.append(or_(Message.sender_id == other_user_id, Message.receiver_id == other_user_id))
+    return _page(Message, MESSAGE_FIELDS, *criteria)
+
+
+@api_bp.route('/profiles/me', methods=['GET'])
+def get_own_profile():
+    return get_profile(current_user.id)
+
+
+@api_bp.route('/profiles/<int:user_id>', methods=['GET'])
+def get_profile(user_id):
+    return _one(select(*_columns(Profile, PROFILE_FIELDS, key='user_id')).where(Profile.user_id == user_id))
+
+
+@api_bp.route('/profiles/batch', methods=['GET'])
+def batch_profiles():
+    """Fetch many profiles by user id in one call: ``/profiles/batch?ids=1,2``."""
+    ids = _batch_ids()
+    rows = _rows(select(*_columns(Profile, PROFILE_FIELDS, key='user_id'))
+                 .where(Profile.user_id.in_(ids)).order_by(Profile.user_id))
+    found = {row['user_id'] for row in rows}
+    return _json_response({'data': rows, 'missing': [i for i in ids if i not in found]})
+
+
+@api_bp.route('/sync', methods=['GET'])
+def sync():
+    """Rows changed since ``since=`` (0, or the ``version`` of the previous response).
+
+    Each entity lists its ``fields`` once, then ``inserted`` and ``updated``
+    rows as value arrays in that order (clients upsert both) and the
+    ``deleted`` keys. ``limit=`` (at most ``SYNC_BATCH_SIZE``) caps the rows
+    per response; while ``has_more`` is true, call again with the new version.
+    """
+    since = max(_int_arg('since', 0), 0)
+    batch_size = current_app.config['SYNC_BATCH_SIZE']
+    limit = min(max(_int_arg('limit', batch_size), 1), batch_size)
+    changes, version, has_more = changes_since(current_user.id, since, limit)
+    by_entity = {}
+    for change in changes:
+        by_entity.setdefault(change.entity, {})[change.entity_id] = change.inserted
+    payload = {}
+    for entity, ids in by_entity.items():
+        model, fields, key = SYNC_RESOURCES[entity]
+        # Tombstoned books are hidden by the soft-delete filter, so they come back as deleted
+        current = {row[0]: [_serialize(value) for value in row] for row in db.session.execute(
+            select(*[getattr(model, field) for field in fields]).where(getattr(model, key).in_(ids)))}
+        inserted, updated, deleted = [], [], []
+        for entity_id, was_inserted in ids.items():
+            if entity_id not in current:
+                deleted.append(entity_id)
+            else:
+                (inserted if was_inserted else updated).append(current[entity_id])
+        payload[entity] = {'fields': list(fields), 'inserted': inserted, 'updated': updated, 'deleted': deleted}
+    return _json_response({'version': version, 'has_more': has_more, 'changes': payload})
@@ -1,10 +1,12 @@
 # app/routes/auth.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request  # Ensure render_template is imported
-from flask_login import login_user, logout_user, login_required
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app  # Ensure render_template is imported
+from flask_login import login_user, logout_user, login_required, current_user
 from app import db, mail
-from app.models import User, Profile
-from app.forms import RegistrationForm, LoginForm, ResetRequestForm, ResetPasswordForm
+from app.models import User, Profile, UserImport
+from app.forms import RegistrationForm, LoginForm, ResetRequestForm, ResetPasswordForm, UserImportForm
+from app import provisioning
+from app.idempotency import idempotent
 from flask_mail import Message
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -23,29 +25,48 @@ If you did not make this request then simply ignore this email and no changes wi
     mail.send(msg)
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@idempotent
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Create new user
         user = User(username=form.username.data, email=form.email.data)
         user.set_password(form.password.data)
-        db.session.add(user)
-        db.session.commit()
         
-        # Create associated profile
-        profile = Profile(
+        # Create associated profile in the same transaction
+        user.profile = Profile(
             reading_preferences='',
             favorite_genres='',
-            books_wanted='',
-            user_id=user.id
+            books_wanted=''
         )
-        db.session.add(profile)
+        db.session.add(user)
         db.session.commit()
         
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
     return render_template('auth/register.html', form=form)
 
+@auth_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_users():
+    # Bulk provisioning is limited to the accounts listed in PROVISIONING_USERS
+    if current_user.username not in current_app.config.get('PROVISIONING_USERS', []):
+        abort(403)
+    form = UserImportForm()
+    status = 200
+    if form.validate_on_submit():
+        # Only queued here; `flask users run-imports` creates the accounts
+        try:
+            job = provisioning.queue_import(form.csv_file.data.read().decode('utf-8-sig'), current_user.id)
+        except (ValueError, UnicodeDecodeError) as error:
+            flash(f'Could not import users: {error}', 'danger')
+        else:
+            flash(f'Import {job.id} is queued. Its result will appear below once it has run.', 'info')
+            status = 202
+    imports = UserImport.query.filter_by(requested_by=current_user.id) \
+        .order_by(UserImport.id.desc()).limit(10).all()
+    return render_template('auth/import_users.html', form=form, imports=imports), status
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
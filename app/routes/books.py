@@ -1,13 +1,18 @@
-import os
-from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models import Book
 from app.forms import BookForm, SearchForm
-from werkzeug.utils import secure_filename
+from app.streaming import render_page
+from app.idempotency import idempotent
+from app.storage import store_upload, discard_upload
+from app.autocomplete import autocomplete, FIELDS as AUTOCOMPLETE_FIELDS
+from app.lookups import authors, genres
+from app import projections
+from app.facets import (facet_index, FACETS, FACET_LABELS, IdPagination, bitmap_from_ids, ids_from_bitmap,
+                        selection_criteria, sql_counts)
+from werkzeug.datastructures import FileStorage
 from sqlalchemy import or_
-from PIL import Image
 
 books_bp = Blueprint('books', __name__, url_prefix='/books')
 
@@ -24,41 +29,25 @@ def list_books():
     """List all books owned by the current user."""
     page = request.args.get('page', 1, type=int)
     per_page = 9  # Number of books per page
-    books_pagination = Book.query.filter_by(user_id=current_user.id).order_by(Book.date_posted.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    books_pagination = projections.books_owned_by(current_user.id).paginate(page=page, per_page=per_page)
     books = books_pagination.items
     return render_template('books/list_books.html', books=books, pagination=books_pagination)
 
 
 @books_bp.route('/add', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def add_book():
     """Add a new book."""
     form = BookForm()
     if form.validate_on_submit():
         filename = None
-        if form.cover_image.data:
+        if isinstance(form.cover_image.data, FileStorage):
             file = form.cover_image.data
             if allowed_file(file.filename):
                 try:
-                    # Secure the filename and add a timestamp for uniqueness
-                    raw_filename = secure_filename(file.filename)
-                    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                    filename = f"book_{current_user.id}_{timestamp}{os.path.splitext(raw_filename)[1]}"
-
-                    # Define the upload directory
-                    uploads_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'books')
-                    os.makedirs(uploads_dir, exist_ok=True)
-
-                    # Save the file
-                    file_path = os.path.join(uploads_dir, filename)
-                    file.save(file_path)
-                    print(f"File saved to: {file_path}")
-
-                    # Resize the image
-                    img = Image.open(file_path)
-                    img.thumbnail((300, 300))  # Resize to max 300x300 pixels
-                    img.save(file_path)
-                    print(f"Image resized and saved: {file_path}")
+                    # Resize to max 300x300 pixels and store under its content hash
+                    filename = store_upload(file, 'books')
                 except Exception as e:
                     flash(f"Failed to upload or process the image: {e}", 'danger')
                     return redirect(request.url)
@@ -81,7 +70,7 @@ def add_book():
         db.session.commit()
         flash('Book added successfully!', 'success')
         return redirect(url_for('books.list_books'))
-    return render_template('books/add_book.html', form=form)
+    return render_template('books/add_book.html', form=form, genre_names=genres.names())
 
 
 @books_bp.route('/edit/<int:book_id>', methods=['GET', 'POST'])
@@ -94,41 +83,17 @@ def edit_book(book_id):
         return redirect(url_for('books.list_books'))
     form = BookForm(obj=book)
     if form.validate_on_submit():
+        old_cover = None
         # Handle file upload
-        if form.cover_image.data:
+        if isinstance(form.cover_image.data, FileStorage):
             file = form.cover_image.data
             if allowed_file(file.filename):
                 try:
-                    # Secure the filename
-                    raw_filename = secure_filename(file.filename)
-                    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                    filename = f"book_{current_user.id}_{timestamp}{os.path.splitext(raw_filename)[1]}"
-
-                    # Define the upload directory
-                    uploads_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'books')
-                    os.makedirs(uploads_dir, exist_ok=True)
-
-                    # Save the new file
-                    file_path = os.path.join(uploads_dir, filename)
-                    file.save(file_path)
-
-                    # Resize the image
-                    img = Image.open(file_path)
-                    img.thumbnail((300, 300))
-                    img.save(file_path)
-
-                    # Delete the old file if it exists
-                    if book.cover_image:
-                        old_file_path = os.path.join(uploads_dir, book.cover_image)
-                        if os.path.exists(old_file_path):
-                            os.remove(old_file_path)
-
-                    # Update the book's cover image
-                    book.cover_image = filename
+                    # Store the resized image; the old one is queued for the sweeper
+                    old_cover = book.cover_image
+                    book.cover_image = store_upload(file, 'books')
                 except Exception as e:
                     flash(f"Failed to upload or process the image: {e}", "danger")
-                    if filename and os.path.exists(file_path):
-                        os.remove(file_path)
                     return redirect(request.url)
             else:
                 flash('File type not allowed.', 'danger')
@@ -141,10 +106,12 @@ def edit_book(book_id):
         book.condition = form.condition.data
         book.availability_status = form.availability_status.data
         book.location = form.location.data
+        if old_cover and old_cover != book.cover_image:
+            discard_upload('books', old_cover)
         db.session.commit()
         flash('Book updated successfully!', 'success')
         return redirect(url_for('books.list_books'))
-    return render_template('books/edit_book.html', form=form, book=book)
+    return render_template('books/edit_book.html', form=form, book=book, genre_names=genres.names())
 
 
 @books_bp.route('/delete/<int:book_id>', methods=['POST'])
@@ -156,15 +123,9 @@ def delete_book(book_id):
         flash('You are not authorized to delete this book.', 'danger')
         return redirect(url_for('books.list_books'))
 
-    # Delete cover image file if it exists
-    if book.cover_image:
-        uploads_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'books')
-        file_path = os.path.join(uploads_dir, book.cover_image)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-    # Delete the book record
-    db.session.delete(book)
+    # Tombstone the book; its cover is removed later by the upload sweeper
+    book.soft_delete()
+    discard_upload('books', book.cover_image)
     db.session.commit()
     flash('Book has been deleted!', 'success')
     return redirect(url_for('books.list_books'))
@@ -173,19 +134,66 @@ def delete_book(book_id):
 @books_bp.route('/search', methods=['GET', 'POST'])
 @login_required
 def search_books():
-    """Search books based on various filters."""
-    form = SearchForm()
+    """Search books based on various filters, with facet counts and drill-down."""
+    if request.method == 'GET' and 'search_query' in request.args:
+        # Page and facet links repeat the search as a GET
+        form = SearchForm(formdata=request.args, meta={'csrf': False})
+        submitted = form.validate()
+    else:
+        form = SearchForm()
+        submitted = form.validate_on_submit()
     books = []
-    if form.validate_on_submit():
-        query = Book.query
+    facet_counts = {}
+    selected_facets = {}
+    search_args = {}
+    if submitted:
+        query = db.session.query(Book.id)
+        # Author and genre names are matched against the in-memory lookup
+        # cache, so the query itself only compares integer ids
         if form.search_query.data:
             search = f"%{form.search_query.data}%"
-            query = query.filter(or_(Book.title.ilike(search), Book.author.ilike(search), Book.genre.ilike(search)))
+            query = query.filter(or_(Book.title.ilike(search),
+                                     Book.author_id.in_(authors.matching(form.search_query.data)),
+                                     Book.genre_id.in_(genres.matching(form.search_query.data))))
         if form.genre.data:
-            query = query.filter(Book.genre.ilike(f"%{form.genre.data}%"))
+            genre_id = genres.id_for(form.genre.data)
+            if genre_id is not None:
+                query = query.filter(Book.genre_id == genre_id)
+            else:
+                query = query.filter(Book.genre_id.in_(genres.matching(form.genre.data)))
         if form.availability_status.data:
-            query = query.filter_by(availability_status=form.availability_status.data)
+            query = query.filter(Book.availability_status == form.availability_status.data)
         if form.location.data:
             query = query.filter(Book.location.ilike(f"%{form.location.data}%"))
-        books = query.paginate(page=request.args.get('page', 1, type=int), per_page=10)
-    return render_template('books/search_books.html', form=form, books=books)
+
+        selected_facets = {facet: request.values[f'facet_{facet}'] for facet in FACETS
+                           if request.values.get(f'facet_{facet}')}
+        # Only the matching ids come from the database; drill-down and facet
+        # counts are bitmap operations on the in-memory facet index, except
+        # for facets with too many values to index, which are done in SQL
+        sql_facets = facet_index.sql_facets()
+        sql_selected = {facet: value for facet, value in selected_facets.items() if facet in sql_facets}
+        candidates = bitmap_from_ids(book_id for (book_id,) in query.filter(*selection_criteria(sql_selected)))
+        candidates = facet_index.filter(candidates, selected_facets)
+        facet_counts = facet_index.counts(candidates)
+        if sql_facets:
+            facet_counts.update(sql_counts(query.filter(*selection_criteria(selected_facets)), sql_facets))
+        facet_counts = {facet: facet_counts.get(facet, []) for facet in FACETS}
+        books = IdPagination(ids_from_bitmap(candidates), request.args.get('page', 1, type=int), per_page=10)
+
+        search_args = {name: form[name].data or '' for name in ('search_query', 'genre', 'availability_status', 'location')}
+        search_args.update({f'facet_{facet}': value for facet, value in selected_facets.items()})
+    return render_page('books/search_books.html', form=form, books=books, facet_counts=facet_counts,
+                       selected_facets=selected_facets, facet_labels=FACET_LABELS, search_args=search_args)
+
+
+@books_bp.route('/autocomplete', methods=['GET'])
+@login_required
+def autocomplete_books():
+    """Typeahead suggestions for titles, authors, genres and locations."""
+    field = request.args.get('field', 'title')
+    if field not in AUTOCOMPLETE_FIELDS:
+        return jsonify({'error': f"field must be one of {', '.join(AUTOCOMPLETE_FIELDS)}"}), 400
+    limit = min(request.args.get('limit', 10, type=int), 25)
+    suggestions = autocomplete.suggest(field, request.args.get('q', ''), limit)
+    return jsonify({'field': field, 'suggestions': suggestions})
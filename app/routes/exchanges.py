@@ -1,13 +1,36 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import ExchangeRequest, Book, User
-from app.forms import ExchangeRequestForm, RespondExchangeForm
+from app.forms import ExchangeRequestForm, RespondExchangeForm, BatchRespondExchangeForm
+from app.archive import paginate_with_archive
+from app.streaming import render_page
+from app.idempotency import idempotent
+from app import ledger
+from app import projections
+from app import sync
 
 exchanges_bp = Blueprint('exchanges', __name__, url_prefix='/exchanges')
 
+MAX_BATCH_RESPONSES = 200  # Request ids accepted by one batch response
+
+def _has_pending_request(book_id):
+    return db.session.query(ExchangeRequest.query.filter_by(
+        sender_id=current_user.id, book_id=book_id, status='pending').exists()).scalar()
+
+def _violates_pending_index(error):
+    """Whether ``error`` came from ``uq_exchange_request_pending``."""
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)  # PostgreSQL
+    if constraint is not None:
+        return constraint == 'uq_exchange_request_pending'
+    # SQLite names the columns instead
+    return 'exchange_request.sender_id, exchange_request.book_id' in str(error.orig)
+
 @exchanges_bp.route('/request/<int:book_id>', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def request_exchange(book_id):
     book = Book.query.get_or_404(book_id)
     
@@ -18,6 +41,9 @@ def request_exchange(book_id):
     
     form = ExchangeRequestForm()
     if form.validate_on_submit():
+        if _has_pending_request(book.id):
+            flash('You already have a pending request for this book.', 'info')
+            return redirect(url_for('exchanges.view_requests'))
         exchange_request = ExchangeRequest(
             sender_id=current_user.id,
             receiver_id=book.user_id,  # Ensure the receiver is the book's owner
@@ -27,7 +53,18 @@ def request_exchange(book_id):
             status='pending'
         )
         db.session.add(exchange_request)
-        db.session.commit()
+        try:
+            db.session.flush()
+            ledger.record_event(exchange_request, ledger.INITIATED, current_user.id)
+            db.session.commit()
+        except IntegrityError as error:
+            # Other violations, such as a racing idempotency key, are left to @idempotent
+            if not _violates_pending_index(error):
+                raise
+            # A concurrent submission created the pending request first
+            db.session.rollback()
+            flash('You already have a pending request for this book.', 'info')
+            return redirect(url_for('exchanges.view_requests'))
         flash('Exchange request sent!', 'success')
         # Optional: Notify the receiver about the exchange request
         return redirect(url_for('exchanges.view_requests'))
@@ -37,15 +74,112 @@ def request_exchange(book_id):
 @exchanges_bp.route('/view', methods=['GET'])
 @login_required
 def view_requests():
-    # Fetch requests received by the user
-    received_requests = ExchangeRequest.query.filter_by(receiver_id=current_user.id).order_by(ExchangeRequest.timestamp.desc()).all()
+    per_page = 20
+    # Fetch requests received by the user (finished ones may live in the archive).
+    # Hot rows, including old open requests, come before archived ones; see paginate_with_archive
+    received_pagination = paginate_with_archive(
+        projections.exchange_requests(receiver_id=current_user.id),
+        projections.exchange_requests(receiver_id=current_user.id, archived=True),
+        request.args.get('received_page', 1, type=int), per_page)
     # Fetch requests sent by the user
-    sent_requests = ExchangeRequest.query.filter_by(sender_id=current_user.id).order_by(ExchangeRequest.timestamp.desc()).all()
+    sent_pagination = paginate_with_archive(
+        projections.exchange_requests(sender_id=current_user.id),
+        projections.exchange_requests(sender_id=current_user.id, archived=True),
+        request.args.get('sent_page', 1, type=int), per_page)
+    received_requests = received_pagination.items
+    sent_requests = sent_pagination.items
     
-    # Initialize response forms for each received request
-    respond_forms = {req.id: RespondExchangeForm() for req in received_requests}
+    # One form (and CSRF token) covers every pending received request
+    respond_form = BatchRespondExchangeForm()
+    has_pending = any(req.status == 'pending' for req in received_requests)
     
-    return render_template('exchanges/view_requests.html', received_requests=received_requests, sent_requests=sent_requests, respond_forms=respond_forms)
+    return render_page('exchanges/view_requests.html', received_requests=received_requests, sent_requests=sent_requests,
+                       respond_form=respond_form, has_pending=has_pending,
+                       received_pagination=received_pagination, sent_pagination=sent_pagination)
+
+def respond_to_requests(receiver_id, request_ids, accept):
+    """Accept or reject the pending requests among ``request_ids`` addressed to ``receiver_id``.
+
+    Uses one UPDATE for the requests and one flush for their books and the
+    ledger events; the caller commits. Returns ``{id: result}`` where
+    result is ``'accepted'``, ``'rejected'``, ``'already_processed'`` or
+    ``'not_found'`` (missing, archived, or someone else's request).
+    """
+    status = 'accepted' if accept else 'rejected'
+    results = dict.fromkeys(request_ids, 'not_found')
+    if not results:
+        return results
+    for request_id, current in db.session.execute(
+            select(ExchangeRequest.id, ExchangeRequest.status)
+            .where(ExchangeRequest.id.in_(results), ExchangeRequest.receiver_id == receiver_id)):
+        results[request_id] = 'already_processed' if current != 'pending' else None
+    # The status check is repeated in the UPDATE, so a concurrent response wins cleanly
+    changed = db.session.execute(
+        update(ExchangeRequest)
+        .where(ExchangeRequest.id.in_([request_id for request_id, result in results.items() if result is None]),
+               ExchangeRequest.receiver_id == receiver_id, ExchangeRequest.status == 'pending')
+        .values(status=status)
+        .returning(ExchangeRequest.id, ExchangeRequest.sender_id, ExchangeRequest.receiver_id, ExchangeRequest.book_id)
+    ).all()
+    # The bulk UPDATE skips the ORM events that feed the sync log
+    sync.log_changes(ExchangeRequest, 'update', changed)
+    if changed and accept:
+        # Through the ORM, so the facet index (app.events) and the sync log see the change
+        for book in Book.query.filter(Book.id.in_({row.book_id for row in changed})):
+            book.availability_status = 'unavailable'
+    ledger.record_events(changed, ledger.ACCEPTED if accept else ledger.REJECTED, receiver_id)
+    for row in changed:
+        results[row.id] = status
+    for request_id, result in results.items():
+        if result is None:
+            results[request_id] = 'already_processed'
+    return results
+
+@exchanges_bp.route('/respond', methods=['POST'])
+@login_required
+def respond_batch():
+    """Accept or reject several received requests in one transaction.
+
+    A per-row button submits its own id as its value; the toolbar buttons
+    submit every checked id. JSON clients get the per-id results back.
+    """
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    form = BatchRespondExchangeForm()
+    if not form.validate_on_submit():
+        if wants_json:
+            return jsonify({'error': 'Invalid form submission.'}), 400
+        flash('Invalid form submission.', 'danger')
+        return redirect(url_for('exchanges.view_requests'))
+
+    button = 'submit_accept' if form.submit_accept.data else 'submit_reject' if form.submit_reject.data else None
+    value = request.form.get(button, '') if button else ''
+    request_ids = [int(value)] if value.isdigit() else list(dict.fromkeys(form.request_ids.data or []))
+    error = None
+    if button is None:
+        error = 'Invalid action.'
+    elif not request_ids:
+        error = 'Select at least one request.'
+    elif len(request_ids) > MAX_BATCH_RESPONSES:
+        error = f'Respond to at most {MAX_BATCH_RESPONSES} requests at once.'
+    if error:
+        if wants_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'warning')
+        return redirect(url_for('exchanges.view_requests'))
+
+    results = respond_to_requests(current_user.id, request_ids, accept=button == 'submit_accept')
+    db.session.commit()
+
+    if wants_json:
+        return jsonify({'results': {str(request_id): result for request_id, result in results.items()}})
+    done = sum(1 for result in results.values() if result in ('accepted', 'rejected'))
+    skipped = len(results) - done
+    if done:
+        verb = 'accepted' if button == 'submit_accept' else 'rejected'
+        flash(f"{done} exchange request{'s' if done != 1 else ''} {verb}.", 'success' if verb == 'accepted' else 'info')
+    if skipped:
+        flash(f"{skipped} request{'s were' if skipped != 1 else ' was'} already processed or no longer available.", 'warning')
+    return redirect(url_for('exchanges.view_requests'))
 
 @exchanges_bp.route('/respond/<int:request_id>', methods=['POST'])
 @login_required
@@ -68,6 +202,7 @@ def respond_exchange(request_id):
                 # Optional: Mark the book as unavailable
                 book = exchange_request.book
                 book.availability_status = 'unavailable'
+                ledger.record_event(exchange_request, ledger.ACCEPTED, current_user.id)
                 db.session.commit()
                 flash('Exchange request accepted.', 'success')
             else:
@@ -75,6 +210,7 @@ def respond_exchange(request_id):
         elif 'submit_reject' in request.form:
             if exchange_request.status == 'pending':  # Ensure request is still pending
                 exchange_request.status = 'rejected'
+                ledger.record_event(exchange_request, ledger.REJECTED, current_user.id)
                 db.session.commit()
                 flash('Exchange request rejected.', 'info')
             else:
@@ -1,13 +1,18 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import Message, User
+from app.models import Message, MessageArchive, User
 from app.forms import MessageForm  # Ensure you have a MessageForm defined
+from app.archive import paginate_with_archive
+from app.streaming import render_page
+from app.idempotency import idempotent
+from app import projections
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
 @messages_bp.route('/send/<int:receiver_id>', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def send_message(receiver_id):
     receiver = User.query.get_or_404(receiver_id)
     if receiver == current_user:
@@ -30,17 +35,24 @@ def send_message(receiver_id):
 
 @messages_bp.route('/conversation/<int:other_user_id>', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def conversation(other_user_id):
     other_user = User.query.get_or_404(other_user_id)
     if other_user == current_user:
         flash('You cannot have a conversation with yourself.', 'warning')
         return redirect(url_for('messages.inbox'))
     
-    # Fetch all messages between the current user and the other user
-    messages = Message.query.filter(
-        (Message.sender_id == current_user.id) & (Message.receiver_id == other_user_id) |
-        (Message.sender_id == other_user_id) & (Message.receiver_id == current_user.id)
-    ).order_by(Message.timestamp.asc()).all()
+    # Fetch a page of messages between the current user and the other user,
+    # newest first, falling back to the archive for older pages
+    def between(model):
+        return model.query.filter(
+            (model.sender_id == current_user.id) & (model.receiver_id == other_user_id) |
+            (model.sender_id == other_user_id) & (model.receiver_id == current_user.id)
+        ).order_by(model.timestamp.desc())
+
+    pagination = paginate_with_archive(between(Message), between(MessageArchive),
+                                       request.args.get('page', 1, type=int), per_page=50)
+    messages = list(reversed(pagination.items))
     
     form = MessageForm()
     if form.validate_on_submit():
@@ -55,17 +67,23 @@ def conversation(other_user_id):
         flash('Message sent!', 'success')
         return redirect(url_for('messages.conversation', other_user_id=other_user.id))
 
-    return render_template('messages/conversation.html', messages=messages, form=form, other_user=other_user)
+    return render_template('messages/conversation.html', messages=messages, pagination=pagination, form=form, other_user=other_user)
 
 
 @messages_bp.route('/inbox', methods=['GET'])
 @login_required
 def inbox():
-    messages = Message.query.filter_by(receiver_id=current_user.id).order_by(Message.timestamp.desc()).all()
-    return render_template('messages/inbox.html', messages=messages)
+    pagination = paginate_with_archive(
+        projections.messages_received(current_user.id),
+        projections.messages_received(current_user.id, archived=True),
+        request.args.get('page', 1, type=int), per_page=20)
+    return render_page('messages/inbox.html', messages=pagination.items, pagination=pagination)
 
 @messages_bp.route('/sent', methods=['GET'])
 @login_required
 def sent_messages():
-    messages = Message.query.filter_by(sender_id=current_user.id).order_by(Message.timestamp.desc()).all()
-    return render_template('messages/sent_messages.html', messages=messages)
+    pagination = paginate_with_archive(
+        projections.messages_sent(current_user.id),
+        projections.messages_sent(current_user.id, archived=True),
+        request.args.get('page', 1, type=int), per_page=20)
+    return render_page('messages/sent_messages.html', messages=pagination.items, pagination=pagination)
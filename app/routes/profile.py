@@ -1,12 +1,11 @@
-import os
-from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
 from app.models import Profile, User
 from app.forms import ProfileForm, ChangePasswordForm
-from werkzeug.utils import secure_filename
-from PIL import Image
+from app.storage import store_upload, discard_upload
+from app.wishlist import recent_alerts
+from werkzeug.datastructures import FileStorage
 
 profile_bp = Blueprint('profile', __name__, url_prefix='/profile')
 
@@ -21,7 +20,8 @@ def allowed_file(filename):
 def view_profile():
     """View the current user's profile."""
     profile = current_user.profile
-    return render_template('profile/view_profile.html', profile=profile)
+    return render_template('profile/view_profile.html', profile=profile, counts=current_user.counts(),
+                           alerts=recent_alerts(current_user.id))
 
 
 @profile_bp.route('/update', methods=['GET', 'POST'])
@@ -45,7 +45,10 @@ def update_profile():
 
             # Update or create profile fields
             if profile:
-                form_profile.populate_obj(profile)
+                # Not populate_obj: it would also copy the avatar FileStorage onto the model
+                profile.reading_preferences = form_profile.reading_preferences.data
+                profile.favorite_genres = form_profile.favorite_genres.data
+                profile.books_wanted = form_profile.books_wanted.data
             else:
                 profile = Profile(
                     reading_preferences=form_profile.reading_preferences.data,
@@ -56,38 +59,21 @@ def update_profile():
                 db.session.add(profile)
 
             # Handle avatar upload
-            if form_profile.avatar.data:
+            old_avatar = None
+            if isinstance(form_profile.avatar.data, FileStorage):
                 file = form_profile.avatar.data
                 if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    timestamp = int(datetime.utcnow().timestamp())
-                    filename = f"user_{current_user.id}_{timestamp}{os.path.splitext(filename)[1]}"
-
-                    # Define the upload path
-                    upload_path = os.path.join(current_app.root_path, 'static/uploads/profile')
-                    os.makedirs(upload_path, exist_ok=True)
-
-                    file_path = os.path.join(upload_path, filename)
-                    file.save(file_path)
-
-                    # Resize image
+                    # Resize and store; the old avatar is queued for the sweeper
                     try:
-                        img = Image.open(file_path)
-                        img.thumbnail((300, 300))
-                        img.save(file_path)
+                        avatar = store_upload(file, 'profile')
                     except Exception as e:
                         flash(f"Failed to process avatar image: {e}", 'danger')
-                        os.remove(file_path)
                         return redirect(url_for('profile.update_profile'))
+                    old_avatar = profile.avatar
+                    profile.avatar = avatar
 
-                    # Delete old avatar
-                    if profile.avatar and profile.avatar != 'default_avatar.png':
-                        old_avatar_path = os.path.join(upload_path, profile.avatar)
-                        if os.path.exists(old_avatar_path):
-                            os.remove(old_avatar_path)
-
-                    profile.avatar = filename
-
+            if old_avatar and old_avatar != profile.avatar:
+                discard_upload('profile', old_avatar)
             db.session.commit()
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('profile.view_profile'))
@@ -2,17 +2,29 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import ExchangeRequest, Transaction
+from app.models import ExchangeRequest
+from app.forms import RespondExchangeForm
+from app.streaming import render_page
+from app import ledger
+from app import projections
 
 transactions_bp = Blueprint('transactions', __name__, url_prefix='/transactions')
 
 @transactions_bp.route('/')
 @login_required
 def manage_transactions():
-    # Fetch all exchange requests related to the user
-    sent_requests = ExchangeRequest.query.filter_by(sender_id=current_user.id).order_by(ExchangeRequest.timestamp.desc()).all()
-    received_requests = ExchangeRequest.query.filter_by(receiver_id=current_user.id).order_by(ExchangeRequest.timestamp.desc()).all()
-    return render_template('transactions/manage_transactions.html', sent_requests=sent_requests, received_requests=received_requests)
+    # Stats and history come from the exchange ledger's projections
+    summary = ledger.summary_for(current_user.id)
+    activity = ledger.recent_activity(current_user.id)
+    # Stream the user's open exchange requests; rows are fetched in chunks
+    # while the page renders instead of being loaded up front
+    active = ['pending', 'accepted']
+    sent_requests = projections.exchange_requests(sender_id=current_user.id, statuses=active).yield_per(100)
+    received_requests = projections.exchange_requests(receiver_id=current_user.id, statuses=active).yield_per(100)
+    # One form supplies the CSRF token for every row's action buttons
+    form = RespondExchangeForm()
+    return render_page('transactions/manage_transactions.html', sent_requests=sent_requests, received_requests=received_requests, form=form,
+                       summary=summary, activity=activity)
 
 @transactions_bp.route('/cancel/<int:request_id>', methods=['POST'])
 @login_required
@@ -25,6 +37,7 @@ def cancel_transaction(request_id):
         flash('Cannot cancel this transaction.', 'warning')
         return redirect(url_for('transactions.manage_transactions'))
     exchange_request.status = 'canceled'
+    ledger.record_event(exchange_request, ledger.CANCELLED, current_user.id)
     db.session.commit()
     flash('Transaction canceled.', 'info')
     return redirect(url_for('transactions.manage_transactions'))
@@ -0,0 +1,10 @@
+# app/routes/uploads.py
+from flask import Blueprint
+from app.storage import get_storage
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/uploads')
+
+@uploads_bp.route('/<kind>/<path:key>', methods=['GET'])
+def serve_upload(kind, key):
+    """Serve an uploaded file; the bytes go out via the front-end server or S3."""
+    return get_storage().send(kind, key)
@@ -0,0 +1,108 @@
+# app/startup.py
+"""Startup profiling and pre-fork preparation.
+
+``flask startup-profile`` boots the app in a fresh interpreter under
+``python -X importtime`` and reports the slowest imports, checking them
+against ``STARTUP_IMPORT_BUDGETS_MS``. ``prepare_for_fork`` is meant for
+pre-forking servers (see gunicorn.conf.py): it does all the one-off work in
+the master and freezes the heap so forked workers share those pages
+copy-on-write.
+"""
+
+import gc
+import os
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
+
+BOOT_SNIPPET = (
+    "import time; started = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print('boot_ms=%.1f' % ((time.perf_counter() - started) * 1000))"
+)
+
+
+def profile_imports():
+    """Boot the app in a subprocess. Returns ``(boot_ms, {module: cumulative_ms})``."""
+    env = dict(os.environ, TEMPLATE_WARMUP='0')
+    env.pop('FLASK_RUN_FROM_CLI', None)  # Profile a server boot, not a CLI one
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET],
+        capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(current_app.root_path),
+    )
+    if result.returncode != 0:
+        raise click.ClickException(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative) / 1000
+    boot_ms = float(result.stdout.strip().rsplit('boot_ms=', 1)[1])
+    return boot_ms, modules
+
+
+def check_budgets(modules, budgets):
+    """Return ``[(module, actual_ms, budget_ms)]`` for every module over budget.
+
+    A budget of 0 means the module must not be imported during startup.
+    """
+    over = []
+    for name, budget in budgets.items():
+        actual = modules.get(name)
+        if actual is None:
+            continue
+        if budget == 0 or actual > budget:
+            over.append((name, actual, budget))
+    return over
+
+
+def prepare_for_fork(app):
+    """Warm ``app`` in the master process and freeze the heap before forking."""
+    started = time.perf_counter()
+    from sqlalchemy.orm import configure_mappers
+    from app import db, load_routes
+    from app.templating import warm_templates
+
+    # Modules the request handlers import lazily, and the deferred routes;
+    # load them once here instead of once per worker
+    load_routes(app)
+    for module in app.config.get('PREFORK_IMPORTS', ()):
+        __import__(module)
+
+    with app.app_context():
+        configure_mappers()
+        warm_templates(app)
+        # Never hand a pooled connection to forked children
+        db.engine.dispose()
+
+    gc.collect()
+    gc.freeze()
+    app.logger.info('Prepared app for fork in %.1f ms (%d objects frozen)',
+                    (time.perf_counter() - started) * 1000, gc.get_freeze_count())
+
+
+@click.command('startup-profile')
+@click.option('--top', default=15, help='Number of slowest imports to show.')
+@click.option('--check', is_flag=True, help='Exit non-zero if any module exceeds its budget.')
+def startup_profile_command(top, check):
+    """Report import times for a cold application boot."""
+    boot_ms, modules = profile_imports()
+    top_level = {name: ms for name, ms in modules.items() if '.' not in name or name.startswith('app.')}
+    for name, ms in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]:
+        click.echo(f"{ms:9.1f} ms  {name}")
+    click.echo(f"create_app() finished in {boot_ms:.1f} ms")
+
+    over = check_budgets(modules, current_app.config.get('STARTUP_IMPORT_BUDGETS_MS', {}))
+    for name, actual, budget in over:
+        if budget == 0:
+            click.echo(f"Budget exceeded: {name} should not be imported at startup ({actual:.1f} ms)")
+        else:
+            click.echo(f"Budget exceeded: {name} took {actual:.1f} ms (budget {budget} ms)")
+    if check and over:
+        sys.exit(1)
@@ -63,3 +63,38 @@ document.querySelectorAll('.toggle-password').forEach(function(element) {
     });
 });
 */
+
+
+/*
+ * Typeahead for inputs with a data-autocomplete attribute: fills the
+ * input's <datalist> from /books/autocomplete as the user types
+ */
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+    var datalist = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    if (!datalist) {
+        return;
+    }
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        var query = input.value.trim();
+        if (!query) {
+            datalist.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(function () {
+            var url = '/books/autocomplete?field=' + encodeURIComponent(input.dataset.autocomplete) +
+                      '&q=' + encodeURIComponent(query);
+            fetch(url, { credentials: 'same-origin' })
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    datalist.innerHTML = '';
+                    (data.suggestions || []).forEach(function (suggestion) {
+                        var option = document.createElement('option');
+                        option.value = suggestion.value;
+                        datalist.appendChild(option);
+                    });
+                });
+        }, 120);
+    });
+});
@@ -0,0 +1,239 @@
+# app/storage.py
+"""Upload storage backends.
+
+Uploads (book covers, avatars) are stored under a content-addressed key,
+``ab/<sha256>.<ext>``, inside a per-kind namespace (``books``, ``profile``).
+Identical files therefore share one stored object, and since a key never
+changes meaning, it can be cached forever.
+
+Two backends are available, picked by ``UPLOAD_STORAGE``:
+
+* ``local``: files on disk under ``UPLOAD_STORAGE_ROOT``. They are served by
+  the uploads blueprint, which hands the bytes to the front-end server via
+  ``X-Sendfile`` or ``X-Accel-Redirect`` according to
+  ``UPLOAD_SERVE_MODE`` (``direct`` streams from Python, for development).
+* ``s3``: any S3-compatible bucket (AWS, MinIO, ...) through ``boto3``.
+  Templates link straight to ``S3_PUBLIC_URL`` (a CDN or public bucket)
+  when it is set, or else to pre-signed URLs. A signed URL is reused for
+  most of its lifetime, so the browser and CDN caches keep hitting.
+
+Keys written before content addressing (e.g. ``book_1_20241112074141.png``)
+still resolve, because both forms are paths relative to the kind's folder.
+
+Requests never delete files. :func:`discard_upload` queues a key in the
+same transaction as the change that released it, and ``flask uploads
+sweep`` (app/sweeper.py) deletes it later.
+"""
+
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, redirect, send_from_directory, url_for, abort
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def content_key(data, ext):
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest}.{ext}"
+
+
+def _check_key(kind, key):
+    # Keys come from URLs in serve_upload; refuse anything escaping the kind
+    if kind not in ('books', 'profile') or key.startswith('/') or '..' in key.split('/'):
+        abort(404)
+
+
+class LocalStorage:
+    def __init__(self, root, serve_mode='direct', accel_prefix='/protected-uploads'):
+        self.root = root
+        self.serve_mode = serve_mode
+        self.accel_prefix = accel_prefix.rstrip('/')
+
+    def path(self, kind, key):
+        return os.path.join(self.root, kind, *key.split('/'))
+
+    def save(self, kind, data, ext):
+        key = content_key(data, ext)
+        path = self.path(kind, key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def delete(self, kind, key):
+        try:
+            os.remove(self.path(kind, key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, kind):
+        """Yield ``(key, modified time)`` for every stored file of ``kind``."""
+        base = os.path.join(self.root, kind)
+        for directory, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue  # A save in progress
+                path = os.path.join(directory, filename)
+                try:
+                    modified = os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, base).replace(os.sep, '/'), modified
+
+    def url(self, kind, key):
+        return url_for('uploads.serve_upload', kind=kind, key=key)
+
+    def send(self, kind, key):
+        _check_key(kind, key)
+        if self.serve_mode == 'x-accel':
+            if not os.path.isfile(self.path(kind, key)):
+                abort(404)
+            response = current_app.response_class(
+                mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = f"{self.accel_prefix}/{kind}/{key}"
+        else:
+            # send_from_directory emits X-Sendfile itself when USE_X_SENDFILE is set
+            response = send_from_directory(os.path.join(self.root, kind), key, max_age=ONE_YEAR)
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response
+
+
+class S3Storage:
+    SIGNED_URL_CACHE_SIZE = 10000  # Most recently used keys whose signed URLs are reused
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key=None,
+                 secret_key=None, url_expires=3600, public_url=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("UPLOAD_STORAGE='s3' needs the boto3 package (pip install boto3).") from None
+        self.bucket = bucket
+        self.url_expires = url_expires
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self._signed = OrderedDict()  # (kind, key) -> (url, re-sign after)
+        self._lock = threading.Lock()
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+
+    def save(self, kind, data, ext):
+        key = content_key(data, ext)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=f"{kind}/{key}",
+            Body=data,
+            ContentType=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            CacheControl=f'public, max-age={ONE_YEAR}, immutable',
+        )
+        return key
+
+    def delete(self, kind, key):
+        self.client.delete_object(Bucket=self.bucket, Key=f"{kind}/{key}")
+
+    def list(self, kind):
+        """Yield ``(key, modified time)`` for every stored object of ``kind``."""
+        prefix = f"{kind}/"
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(prefix):], item['LastModified'].timestamp()
+
+    def url(self, kind, key):
+        if self.public_url:
+            return f"{self.public_url}/{kind}/{key}"
+        now = time.monotonic()
+        with self._lock:
+            cached = self._signed.get((kind, key))
+            if cached is not None and cached[1] > now:
+                self._signed.move_to_end((kind, key))
+                return cached[0]
+        url = self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': f"{kind}/{key}"},
+            ExpiresIn=self.url_expires,
+        )
+        with self._lock:
+            # Re-signed once three quarters of the lifetime has passed, so a page never links an expired URL
+            self._signed[(kind, key)] = (url, now + self.url_expires * 0.75)
+            self._signed.move_to_end((kind, key))
+            while len(self._signed) > self.SIGNED_URL_CACHE_SIZE:
+                self._signed.popitem(last=False)
+        return url
+
+    def send(self, kind, key):
+        _check_key(kind, key)
+        return redirect(self.url(kind, key))
+
+
+def init_storage(app):
+    config = app.config
+    if config.get('UPLOAD_STORAGE') == 's3':
+        storage = S3Storage(
+            config['S3_BUCKET'],
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            access_key=config.get('S3_ACCESS_KEY'),
+            secret_key=config.get('S3_SECRET_KEY'),
+            url_expires=config.get('S3_URL_EXPIRES', 3600),
+            public_url=config.get('S3_PUBLIC_URL'),
+        )
+    else:
+        storage = LocalStorage(
+            config.get('UPLOAD_STORAGE_ROOT') or os.path.join(app.root_path, 'static', 'uploads'),
+            serve_mode=config.get('UPLOAD_SERVE_MODE', 'direct'),
+            accel_prefix=config.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads'),
+        )
+    app.extensions['storage'] = storage
+    app.jinja_env.globals['upload_url'] = upload_url
+
+
+def get_storage():
+    return current_app.extensions['storage']
+
+
+def upload_url(kind, key):
+    return get_storage().url(kind, key)
+
+
+def store_upload(file, kind, size=(300, 300)):
+    """Save an uploaded ``FileStorage``, shrinking images to ``size``. Returns its key.
+
+    Raises whatever PIL raises if an image can't be processed.
+    """
+    ext = os.path.splitext(file.filename)[1].lstrip('.').lower()
+    data = file.read()
+    if ext in IMAGE_EXTENSIONS:
+        from PIL import Image  # Only uploads need PIL
+        img = Image.open(io.BytesIO(data))
+        image_format = img.format
+        img.thumbnail(size)
+        output = io.BytesIO()
+        img.save(output, format=image_format)
+        data = output.getvalue()
+    return get_storage().save(kind, data, ext)
+
+
+def discard_upload(kind, key):
+    """Queue a stored upload for deletion in the current transaction.
+
+    The sweeper deletes the file only if no row points at the same content
+    by then, so it is safe to call before the commit that releases it.
+    """
+    if not key:
+        return
+    from app import db
+    from app.models import UploadDeletion
+    db.session.add(UploadDeletion(kind=kind, key=key))
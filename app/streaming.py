@@ -0,0 +1,167 @@
+# app/streaming.py
+"""Streamed page rendering and on-the-fly response compression.
+
+``render_page`` renders with ``stream_template`` when ``STREAM_TEMPLATES`` is
+on (it is opt-in), so list pages can pass lazily iterated queries
+(``yield_per``) and the first bytes leave before the last row is fetched.
+``CompressionMiddleware`` gzip/brotli-compresses text responses chunk by
+chunk without buffering the whole body.
+
+A streamed body renders after the view has returned: the request's
+database session has been removed and the session cookie has been sent.
+``render_page`` therefore loads what the layout reads (the user's
+profile, flashed messages, the CSRF token) up front, and the stream
+queries through a session of its own that is removed when it ends.
+"""
+
+import zlib
+
+from flask import current_app, get_flashed_messages, render_template, stream_template, stream_with_context
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from app import db
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'text/csv',
+                      'application/json', 'application/javascript')
+
+
+def _prepare_layout():
+    """Load what base.html reads while the request's session and cookie are still open."""
+    if current_user.is_authenticated:
+        current_user.profile  # Loaded now; the user is detached by the time the layout renders
+    get_flashed_messages()  # Popped now, so the session cookie sent with the headers drops them
+    generate_csrf()  # Stored in the session now, and cached for csrf_token() in the template
+
+
+@stream_with_context
+def _stream(template_name, context):
+    try:
+        yield from stream_template(template_name, **context)
+    finally:
+        db.session.remove()  # The session the stream's queries opened
+
+
+def render_page(template_name, **context):
+    """Render ``template_name``, streaming it when STREAM_TEMPLATES is enabled."""
+    if current_app.config.get('STREAM_TEMPLATES'):
+        _prepare_layout()
+        return current_app.response_class(_stream(template_name, context), mimetype='text/html')
+    return render_template(template_name, **context)
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _weak_etag(value):
+    return value if value.startswith('W/') else f'W/{value}'
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing text responses as they stream out.
+
+    Body chunks are buffered up to ``flush_size`` bytes before being
+    compressed and flushed, which keeps the compression ratio reasonable for
+    Jinja's many tiny chunks while still sending data early.
+
+    A strong ETag names one exact byte sequence, and the compressed body is
+    a different one. The ETag of a compressed response is therefore made
+    weak, and so is a 304's when the client revalidates with a weak tag.
+    If-None-Match compares weakly, so the app's own check still matches.
+    """
+
+    def __init__(self, wsgi_app, min_size=500, flush_size=8192, gzip_level=6, brotli_quality=4):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.flush_size = flush_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, environ):
+        accepted = environ.get('HTTP_ACCEPT_ENCODING', '').lower()
+        tokens = {token.split(';')[0].strip() for token in accepted.split(',')}
+        if brotli is not None and 'br' in tokens:
+            return 'br'
+        if 'gzip' in tokens:
+            return 'gzip'
+        return None
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        values = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in values:
+            return False
+        if values.get('content-type', '').split(';')[0].strip() not in COMPRESSIBLE_TYPES:
+            return False
+        length = values.get('content-length')
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = self._choose_encoding(environ)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            compress = self._should_compress(status, headers)
+            if compress or (status.startswith('304') and 'W/' in environ.get('HTTP_IF_NONE_MATCH', '')):
+                headers = [(name, _weak_etag(value) if name.lower() == 'etag' else value)
+                           for name, value in headers]
+            if compress:
+                vary = [value for name, value in headers if name.lower() == 'vary']
+                headers = [(name, value) for name, value in headers
+                           if name.lower() not in ('content-length', 'vary')]
+                headers.append(('Content-Encoding', encoding))
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+                state['encoder'] = (_BrotliEncoder(self.brotli_quality) if encoding == 'br'
+                                    else _GzipEncoder(self.gzip_level))
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.wsgi_app(environ, compressing_start_response)
+        if 'encoder' not in state:
+            return app_iter
+        return self._compress(app_iter, state['encoder'])
+
+    def _compress(self, app_iter, encoder):
+        buffer = []
+        buffered = 0
+        try:
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered >= self.flush_size:
+                    yield encoder.process(b''.join(buffer))
+                    buffer = []
+                    buffered = 0
+            yield encoder.process(b''.join(buffer)) + encoder.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
@@ -0,0 +1,112 @@
+# app/sweeper.py
+"""Background deletion of uploaded files.
+
+Requests never touch the filesystem to delete. Deleting a book tombstones
+it (``Book.deleted_at``), and any change that releases a cover or avatar
+calls :func:`app.storage.discard_upload`, which queues the key in
+``upload_deletion`` inside the same transaction. A rolled-back request
+therefore queues nothing, and a committed one cannot lose its entry.
+
+``flask uploads sweep`` drains the queue in batches of
+``UPLOAD_SWEEP_BATCH``. A file is deleted only if no live row still points
+at the same content-addressed key. With ``--reconcile`` (and every
+``UPLOAD_RECONCILE_SECONDS`` under ``--loop``), it also lists the storage
+backend and deletes files that no row references. Files younger than
+``UPLOAD_ORPHAN_GRACE_SECONDS`` are left alone, because their rows may not
+have committed yet. This also reclaims files orphaned before the queue
+existed.
+"""
+
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete
+
+from app import db
+from app.models import Book, Profile, UploadDeletion
+from app.storage import get_storage
+
+uploads_cli = AppGroup('uploads', help='Delete released and orphaned uploads.')
+
+# Upload kind -> the column referencing its keys
+REFERENCES = {'books': Book.cover_image, 'profile': Profile.avatar}
+
+
+def _in_use(kind, keys):
+    """The ``keys`` of ``kind`` that a live row still references."""
+    column = REFERENCES[kind]
+    return {key for (key,) in db.session.query(column).filter(column.in_(keys))}
+
+
+def _delete_unused(kind, keys):
+    storage = get_storage()
+    unused = set(keys) - _in_use(kind, keys)
+    for key in unused:
+        storage.delete(kind, key)
+    return len(unused)
+
+
+def drain_queue(batch_size=None):
+    """Delete queued uploads that nothing uses. Returns ``(entries processed, files deleted)``."""
+    batch_size = batch_size or current_app.config['UPLOAD_SWEEP_BATCH']
+    processed = deleted = 0
+    while True:
+        entries = UploadDeletion.query.order_by(UploadDeletion.id).limit(batch_size).all()
+        if not entries:
+            break
+        keys = defaultdict(set)
+        for entry in entries:
+            if entry.kind in REFERENCES:
+                keys[entry.kind].add(entry.key)
+        for kind, kind_keys in keys.items():
+            deleted += _delete_unused(kind, kind_keys)
+        db.session.execute(delete(UploadDeletion).where(UploadDeletion.id.in_([entry.id for entry in entries])))
+        db.session.commit()
+        processed += len(entries)
+    return processed, deleted
+
+
+def reconcile(batch_size=None, grace_seconds=None):
+    """Delete stored files older than the grace period that no row references. Returns the count."""
+    config = current_app.config
+    batch_size = batch_size or config['UPLOAD_SWEEP_BATCH']
+    cutoff = time.time() - (config['UPLOAD_ORPHAN_GRACE_SECONDS'] if grace_seconds is None else grace_seconds)
+    deleted = 0
+    for kind in REFERENCES:
+        # Listed up front so deleting doesn't disturb the listing
+        candidates = [key for key, modified in get_storage().list(kind) if modified < cutoff]
+        for start in range(0, len(candidates), batch_size):
+            deleted += _delete_unused(kind, candidates[start:start + batch_size])
+    db.session.rollback()  # End the read-only transaction
+    return deleted
+
+
+@uploads_cli.command('sweep')
+@click.option('--reconcile', 'with_reconcile', is_flag=True,
+              help='Also delete stored files that no row references.')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, sweeping every INTERVAL seconds (reconciling periodically).')
+def sweep_command(with_reconcile, interval):
+    """Delete queued uploads, and optionally orphaned ones."""
+    last_reconcile = None
+    while True:
+        try:
+            processed, deleted = drain_queue()
+            message = f"Processed {processed} queued uploads, deleted {deleted} files."
+            due = last_reconcile is None or \
+                time.monotonic() - last_reconcile >= current_app.config['UPLOAD_RECONCILE_SECONDS']
+            if with_reconcile or (interval is not None and due):
+                message += f" Reclaimed {reconcile()} orphaned files."
+                last_reconcile = time.monotonic()
+            click.echo(message)
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Upload sweep failed; retrying next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
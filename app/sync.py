@@ -0,0 +1,143 @@
+# app/sync.py
+"""Change tracking for incremental client sync.
+
+Every insert, update and delete of a ``Book``, ``ExchangeRequest``,
+``Message`` or ``Profile`` appends a ``change_log`` row in the same
+transaction, from mapper events. The row's autoincrement id is the sync
+version. A rolled-back change therefore logs nothing, and a committed
+one cannot lose its entry. Tombstoning a book counts as a delete.
+
+Statements that bypass the ORM (the batch respond UPDATE, bulk user
+import) call :func:`log_changes` themselves. Archiving is not logged: an
+archived row is history, not a change a client has to apply.
+
+:func:`changes_since` answers ``GET /api/v1/sync?since=<version>``. It reads
+only log rows newer than ``since``, so its cost follows the number of
+changes and not the table sizes. It only reads up to the newest entry older
+than ``SYNC_SETTLE_SECONDS``, because ids are handed out before commit: a
+slow transaction may still commit a lower id than one already visible.
+
+``flask sync compact`` drops log rows superseded by a newer change to the
+same row, so the log grows with the rows synced, not with their edits.
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, event, func, insert, inspect, or_, select
+
+from app import db
+from app.events import tombstoned
+from app.models import Book, ChangeLog, ExchangeRequest, Message, Profile
+
+sync_cli = AppGroup('sync', help='Maintain the change log behind /api/v1/sync.')
+
+# entity: the name clients see; key: the attribute identifying the row;
+# parties: the attributes naming the users allowed to see it (none = public)
+Tracked = namedtuple('Tracked', 'entity key parties')
+
+TRACKED = {
+    Book: Tracked('book', 'id', ()),
+    ExchangeRequest: Tracked('exchange_request', 'id', ('sender_id', 'receiver_id')),
+    Message: Tracked('message', 'id', ('sender_id', 'receiver_id')),
+    Profile: Tracked('profile', 'user_id', ()),
+}
+
+# One changed row: its newest version, and whether it was created after ``since``
+Changed = namedtuple('Changed', 'entity entity_id version inserted')
+
+
+def _entry(tracked, op, row):
+    parties = [getattr(row, name) for name in tracked.parties] or [None, None]
+    return {'entity': tracked.entity, 'entity_id': getattr(row, tracked.key), 'op': op,
+            'party_id': parties[0], 'counterparty_id': parties[1], 'changed_at': datetime.utcnow()}
+
+
+def log_changes(model, op, rows):
+    """Log ``op`` for ``rows`` written by a statement that skips the ORM events.
+
+    ``rows`` need the model's key and party attributes (ORM rows or RETURNING rows).
+    """
+    entries = [_entry(TRACKED[model], op, row) for row in rows]
+    if entries:
+        db.session.execute(insert(ChangeLog), entries)
+
+
+def _logged(op):
+    def listener(mapper, connection, target):
+        row_op = 'delete' if op == 'update' and tombstoned(inspect(target)) else op
+        connection.execute(insert(ChangeLog).values(**_entry(TRACKED[type(target)], row_op, target)))
+    return listener
+
+
+for _model in TRACKED:
+    for _op in ('insert', 'update', 'delete'):
+        event.listen(_model, f'after_{_op}', _logged(_op))
+
+
+def settled_version():
+    """The newest version old enough that no lower id can still commit."""
+    settled = datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+    # Walks the id index backwards from the newest entry, past the unsettled ones only
+    version = db.session.execute(
+        select(ChangeLog.id).where(ChangeLog.changed_at <= settled).order_by(ChangeLog.id.desc()).limit(1)
+    ).scalar()
+    return version or 0
+
+
+def changes_since(user_id, since, limit):
+    """``(changes, version, has_more)`` for the rows ``user_id`` may see, changed after ``since``.
+
+    ``changes`` lists :class:`Changed` rows, oldest first and at most
+    ``limit``; a row changed several times appears once. ``version`` is
+    what the client passes as ``since`` next time.
+    """
+    upto = settled_version()
+    if since >= upto:
+        return [], since, False
+    version = func.max(ChangeLog.id)
+    query = select(ChangeLog.entity, ChangeLog.entity_id, version,
+                   func.max(case((ChangeLog.op == 'insert', 1), else_=0))) \
+        .where(ChangeLog.id > since, ChangeLog.id <= upto,
+               or_(ChangeLog.party_id.is_(None), ChangeLog.party_id == user_id,
+                   ChangeLog.counterparty_id == user_id)) \
+        .group_by(ChangeLog.entity, ChangeLog.entity_id) \
+        .order_by(version) \
+        .limit(limit + 1)
+    changes = [Changed(entity, entity_id, row_version, bool(inserted))
+               for entity, entity_id, row_version, inserted in db.session.execute(query)]
+    if len(changes) > limit:
+        changes = changes[:limit]
+        return changes, changes[-1].version, True
+    return changes, upto, False
+
+
+def compact():
+    """Delete settled log rows superseded by a newer one for the same row. Returns the count."""
+    newest = select(func.max(ChangeLog.id)).group_by(ChangeLog.entity, ChangeLog.entity_id)
+    result = db.session.execute(
+        delete(ChangeLog).where(ChangeLog.id <= settled_version(), ChangeLog.id.not_in(newest)))
+    db.session.commit()
+    return result.rowcount
+
+
+@sync_cli.command('compact')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, compacting every INTERVAL seconds.')
+def compact_command(interval):
+    """Drop change log rows superseded by later changes."""
+    while True:
+        try:
+            click.echo(f"Removed {compact()} superseded changes.")
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Change log compaction failed; retrying next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
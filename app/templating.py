@@ -0,0 +1,70 @@
+# app/templating.py
+"""Persistent Jinja bytecode cache and template warm-up.
+
+Compiled templates are stored on disk so a fresh worker loads bytecode
+instead of parsing and compiling every template again. ``flask templates
+compile`` fills that cache at build time, and ``warm_templates`` loads every
+template once at startup and reports how long each one took.
+"""
+
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+templates_cli = AppGroup('templates', help='Precompile and inspect Jinja templates.')
+
+
+def bytecode_cache_dir(app):
+    return app.config.get('TEMPLATE_BYTECODE_CACHE_DIR') or \
+        os.path.join(app.instance_path, 'jinja_cache')
+
+
+def init_template_cache(app):
+    """Point the Jinja environment at an on-disk bytecode cache.
+
+    Must run before ``app.jinja_env`` is first touched, since Flask only reads
+    ``jinja_options`` when it creates the environment.
+    """
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        return
+    cache_dir = bytecode_cache_dir(app)
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir))
+
+
+def warm_templates(app):
+    """Load every template once. Returns ``[(name, milliseconds)]``."""
+    timings = []
+    env = app.jinja_env
+    for name in sorted(env.list_templates(extensions=['html'])):
+        started = time.perf_counter()
+        env.get_template(name)
+        timings.append((name, (time.perf_counter() - started) * 1000))
+    return timings
+
+
+def log_warmup(app):
+    timings = warm_templates(app)
+    for name, elapsed in timings:
+        app.logger.debug('Loaded template %s in %.1f ms', name, elapsed)
+    app.logger.info('Warmed %d templates in %.1f ms', len(timings), sum(t for _, t in timings))
+    return timings
+
+
+@templates_cli.command('compile')
+def compile_command():
+    """Compile every template into the bytecode cache."""
+    if not current_app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        raise click.ClickException('TEMPLATE_BYTECODE_CACHE is disabled; nothing to write.')
+    env = current_app.jinja_env
+    env.bytecode_cache.clear()
+    if env.cache is not None:
+        env.cache.clear()  # Startup warm-up may already hold these in memory
+    timings = warm_templates(current_app)
+    for name, elapsed in timings:
+        click.echo(f"{elapsed:8.1f} ms  {name}")
+    click.echo(f"Compiled {len(timings)} templates into {bytecode_cache_dir(current_app)}.")
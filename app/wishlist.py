@@ -0,0 +1,212 @@
+# app/wishlist.py
+"""Wishlist alerts: tell users when a book they want is listed.
+
+Every line (or comma-separated entry) of ``Profile.books_wanted`` is a
+*wish*, stored in ``wish`` together with its terms in the inverted index
+``wish_term``. This is a percolator: the stored wishes are the queries and
+each new book is the document. When a ``Book`` is inserted, its title and
+author terms are looked up in ``wish_term``, and a wish matches if the book
+contains all of its terms. That is one indexed ``term IN (...)`` lookup per
+book, and it never scans the profiles.
+
+Matching wishers get a ``wishlist_alert`` row in the same transaction as
+the book. ``flask wishlist notify`` emails the queued alerts, one message
+per user. Profile edits re-index only the entries that changed, also in the
+saving transaction. ``flask wishlist reindex`` rebuilds the index from
+scratch, e.g. after the initial migration.
+"""
+
+import re
+import time
+from datetime import datetime
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from flask_mail import Message as MailMessage
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import joinedload
+
+from app import db, mail
+from app.models import Author, Book, Profile, User, Wish, WishlistAlert, WishTerm
+
+wishlist_cli = AppGroup('wishlist', help='Maintain wishlist alerts.')
+
+ENTRY_SEPARATORS = re.compile(r'[,;\n]+')
+WORD = re.compile(r'\w+')
+STOPWORDS = frozenset({'a', 'an', 'and', 'by', 'for', 'in', 'of', 'on', 'the', 'to'})
+MAX_WISHES = 50  # Entries indexed per profile
+MAX_WISH_TERMS = 10  # Terms kept per entry
+
+
+def terms(text, limit=None):
+    """Distinct case-folded terms of ``text``, without stopwords."""
+    found = sorted({word[:50] for word in WORD.findall((text or '').casefold())
+                    if word not in STOPWORDS and (len(word) > 1 or word.isdigit())})
+    return found[:limit] if limit else found
+
+
+def wishes(books_wanted):
+    """``{entry text: terms}`` for each entry of a ``books_wanted`` value."""
+    parsed = {}
+    for entry in ENTRY_SEPARATORS.split(books_wanted or ''):
+        entry = ' '.join(entry.split())[:200]
+        entry_terms = terms(entry, MAX_WISH_TERMS)
+        if entry_terms and entry not in parsed:
+            parsed[entry] = entry_terms
+        if len(parsed) == MAX_WISHES:
+            break
+    return parsed
+
+
+def index_profile(connection, profile_id, user_id, books_wanted):
+    """Bring ``profile_id``'s wishes in line with ``books_wanted``, touching only changed entries."""
+    wanted = wishes(books_wanted)
+    current = dict(connection.execute(select(Wish.text, Wish.id).where(Wish.profile_id == profile_id)).all())
+    removed = [wish_id for text, wish_id in current.items() if text not in wanted]
+    if removed:
+        connection.execute(delete(WishTerm).where(WishTerm.wish_id.in_(removed)))
+        connection.execute(delete(Wish).where(Wish.id.in_(removed)))
+    for text, wish_terms in wanted.items():
+        if text in current:
+            continue
+        wish_id = connection.execute(
+            insert(Wish).values(profile_id=profile_id, user_id=user_id, text=text,
+                                term_count=len(wish_terms)).returning(Wish.id)
+        ).scalar_one()
+        connection.execute(insert(WishTerm), [{'term': term, 'wish_id': wish_id} for term in wish_terms])
+
+
+def match(connection, text, exclude_user_id=None):
+    """``{user_id: wish text}`` for the wishes fully contained in ``text``."""
+    book_terms = terms(text)
+    if not book_terms:
+        return {}
+    query = select(Wish.user_id, Wish.text) \
+        .join(WishTerm, WishTerm.wish_id == Wish.id) \
+        .where(WishTerm.term.in_(book_terms)) \
+        .group_by(Wish.id, Wish.user_id, Wish.text, Wish.term_count) \
+        .having(func.count() == Wish.term_count) \
+        .order_by(Wish.id)
+    if exclude_user_id is not None:
+        query = query.where(Wish.user_id != exclude_user_id)
+    matches = {}
+    for user_id, wish_text in connection.execute(query):
+        matches.setdefault(user_id, wish_text)
+    return matches
+
+
+@event.listens_for(Profile, 'after_insert')
+def _profile_inserted(mapper, connection, profile):
+    if profile.books_wanted:
+        index_profile(connection, profile.id, profile.user_id, profile.books_wanted)
+
+
+@event.listens_for(Profile, 'after_update')
+def _profile_updated(mapper, connection, profile):
+    if inspect(profile).attrs.books_wanted.history.has_changes():
+        index_profile(connection, profile.id, profile.user_id, profile.books_wanted)
+
+
+@event.listens_for(Profile, 'before_delete')
+def _profile_deleted(mapper, connection, profile):
+    index_profile(connection, profile.id, profile.user_id, '')
+
+
+@event.listens_for(Book, 'after_insert')
+def _book_inserted(mapper, connection, book):
+    author = connection.execute(select(Author.name).where(Author.id == book.author_id)).scalar()
+    matches = match(connection, f"{book.title} {author or ''}", exclude_user_id=book.user_id)
+    if matches:
+        connection.execute(insert(WishlistAlert), [
+            {'user_id': user_id, 'book_id': book.id, 'wish': wish_text, 'created_at': datetime.utcnow()}
+            for user_id, wish_text in matches.items()
+        ])
+
+
+def recent_alerts(user_id, limit=5):
+    """The user's latest alerts, with their books."""
+    return WishlistAlert.query.filter_by(user_id=user_id) \
+        .options(joinedload(WishlistAlert.book)) \
+        .order_by(WishlistAlert.id.desc()).limit(limit).all()
+
+
+def reindex():
+    """Rebuild ``wish`` and ``wish_term`` from every profile."""
+    db.session.execute(delete(WishTerm))
+    db.session.execute(delete(Wish))
+    connection = db.session.connection()
+    indexed = 0
+    profiles = select(Profile.id, Profile.user_id, Profile.books_wanted) \
+        .where(Profile.books_wanted.is_not(None), Profile.books_wanted != '')
+    for profile_id, user_id, books_wanted in db.session.execute(profiles).all():
+        index_profile(connection, profile_id, user_id, books_wanted)
+        indexed += 1
+    db.session.commit()
+    return indexed
+
+
+def _alert_email(user, alerts):
+    lines = [f"- {alert.book.title} by {alert.book.author} ({alert.book.location}), for your wish "
+             f"\"{alert.wish}\": {url_for('books.search_books', search_query=alert.book.title, _external=True)}"
+             for alert in alerts]
+    message = MailMessage('Books from your wishlist were just listed',
+                          sender='noreply@bookexchange.com', recipients=[user.email])
+    message.body = 'New listings match books you want:\n\n' + '\n'.join(lines) + '\n'
+    return message
+
+
+def notify(batch_size=None):
+    """Email queued alerts, one message per user. Returns the number of alerts sent."""
+    batch_size = batch_size or current_app.config['WISHLIST_NOTIFY_BATCH']
+    alerts = WishlistAlert.query.filter(WishlistAlert.notified_at.is_(None)) \
+        .options(joinedload(WishlistAlert.book)) \
+        .order_by(WishlistAlert.user_id, WishlistAlert.id).limit(batch_size).all()
+    if not alerts:
+        return 0
+    by_user = {}
+    for alert in alerts:
+        by_user.setdefault(alert.user_id, []).append(alert)
+    users = {user.id: user for user in User.query.filter(User.id.in_(by_user))}
+    with current_app.test_request_context(base_url=current_app.config['SITE_URL']):
+        emails = []
+        for user_id, user_alerts in by_user.items():
+            # Alerts whose book has since been deleted are marked without an email
+            listed = [alert for alert in user_alerts if alert.book is not None]
+            emails.append(([alert.id for alert in user_alerts],
+                           _alert_email(users[user_id], listed) if listed else None))
+    sent = 0
+    with mail.connect() as smtp:
+        for alert_ids, email in emails:
+            if email is not None:
+                smtp.send(email)
+            # Mark as we go, so a failed send doesn't repeat earlier emails
+            db.session.execute(update(WishlistAlert).where(WishlistAlert.id.in_(alert_ids))
+                               .values(notified_at=datetime.utcnow()))
+            db.session.commit()
+            sent += len(alert_ids)
+    return sent
+
+
+@wishlist_cli.command('reindex')
+def reindex_command():
+    """Rebuild the wish index from all profiles."""
+    click.echo(f"Indexed {reindex()} profiles.")
+
+
+@wishlist_cli.command('notify')
+@click.option('--loop', 'interval', type=int, default=None,
+              help='Keep running, sending every INTERVAL seconds.')
+def notify_command(interval):
+    """Email queued wishlist alerts."""
+    while True:
+        try:
+            click.echo(f"Sent {notify()} wishlist alerts.")
+        except Exception:
+            if interval is None:
+                raise
+            db.session.rollback()
+            current_app.logger.exception('Wishlist notification run failed; retrying next interval.')
+        if interval is None:
+            break
+        time.sleep(interval)
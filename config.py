@@ -16,3 +16,122 @@ class Config:
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')  # Your email username
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')  # Your email password
+
+    # Archival of cold rows (see app/archive.py)
+    ARCHIVE_MESSAGES_AFTER_DAYS = int(os.environ.get('ARCHIVE_MESSAGES_AFTER_DAYS', 180))
+    ARCHIVE_EXCHANGES_AFTER_DAYS = int(os.environ.get('ARCHIVE_EXCHANGES_AFTER_DAYS', 30))
+    ARCHIVE_EXCHANGE_STATUSES = ('rejected', 'canceled', 'completed')
+    ARCHIVE_BATCH_SIZE = 500
+
+    # Static asset pipeline (run `flask assets build` at deploy time)
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST', '1') == '1'
+
+    # Streamed rendering of list pages and on-the-fly compression (app/streaming.py)
+    STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '0') == '1'
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+
+    # Jinja bytecode cache and startup warm-up (app/templating.py)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')  # Defaults to instance/jinja_cache
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '1') == '1'
+
+    # Startup optimisation (app/startup.py)
+    LAZY_IMPORTS = os.environ.get('LAZY_IMPORTS', '1') == '1'
+    # Cumulative import time allowed per module during create_app(); 0 means
+    # the module must not be imported at startup at all
+    STARTUP_IMPORT_BUDGETS_MS = {
+        'app': 1500,
+        'app.models': 200,  # Mapper setup for every model; about 60-110 ms here
+        'PIL': 0,
+        'alembic': 0,
+        # Loaded on the first request or by prepare_for_fork
+        'app.routes': 0,
+        # CLI only
+        'app.dbcopy': 0,
+        'app.benchmarks': 0,
+        'app.rollups': 0,
+    }
+    # Imported in the pre-fork master so workers share them copy-on-write
+    PREFORK_IMPORTS = ('PIL.Image',)
+
+    # Admission control and rate limiting (app/limits.py)
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')  # e.g. redis://localhost:6379/0
+    # Reverse proxies in front of the app (e.g. 1 for nginx) whose X-Forwarded-* headers are trusted
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # Per endpoint: rate/burst = token bucket per user and per IP,
+    # concurrency/queue/queue_timeout = in-flight limit, target_ms = latency goal
+    ROUTE_LIMITS = {
+        'books.search_books': {'methods': ('GET', 'POST'), 'rate': 1.0, 'burst': 10,
+                               'concurrency': 8, 'queue': 16, 'queue_timeout': 0.5, 'target_ms': 250},
+        'auth.login': {'methods': ('POST',), 'rate': 0.2, 'burst': 5,
+                       'concurrency': 4, 'queue': 8, 'queue_timeout': 1.0},
+        'auth.register': {'methods': ('POST',), 'rate': 0.05, 'burst': 3, 'concurrency': 2, 'queue': 4, 'queue_timeout': 1.0},
+        'auth.import_users': {'methods': ('POST',), 'rate': 0.02, 'burst': 2, 'concurrency': 1, 'queue': 0, 'queue_timeout': 0},
+        'books.add_book': {'methods': ('POST',), 'rate': 0.2, 'burst': 5, 'concurrency': 4, 'queue': 4, 'queue_timeout': 1.0},
+        'books.edit_book': {'methods': ('POST',), 'rate': 0.2, 'burst': 5, 'concurrency': 4, 'queue': 4, 'queue_timeout': 1.0},
+        'profile.update_profile': {'methods': ('POST',), 'rate': 0.2, 'burst': 5, 'concurrency': 4, 'queue': 4, 'queue_timeout': 1.0},
+    }
+
+    # Upload storage (app/storage.py): 'local' or 's3'
+    UPLOAD_STORAGE = os.environ.get('UPLOAD_STORAGE', 'local')
+    UPLOAD_STORAGE_ROOT = os.environ.get('UPLOAD_STORAGE_ROOT')  # Defaults to app/static/uploads
+    # 'direct' (Python streams the file), 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx)
+    UPLOAD_SERVE_MODE = os.environ.get('UPLOAD_SERVE_MODE', 'direct')
+    USE_X_SENDFILE = UPLOAD_SERVE_MODE == 'x-sendfile'
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads')  # nginx internal location
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_URL_EXPIRES = 3600
+    # Public or CDN base for the bucket (e.g. https://cdn.example.com); unset links pre-signed URLs instead
+    S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')
+
+    # Search typeahead (app/autocomplete.py)
+    AUTOCOMPLETE_PRELOAD = os.environ.get('AUTOCOMPLETE_PRELOAD', '1') == '1'
+    AUTOCOMPLETE_REFRESH_SECONDS = 300  # Full rebuild interval, picks up other workers' writes
+
+    # Search facet bitmaps (app/facets.py)
+    FACETS_PRELOAD = os.environ.get('FACETS_PRELOAD', '1') == '1'
+    FACETS_REFRESH_SECONDS = 300
+    # A facet with more distinct values is filtered and counted in SQL instead (each value costs an AND per search)
+    FACETS_MAX_VALUES = 100
+
+    # Activity rollups (app/rollups.py) and the /analytics dashboard
+    ROLLUP_SETTLE_SECONDS = 60  # Rows younger than this wait for the next run
+    ROLLUP_WINDOW_HOURS = 24  # Source rows counted per transaction window
+    # Usernames allowed to see /analytics; empty disables it
+    ANALYTICS_USERS = [name for name in os.environ.get('ANALYTICS_USERS', '').split(',') if name]
+
+    # Bulk user provisioning (app/provisioning.py)
+    IMPORT_BATCH_SIZE = 1000  # Users inserted per transaction
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', 0)) or None  # Defaults to the CPU count
+    # Uploaded imports wait for `flask users run-imports`; more than this many queued per user are refused
+    IMPORT_MAX_QUEUED = 3
+    # Usernames allowed to use the /auth/import page; empty disables it
+    PROVISIONING_USERS = [name for name in os.environ.get('PROVISIONING_USERS', '').split(',') if name]
+
+    # SQLite to PostgreSQL copy (app/dbcopy.py)
+    DBCOPY_BATCH_SIZE = 5000  # Rows checksummed and copied per batch
+
+    # Genre/author lookup cache (app/lookups.py)
+    LOOKUP_REFRESH_SECONDS = 300
+
+    # Wishlist alerts (app/wishlist.py)
+    WISHLIST_NOTIFY_BATCH = 500  # Queued alerts emailed per run
+    SITE_URL = os.environ.get('SITE_URL', 'http://localhost:5000')  # Base of links in emails sent from the CLI
+
+    # Upload deletion queue and orphan sweeper (app/sweeper.py)
+    UPLOAD_SWEEP_BATCH = 500  # Queue entries / stored files checked per batch
+    UPLOAD_ORPHAN_GRACE_SECONDS = 24 * 60 * 60  # Younger unreferenced files may belong to an uncommitted row
+    UPLOAD_RECONCILE_SECONDS = 24 * 60 * 60  # How often `flask uploads sweep --loop` reconciles storage
+
+    # Delta sync (app/sync.py) and /api/v1/sync
+    SYNC_BATCH_SIZE = 500  # Changed rows per response (and the largest limit= allowed)
+    SYNC_SETTLE_SECONDS = 5  # Changes younger than this wait, as a slower transaction may commit a lower version
+
+    # Idempotency keys for create forms (app/idempotency.py)
+    IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60  # How long a key replays its first response
+    # How long a repeat waits for the first request's response before assuming its worker died
+    IDEMPOTENCY_WAIT_SECONDS = 5
@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Usage: gunicorn -c gunicorn.conf.py run:app
+
+import multiprocessing
+
+bind = '0.0.0.0:8000'
+# Threaded workers: app.limits' concurrency limits count in-flight requests
+# per process, so each worker needs more threads than the largest
+# ROUTE_LIMITS concurrency for its queueing and shedding to ever apply
+worker_class = 'gthread'
+workers = multiprocessing.cpu_count() + 1
+threads = 16
+
+# Load the app once in the master so workers inherit it copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    from app.startup import prepare_for_fork
+    from run import app
+    prepare_for_fork(app)
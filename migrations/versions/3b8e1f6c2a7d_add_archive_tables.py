@@ -0,0 +1,62 @@
+"""Add archive tables for messages and exchange requests
+
+Revision ID: 3b8e1f6c2a7d
+Revises: cf66d5de6ebf
+Create Date: 2026-10-19 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e1f6c2a7d'
+down_revision = 'cf66d5de6ebf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('read', sa.Boolean(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['receiver_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['sender_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_message_archive_timestamp'), ['timestamp'], unique=False)
+
+    op.create_table('exchange_request_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('delivery_method', sa.String(length=50), nullable=False),
+    sa.Column('exchange_duration', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['receiver_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['sender_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('exchange_request_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_exchange_request_archive_timestamp'), ['timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exchange_request_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_exchange_request_archive_timestamp'))
+
+    op.drop_table('exchange_request_archive')
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_message_archive_timestamp'))
+
+    op.drop_table('message_archive')
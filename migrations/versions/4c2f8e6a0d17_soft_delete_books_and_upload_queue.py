@@ -0,0 +1,43 @@
+"""Tombstone deleted books and queue upload deletions
+
+Revision ID: 4c2f8e6a0d17
+Revises: e3a7c5d91b24
+Create Date: 2026-10-19 19:37:52.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2f8e6a0d17'
+down_revision = 'e3a7c5d91b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_deletion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('requested_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_book_deleted_at'), ['deleted_at'], unique=False)
+
+
+def downgrade():
+    # Tombstoned books would reappear; remove them (and what hangs off them) first
+    tombstoned = "SELECT id FROM book WHERE deleted_at IS NOT NULL"
+    op.execute(f"DELETE FROM wishlist_alert WHERE book_id IN ({tombstoned})")
+    op.execute(f"DELETE FROM exchange_request WHERE book_id IN ({tombstoned})")
+    op.execute(f"DELETE FROM exchange_request_archive WHERE book_id IN ({tombstoned})")
+    op.execute("DELETE FROM book WHERE deleted_at IS NOT NULL")
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_deleted_at'))
+        batch_op.drop_column('deleted_at')
+
+    op.drop_table('upload_deletion')
@@ -0,0 +1,63 @@
+"""Add activity rollup tables and timestamp indexes for incremental scans
+
+Revision ID: 5e8a1c3f9b60
+Revises: 9d2c6b7e4f18
+Create Date: 2026-10-19 16:21:05.734519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a1c3f9b60'
+down_revision = '9d2c6b7e4f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('activity_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=10), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('metric', sa.String(length=40), nullable=False),
+    sa.Column('dimension', sa.String(length=100), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('period', 'bucket_start', 'metric', 'dimension', name='uq_activity_rollup_bucket')
+    )
+    op.create_table('rollup_watermark',
+    sa.Column('source', sa.String(length=40), nullable=False),
+    sa.Column('high_water', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('source')
+    )
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_date_posted'), ['date_posted'], unique=False)
+
+    with op.batch_alter_table('exchange_request', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_exchange_request_timestamp'), ['timestamp'], unique=False)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_message_timestamp'), ['timestamp'], unique=False)
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_transaction_timestamp'), ['timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_transaction_timestamp'))
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_message_timestamp'))
+
+    with op.batch_alter_table('exchange_request', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_exchange_request_timestamp'))
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_date_posted'))
+
+    op.drop_table('rollup_watermark')
+    op.drop_table('activity_rollup')
@@ -0,0 +1,26 @@
+"""Add avatar storage key to profile
+
+Revision ID: 7c41d9a0e5b2
+Revises: 3b8e1f6c2a7d
+Create Date: 2026-10-19 13:40:12.562017
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41d9a0e5b2'
+down_revision = '3b8e1f6c2a7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('profile', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('profile', schema=None) as batch_op:
+        batch_op.drop_column('avatar')
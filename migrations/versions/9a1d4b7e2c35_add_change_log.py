@@ -0,0 +1,43 @@
+"""Log changes to synced rows for /api/v1/sync
+
+Revision ID: 9a1d4b7e2c35
+Revises: 4c2f8e6a0d17
+Create Date: 2026-10-19 21:12:40.318907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a1d4b7e2c35'
+down_revision = '4c2f8e6a0d17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('party_id', sa.Integer(), nullable=True),
+    sa.Column('counterparty_id', sa.Integer(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_change_log_entity', 'change_log', ['entity', 'entity_id'], unique=False)
+    # Existing rows become inserts, so a first sync from version 0 returns everything
+    op.execute("INSERT INTO change_log (entity, entity_id, op, changed_at) "
+               "SELECT 'book', id, 'insert', CURRENT_TIMESTAMP FROM book WHERE deleted_at IS NULL")
+    for table in ('exchange_request', 'message'):
+        op.execute(f"INSERT INTO change_log (entity, entity_id, op, party_id, counterparty_id, changed_at) "
+                   f"SELECT '{table}', id, 'insert', sender_id, receiver_id, CURRENT_TIMESTAMP FROM {table}")
+    op.execute("INSERT INTO change_log (entity, entity_id, op, changed_at) "
+               "SELECT 'profile', user_id, 'insert', CURRENT_TIMESTAMP FROM profile")
+
+
+def downgrade():
+    op.drop_index('ix_change_log_entity', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,137 @@
+"""Turn transaction into an exchange event log with per-user summaries
+
+Revision ID: 9d2c6b7e4f18
+Revises: 7c41d9a0e5b2
+Create Date: 2026-10-19 15:02:47.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c6b7e4f18'
+down_revision = '7c41d9a0e5b2'
+branch_labels = None
+depends_on = None
+
+# The original foreign keys were created unnamed; SQLite's batch mode names
+# reflected constraints with this convention, PostgreSQL uses its own default
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+
+# Every exchange request, live or archived
+REQUESTS = ("(SELECT id, sender_id, receiver_id, book_id, status, timestamp FROM exchange_request "
+            "UNION ALL "
+            "SELECT id, sender_id, receiver_id, book_id, status, timestamp FROM exchange_request_archive) AS requests")
+
+# Events logged before this migration get the other party and the book from their request
+LINK_LOGGED_EVENTS = f"""
+UPDATE "transaction"
+SET counterparty_id = (SELECT CASE WHEN requests.sender_id = "transaction".user_id
+                                   THEN requests.receiver_id ELSE requests.sender_id END
+                       FROM {REQUESTS} WHERE requests.id = "transaction".exchange_request_id),
+    book_id = (SELECT requests.book_id FROM {REQUESTS} WHERE requests.id = "transaction".exchange_request_id)
+WHERE counterparty_id IS NULL
+"""
+
+# The events `flask ledger backfill` writes: 'initiated' by the sender, then
+# the outcome (accepted/rejected by the receiver, cancelled/completed by the sender)
+INITIATED_EVENTS = f"""
+INSERT INTO "transaction" (user_id, counterparty_id, exchange_request_id, book_id, status, timestamp)
+SELECT sender_id, receiver_id, id, book_id, 'initiated', timestamp FROM {REQUESTS}
+WHERE id NOT IN (SELECT exchange_request_id FROM "transaction" WHERE id <= :logged_upto)
+ORDER BY id
+"""
+OUTCOME_EVENTS = f"""
+INSERT INTO "transaction" (user_id, counterparty_id, exchange_request_id, book_id, status, timestamp)
+SELECT CASE WHEN status IN ('accepted', 'rejected') THEN receiver_id ELSE sender_id END,
+       CASE WHEN status IN ('accepted', 'rejected') THEN sender_id ELSE receiver_id END,
+       id, book_id, CASE status WHEN 'canceled' THEN 'cancelled' ELSE status END, timestamp
+FROM {REQUESTS}
+WHERE status IN ('accepted', 'rejected', 'canceled', 'completed')
+  AND id NOT IN (SELECT exchange_request_id FROM "transaction" WHERE id <= :logged_upto)
+ORDER BY id
+"""
+
+# Each party's summary from the whole event log, as `flask ledger rebuild` computes it
+SUMMARIES_FROM_EVENTS = """
+INSERT INTO exchange_summary (user_id, active_count, completed_count, cancelled_count,
+                              rejected_count, last_event_id, last_activity)
+SELECT totals.party, totals.active_count, totals.completed_count, totals.cancelled_count,
+       totals.rejected_count, totals.last_event_id, latest.timestamp
+FROM (
+    SELECT party,
+           SUM(CASE status WHEN 'initiated' THEN 1 WHEN 'accepted' THEN 0 ELSE -1 END) AS active_count,
+           SUM(CASE status WHEN 'completed' THEN 1 ELSE 0 END) AS completed_count,
+           SUM(CASE status WHEN 'cancelled' THEN 1 ELSE 0 END) AS cancelled_count,
+           SUM(CASE status WHEN 'rejected' THEN 1 ELSE 0 END) AS rejected_count,
+           MAX(id) AS last_event_id
+    FROM (SELECT user_id AS party, id, status FROM "transaction"
+          UNION ALL
+          SELECT counterparty_id AS party, id, status FROM "transaction" WHERE counterparty_id IS NOT NULL) AS events
+    GROUP BY party
+) AS totals
+JOIN "transaction" AS latest ON latest.id = totals.last_event_id
+"""
+
+
+def _exchange_request_fk_name():
+    if op.get_bind().dialect.name == 'sqlite':
+        return 'fk_transaction_exchange_request_id_exchange_request'
+    return 'transaction_exchange_request_id_fkey'
+
+
+def upgrade():
+    with op.batch_alter_table('transaction', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(_exchange_request_fk_name(), type_='foreignkey')
+        batch_op.add_column(sa.Column('counterparty_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('book_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_transaction_counterparty_id_user', 'user', ['counterparty_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_transaction_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_transaction_counterparty_id'), ['counterparty_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_transaction_exchange_request_id'), ['exchange_request_id'], unique=False)
+
+    op.create_table('exchange_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('active_count', sa.Integer(), nullable=False),
+    sa.Column('completed_count', sa.Integer(), nullable=False),
+    sa.Column('cancelled_count', sa.Integer(), nullable=False),
+    sa.Column('rejected_count', sa.Integer(), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.Column('last_activity', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('ledger_snapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.Column('summaries', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Log the exchange requests made so far and build their summaries, so
+    # history and stats pages show existing data straight away
+    bind = op.get_bind()
+    logged_upto = bind.execute(sa.text('SELECT COALESCE(MAX(id), 0) FROM "transaction"')).scalar()
+    op.execute(LINK_LOGGED_EVENTS)
+    bind.execute(sa.text(INITIATED_EVENTS), {'logged_upto': logged_upto})
+    bind.execute(sa.text(OUTCOME_EVENTS), {'logged_upto': logged_upto})
+    op.execute(SUMMARIES_FROM_EVENTS)
+
+
+def downgrade():
+    # The backfilled events are kept; they read as plain transactions without the ledger
+    op.drop_table('ledger_snapshot')
+    op.drop_table('exchange_summary')
+    with op.batch_alter_table('transaction', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_transaction_exchange_request_id'))
+        batch_op.drop_index(batch_op.f('ix_transaction_counterparty_id'))
+        batch_op.drop_index(batch_op.f('ix_transaction_user_id'))
+        batch_op.drop_constraint('fk_transaction_counterparty_id_user', type_='foreignkey')
+        batch_op.drop_column('book_id')
+        batch_op.drop_column('counterparty_id')
+        batch_op.create_foreign_key(_exchange_request_fk_name(), 'exchange_request', ['exchange_request_id'], ['id'])
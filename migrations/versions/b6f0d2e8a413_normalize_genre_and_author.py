@@ -0,0 +1,98 @@
+"""Move book genre and author into deduplicated lookup tables
+
+Revision ID: b6f0d2e8a413
+Revises: 5e8a1c3f9b60
+Create Date: 2026-10-19 17:12:38.402116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f0d2e8a413'
+down_revision = '5e8a1c3f9b60'
+branch_labels = None
+depends_on = None
+
+# (lookup table, old book column, new book column, name length)
+LOOKUPS = (
+    ('genre', 'genre', 'genre_id', 50),
+    ('author', 'author', 'author_id', 100),
+)
+
+
+def _canonical(name):
+    return ' '.join((name or '').split()).casefold()
+
+
+def upgrade():
+    for table, _, _, length in LOOKUPS:
+        op.create_table(table,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=length), nullable=False),
+        sa.Column('name', sa.String(length=length), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+        )
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('author_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('genre_id', sa.Integer(), nullable=True))
+
+    # Deduplicate: every spelling of a name with the same case-folded key
+    # maps to one row, displayed as its most common spelling
+    bind = op.get_bind()
+    book = sa.table('book', sa.column('id'), sa.column('genre'), sa.column('author'),
+                    sa.column('genre_id'), sa.column('author_id'))
+    for table, old_column, new_column, _ in LOOKUPS:
+        lookup = sa.table(table, sa.column('id'), sa.column('key'), sa.column('name'))
+        spellings = {}
+        for value, count in bind.execute(
+                sa.select(book.c[old_column], sa.func.count()).group_by(book.c[old_column])):
+            key = _canonical(value)
+            display = ' '.join((value or '').split()) or 'Unknown'
+            spellings.setdefault(key or 'unknown', []).append((count, display))
+        for key, variants in sorted(spellings.items()):
+            # Ties go to mixed case ("Sci-Fi" over "SCI-FI" over "sci-fi")
+            display = max(variants, key=lambda variant: (
+                variant[0], not variant[1].islower(), not variant[1].isupper()))[1]
+            bind.execute(lookup.insert().values(key=key, name=display))
+        ids = {key: row_id for row_id, key in bind.execute(sa.select(lookup.c.id, lookup.c.key))}
+        for (value,) in bind.execute(sa.select(book.c[old_column]).distinct()).all():
+            bind.execute(book.update().where(book.c[old_column] == value)
+                         .values({new_column: ids[_canonical(value) or 'unknown']}))
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.alter_column('author_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('genre_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_book_author_id_author', 'author', ['author_id'], ['id'])
+        batch_op.create_foreign_key('fk_book_genre_id_genre', 'genre', ['genre_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_book_author_id'), ['author_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_genre_id'), ['genre_id'], unique=False)
+        batch_op.drop_column('genre')
+        batch_op.drop_column('author')
+
+
+def downgrade():
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('author', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('genre', sa.String(length=50), nullable=True))
+
+    bind = op.get_bind()
+    for table, old_column, new_column, _ in LOOKUPS:
+        bind.execute(sa.text(
+            f'UPDATE book SET {old_column} = (SELECT name FROM {table} WHERE {table}.id = book.{new_column})'))
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.alter_column('author', existing_type=sa.String(length=100), nullable=False)
+        batch_op.alter_column('genre', existing_type=sa.String(length=50), nullable=False)
+        batch_op.drop_index(batch_op.f('ix_book_genre_id'))
+        batch_op.drop_index(batch_op.f('ix_book_author_id'))
+        batch_op.drop_constraint('fk_book_genre_id_genre', type_='foreignkey')
+        batch_op.drop_constraint('fk_book_author_id_author', type_='foreignkey')
+        batch_op.drop_column('genre_id')
+        batch_op.drop_column('author_id')
+
+    op.drop_table('author')
+    op.drop_table('genre')
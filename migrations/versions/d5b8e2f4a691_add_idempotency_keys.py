@@ -0,0 +1,92 @@
+"""Store idempotency keys and allow one pending request per sender and book
+
+Revision ID: d5b8e2f4a691
+Revises: 9a1d4b7e2c35
+Create Date: 2026-10-19 22:04:15.772139
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b8e2f4a691'
+down_revision = '9a1d4b7e2c35'
+branch_labels = None
+depends_on = None
+
+# Pending requests repeating an older pending one for the same sender and book
+DUPLICATE_PENDING = (
+    "status = 'pending' AND id NOT IN ("
+    "SELECT min_id FROM (SELECT MIN(id) AS min_id FROM exchange_request "
+    "WHERE status = 'pending' GROUP BY sender_id, book_id) AS keep)")
+
+# Each party's exchange summary recomputed from the whole event log, as
+# `flask ledger rebuild` would (events are never updated or deleted)
+SUMMARIES_FROM_EVENTS = """
+INSERT INTO exchange_summary (user_id, active_count, completed_count, cancelled_count,
+                              rejected_count, last_event_id, last_activity)
+SELECT totals.party, totals.active_count, totals.completed_count, totals.cancelled_count,
+       totals.rejected_count, totals.last_event_id, latest.timestamp
+FROM (
+    SELECT party,
+           SUM(CASE status WHEN 'initiated' THEN 1 WHEN 'accepted' THEN 0 ELSE -1 END) AS active_count,
+           SUM(CASE status WHEN 'completed' THEN 1 ELSE 0 END) AS completed_count,
+           SUM(CASE status WHEN 'cancelled' THEN 1 ELSE 0 END) AS cancelled_count,
+           SUM(CASE status WHEN 'rejected' THEN 1 ELSE 0 END) AS rejected_count,
+           MAX(id) AS last_event_id
+    FROM (SELECT user_id AS party, id, status FROM "transaction"
+          UNION ALL
+          SELECT counterparty_id AS party, id, status FROM "transaction" WHERE counterparty_id IS NOT NULL) AS events
+    WHERE party IN :parties
+    GROUP BY party
+) AS totals
+JOIN "transaction" AS latest ON latest.id = totals.last_event_id
+"""
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('scope', sa.String(length=50), nullable=False),
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('location', sa.String(length=500), nullable=True),
+    sa.Column('flashes', sa.JSON(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('scope', 'key', name='uq_idempotency_key_scope_key')
+    )
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_key_expires_at'), ['expires_at'], unique=False)
+
+    # Duplicate pending requests keep the oldest one; the repeats are
+    # rejected through the ledger, so both parties' summaries stay right,
+    # and logged for /api/v1/sync
+    bind = op.get_bind()
+    parties = {user_id for row in bind.execute(sa.text(
+        f"SELECT sender_id, receiver_id FROM exchange_request WHERE {DUPLICATE_PENDING}")) for user_id in row}
+    if parties:
+        op.execute(
+            'INSERT INTO "transaction" (user_id, counterparty_id, exchange_request_id, book_id, status, timestamp) '
+            "SELECT receiver_id, sender_id, id, book_id, 'rejected', CURRENT_TIMESTAMP FROM exchange_request "
+            f"WHERE {DUPLICATE_PENDING} ORDER BY id")
+        op.execute("INSERT INTO change_log (entity, entity_id, op, party_id, counterparty_id, changed_at) "
+                   "SELECT 'exchange_request', id, 'update', sender_id, receiver_id, CURRENT_TIMESTAMP "
+                   f"FROM exchange_request WHERE {DUPLICATE_PENDING} ORDER BY id")
+        op.execute(f"UPDATE exchange_request SET status = 'rejected' WHERE {DUPLICATE_PENDING}")
+        bound = {'parties': sorted(parties)}
+        bind.execute(sa.text("DELETE FROM exchange_summary WHERE user_id IN :parties")
+                     .bindparams(sa.bindparam('parties', expanding=True)), bound)
+        bind.execute(sa.text(SUMMARIES_FROM_EVENTS).bindparams(sa.bindparam('parties', expanding=True)), bound)
+    op.create_index('uq_exchange_request_pending', 'exchange_request', ['sender_id', 'book_id'], unique=True,
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    op.drop_index('uq_exchange_request_pending', table_name='exchange_request')
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_key_expires_at'))
+
+    op.drop_table('idempotency_key')
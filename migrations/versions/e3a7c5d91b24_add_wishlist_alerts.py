@@ -0,0 +1,67 @@
+"""Add the wishlist index and alert queue
+
+Revision ID: e3a7c5d91b24
+Revises: b6f0d2e8a413
+Create Date: 2026-10-19 18:42:17.208311
+
+Run `flask wishlist reindex` after upgrading to index existing profiles.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c5d91b24'
+down_revision = 'b6f0d2e8a413'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('wish',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('profile_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(length=200), nullable=False),
+    sa.Column('term_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['profile_id'], ['profile.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('wish', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_wish_profile_id'), ['profile_id'], unique=False)
+
+    op.create_table('wish_term',
+    sa.Column('term', sa.String(length=50), nullable=False),
+    sa.Column('wish_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['wish_id'], ['wish.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('term', 'wish_id')
+    )
+    op.create_table('wishlist_alert',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('wish', sa.String(length=200), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('notified_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('wishlist_alert', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_wishlist_alert_notified_at'), ['notified_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_wishlist_alert_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('wishlist_alert', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_wishlist_alert_user_id'))
+        batch_op.drop_index(batch_op.f('ix_wishlist_alert_notified_at'))
+
+    op.drop_table('wishlist_alert')
+    op.drop_table('wish_term')
+    with op.batch_alter_table('wish', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_wish_profile_id'))
+
+    op.drop_table('wish')
@@ -0,0 +1,42 @@
+"""Queue user imports uploaded on the import page
+
+Revision ID: f2c9a7d3e815
+Revises: d5b8e2f4a691
+Create Date: 2026-10-19 23:41:08.530412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c9a7d3e815'
+down_revision = 'd5b8e2f4a691'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_import',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('requested_by', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('csv', sa.Text(), nullable=True),
+    sa.Column('report', sa.JSON(), nullable=True),
+    sa.Column('error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['requested_by'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('user_import', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_import_requested_by'), ['requested_by'], unique=False)
+        batch_op.create_index(batch_op.f('ix_user_import_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_import', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_import_status'))
+        batch_op.drop_index(batch_op.f('ix_user_import_requested_by'))
+
+    op.drop_table('user_import')
@@ -1,9 +1,7 @@
 # run.py
 from app import create_app
-from dotenv import load_dotenv
-import os
 
-load_dotenv()
+# create_app() loads .env itself
 app = create_app()
 
 if __name__ == '__main__':
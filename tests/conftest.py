@@ -0,0 +1,60 @@
+# tests/conftest.py
+import os
+
+os.environ['DATABASE_URL'] = 'sqlite://'  # Before config.Config reads it
+
+import pytest
+
+from app import create_app, db
+from app.models import Book, Profile, User
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    # Every test client logs in from the same address; keep the login rate limit out of the way
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, ROUTE_LIMITS={})
+    with app.app_context():
+        db.create_all()
+    # No context stays pushed: each request must get (and remove) its own session
+    return app
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user (with a profile) whose password is ``pw``."""
+    def make(username):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com')
+            user.set_password('pw')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Profile(user_id=user.id))
+            db.session.commit()
+            db.session.refresh(user)
+            return user
+    return make
+
+
+@pytest.fixture
+def make_book(app):
+    def make(owner, title, **fields):
+        fields = {'author': 'Author', 'genre': 'Fiction', 'condition': 'Good',
+                  'availability_status': 'available', 'location': 'Paris', **fields}
+        with app.app_context():
+            book = Book(title=title, user_id=owner.id, **fields)
+            db.session.add(book)
+            db.session.commit()
+            db.session.refresh(book)
+            return book
+    return make
+
+
+@pytest.fixture
+def login(app):
+    """A test client logged in as ``user``."""
+    def log_in(user):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': user.email, 'password': 'pw'})
+        return client
+    return log_in
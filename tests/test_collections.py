@@ -0,0 +1,25 @@
+# tests/test_collections.py
+from app import db
+from app.benchmarks import _load_all, _load_page, _measure, _seed
+from app.models import User
+
+
+def test_heavy_user_page_and_counts_stay_bounded(app, make_user):
+    user = make_user('heavy')
+    rows, per_page = 300, 20
+    with app.app_context():
+        try:
+            _seed(db.session.get(User, user.id), rows)
+            objects, _, _ = _measure(user.id, _load_page, per_page)
+            # The user plus one page per collection, however many rows there are
+            assert objects <= 1 + per_page * len(User.COLLECTION_ORDER)
+            assert _measure(user.id, _load_all)[0] > 3 * rows
+
+            heavy = db.session.get(User, user.id)
+            counts = heavy.counts()
+            assert counts['books'] == rows
+            assert counts['messages_sent'] == counts['messages_received'] == rows
+            assert counts['received_exchange_requests'] == rows
+            assert list(db.session.identity_map.values()) == [heavy]
+        finally:
+            db.session.rollback()
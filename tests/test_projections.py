@@ -0,0 +1,66 @@
+# tests/test_projections.py
+import itertools
+
+import pytest
+
+from app import db
+from app.benchmarks import _orm_lists, _profile, _projected_lists, _seed
+from app.models import ExchangeRequest, Message, User
+
+_pairs = itertools.count()
+
+
+@pytest.fixture
+def lender_and_reader(app, make_user, make_book):
+    n = next(_pairs)
+    lender, reader = make_user(f'lender{n}'), make_user(f'reader{n}')
+    book = make_book(lender, 'The Dispossessed', author='Ursula K. Le Guin', genre='Science Fiction',
+                     condition='Worn', location='Lyon')
+    with app.app_context():
+        db.session.add_all([
+            Message(sender_id=reader.id, receiver_id=lender.id, content='Is it still available?'),
+            Message(sender_id=lender.id, receiver_id=reader.id, content='Yes, come by on Sunday.'),
+            ExchangeRequest(sender_id=reader.id, receiver_id=lender.id, book_id=book.id,
+                            delivery_method='Pickup', exchange_duration='2 weeks', status='pending'),
+        ])
+        db.session.commit()
+        request_id = db.session.scalar(db.select(ExchangeRequest.id).filter_by(book_id=book.id))
+    return lender, reader, request_id
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('/books/', ['The Dispossessed', 'Ursula K. Le Guin', 'Science Fiction', 'Worn', 'Lyon']),
+    ('/messages/inbox', ['reader', 'Is it still available?']),
+    ('/messages/sent', ['reader', 'Yes, come by on Sunday.']),
+    ('/exchanges/view', ['The Dispossessed', 'reader', 'Pickup', '2 weeks', 'Pending',
+                         'name="submit_accept" value="{request_id}"']),
+    ('/transactions/', ['The Dispossessed', 'reader', 'Pickup', '2 weeks', 'Pending',
+                        '/exchanges/respond/{request_id}']),
+])
+def test_list_views_render_projected_fields(login, lender_and_reader, path, expected):
+    lender, _, request_id = lender_and_reader
+    response = login(lender).get(path)
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    for text in expected:
+        assert text.format(request_id=request_id) in body
+
+
+def test_sent_requests_show_the_receiver(login, lender_and_reader):
+    _, reader, _ = lender_and_reader
+    body = login(reader).get('/exchanges/view').get_data(as_text=True)
+    assert 'The Dispossessed' in body and 'lender' in body
+
+
+def test_projections_allocate_less_than_orm_instances(app, make_user):
+    user = make_user('prolific')
+    with app.app_context():
+        try:
+            _seed(db.session.get(User, user.id), 300)
+            _, orm_peak, orm_blocks, orm_rows = _profile(_orm_lists, user.id, 300, 1)
+            _, peak, blocks, rows = _profile(_projected_lists, user.id, 300, 1)
+        finally:
+            db.session.rollback()
+    assert rows == orm_rows == 4 * 300
+    assert peak < orm_peak
+    assert blocks < orm_blocks
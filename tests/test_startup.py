@@ -0,0 +1,15 @@
+# tests/test_startup.py
+from app.startup import check_budgets, profile_imports
+
+
+def test_boot_stays_within_import_budgets(app):
+    with app.app_context():
+        boot_ms, modules = profile_imports()
+    assert check_budgets(modules, app.config['STARTUP_IMPORT_BUDGETS_MS']) == []
+    assert boot_ms < app.config['STARTUP_IMPORT_BUDGETS_MS']['app']
+
+
+def test_routes_load_on_first_request(app):
+    client = app.test_client()
+    assert client.get('/auth/login').status_code == 200
+    assert 'books' in app.blueprints
@@ -0,0 +1,24 @@
+# tests/test_streaming.py
+import pytest
+
+
+@pytest.fixture
+def streaming(app):
+    app.config['STREAM_TEMPLATES'] = True
+    yield
+    app.config['STREAM_TEMPLATES'] = False
+
+
+def test_streamed_search_with_results_renders_to_the_end(streaming, make_user, make_book, login):
+    owner = make_user('stream_owner')
+    searcher = make_user('stream_searcher')
+    make_book(owner, 'The Hobbit')
+    client = login(searcher)
+
+    response = client.get('/books/search?search_query=hob&genre=&availability_status=&location=')
+
+    assert response.is_streamed
+    body = response.get_data(as_text=True)  # Renders the whole stream
+    assert 'The Hobbit' in body
+    assert f'/messages/send/{owner.id}' in body
+    assert body.rstrip().endswith('</html>')